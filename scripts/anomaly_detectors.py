@@ -0,0 +1,199 @@
+import argparse
+import math
+from collections import deque, namedtuple
+
+
+AnomalyEvent = namedtuple('AnomalyEvent', ['timestamp', 'stream', 'detector', 'message'])
+
+
+class Cusum:
+    '''
+    One-sided (downward) CUSUM against a slowly tracking baseline, eg. a vbat
+    sag under load. The baseline is an EWMA with time constant tau (s), the
+    sum grows by (baseline - x - slack) per second and alarms above threshold
+    (units*s). The first warmup seconds only initialize the baseline.
+    '''
+
+    name = 'cusum'
+
+    def __init__(self, slack=0.05, threshold=0.5, tau=5.0, warmup=2.0):
+        self.slack, self.threshold, self.tau, self.warmup = slack, threshold, tau, warmup
+        self.reset()
+
+    def reset(self, reference=None):
+        self.baseline = reference
+        self.sum = 0.0
+        self.start = self.last = None
+
+    def update(self, timestamp, x):
+        if self.baseline is None:
+            self.baseline, self.start, self.last = x, timestamp, timestamp
+            return False
+        dt = (timestamp - self.last) / 1000
+        self.last = timestamp
+        if timestamp - self.start >= self.warmup * 1000:
+            self.sum = max(0.0, self.sum + (self.baseline - x - self.slack) * dt)
+        self.baseline += (1 - math.exp(-dt / self.tau)) * (x - self.baseline)
+        return self.sum > self.threshold
+
+    def describe(self):
+        return 'dropped below its {:.3f} baseline (cusum {:.2f})'.format(self.baseline, self.sum)
+
+
+class StuckSensor:
+    '''
+    Alarms when a sensor repeats the same value (or reads dropout, eg. 0)
+    for more than max_repeats samples in a row. Readings at or above
+    saturated are out of range (cflib's Multiranger takes >= 8000 mm as no
+    reading, eg. in open space), so they never count as stuck
+    '''
+
+    name = 'stuck'
+
+    def __init__(self, max_repeats=100, dropout=0.0, saturated=8000):
+        self.max_repeats, self.dropout, self.saturated = max_repeats, dropout, saturated
+        self.reset()
+
+    def reset(self, reference=None):
+        self.value = None
+        self.repeats = 0
+
+    def update(self, timestamp, x):
+        if self.saturated is not None and x >= self.saturated:
+            self.repeats = 0
+        elif x == self.value or x == self.dropout:
+            self.repeats += 1
+        else:
+            self.repeats = 0
+        self.value = x
+        return self.repeats >= self.max_repeats
+
+    def describe(self):
+        return '{} for {} samples'.format('dropped out' if self.value == self.dropout else 'stuck at {}'.format(self.value), self.repeats)
+
+
+class EwmaDrift:
+    '''
+    Alarms when the EWMA (time constant tau, s) of a signal drifts more than
+    threshold away from a reference, eg. z during a flatness check
+    '''
+
+    name = 'ewma-drift'
+
+    def __init__(self, reference=0.0, threshold=0.05, tau=1.0):
+        self.threshold, self.tau = threshold, tau
+        self.reset(reference)
+
+    def reset(self, reference=None):
+        if reference is not None:
+            self.reference = reference
+        self.ewma = self.last = None
+
+    def update(self, timestamp, x):
+        if self.ewma is None:
+            self.ewma, self.last = x, timestamp
+        else:
+            dt = (timestamp - self.last) / 1000
+            self.last = timestamp
+            self.ewma += (1 - math.exp(-dt / self.tau)) * (x - self.ewma)
+        return abs(self.ewma - self.reference) > self.threshold
+
+    def describe(self):
+        return 'drifted to {:.3f} (reference {:.3f})'.format(self.ewma, self.reference)
+
+
+class AnomalyMonitor:
+    '''
+    Streaming detectors attached to named log streams, O(1) per sample.
+
+    feed() is called from the logging callbacks with every sample. When a
+    detector goes into alarm an AnomalyEvent is appended to events (read by
+    the control loop) and passed to on_event right away, from the callback
+    thread, so the controller can react before the next sample. A detector
+    raises one event per alarm; it is re-armed once its condition clears or
+    with reset().
+    '''
+
+    def __init__(self, on_event=None, max_events=100):
+        self.detectors = {}
+        self.alarmed = set()
+        self.events = deque(maxlen=max_events)
+        self.on_event = on_event
+
+    def add(self, stream, detector):
+        self.detectors.setdefault(stream, []).append(detector)
+        return detector
+
+    def reset(self, stream, reference=None):
+        for detector in self.detectors.get(stream, []):
+            detector.reset(reference)
+            self.alarmed.discard((stream, detector))
+
+    def feed(self, stream, timestamp, x):
+        for detector in self.detectors.get(stream, ()):
+            if detector.update(timestamp, x):
+                if (stream, detector) not in self.alarmed:
+                    self.alarmed.add((stream, detector))
+                    event = AnomalyEvent(timestamp, stream, detector.name, '{} {}'.format(stream, detector.describe()))
+                    self.events.append(event)
+                    if self.on_event is not None:
+                        self.on_event(event)
+            else:
+                self.alarmed.discard((stream, detector))
+
+    def pop_events(self):
+        '''
+        Events raised since the last call
+        '''
+        events = []
+        while self.events:
+            events.append(self.events.popleft())
+        return events
+
+
+def default_monitor(takeoff_height, on_event=None):
+    '''
+    The detectors used by the controller: CUSUM on vbat, stuck / dropout on
+    each multiranger direction (1 s at 100 Hz, the sensor repeats a value for
+    up to 20 samples in the recorded flights; out of range readings are not
+    stuck) and EWMA drift of z from the
+    takeoff height (fed only while checking flatness)
+    '''
+    monitor = AnomalyMonitor(on_event)
+    monitor.add('vbat', Cusum())
+    for direction in ['left', 'front', 'right', 'back']:
+        monitor.add('range.' + direction, StuckSensor())
+    monitor.add('z', EwmaDrift(reference=takeoff_height))
+    return monitor
+
+
+if __name__ == '__main__':
+    import numpy as np
+    parser = argparse.ArgumentParser(description='Replay recorded logs through the streaming anomaly detectors')
+    parser.add_argument('-d', '--datadir', type=str, default='../data/flatness-check/', help='Directory with pos.csv and range.csv')
+    parser.add_argument('-v', '--vbat', type=str, nargs='*', default=['../data/discharging/vbat_h_n-1.csv', '../data/discharging/vbat_h_n-2.csv'], help='vbat logs to replay')
+    parser.add_argument('--takeoff_height', type=float, default=0.3, help='Reference height for the z drift (m)')
+    args = parser.parse_args()
+
+    def replay(monitor, name, columns):
+        for row in zip(*columns):
+            monitor.feed(name, row[0], row[1])
+        for event in monitor.pop_events():
+            print('  t={} {}'.format(event.timestamp, event.message))
+
+    for fname in args.vbat:
+        print(fname)
+        monitor = default_monitor(args.takeoff_height)
+        vbat = np.loadtxt(fname, delimiter=',')
+        replay(monitor, 'vbat', [vbat[:,0].tolist(), vbat[:,1].tolist()])
+    print(args.datadir)
+    monitor = default_monitor(args.takeoff_height)
+    ranges = np.loadtxt(args.datadir + 'range.csv', delimiter=',')
+    for i, direction in enumerate(['left', 'front', 'right', 'back']):
+        replay(monitor, 'range.' + direction, [ranges[:,0].tolist(), ranges[:,i + 1].tolist()])
+    pos = np.genfromtxt(args.datadir + 'pos.csv', delimiter=',', dtype=None, encoding=None)
+    checking = pos['f4'].astype(str) == 'True'
+    edges = np.flatnonzero(np.diff(checking.astype(int))) + 1
+    for start, end in zip(edges[::2], edges[1::2]):
+        monitor.reset('z')
+        replay(monitor, 'z', [pos['f0'][start:end].tolist(), pos['f3'][start:end].tolist()])
@@ -0,0 +1,141 @@
+import argparse
+import glob
+import os
+import time
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd  # to write csv, more convenient than csv module
+from telemetry_archive import streams, read_csv_log, load
+from energy import hover_power, relative_power, block_distance
+from interval_index import IntervalIndex
+
+
+# thresholds as in controller.py
+light_thresh = 1000         # lux
+dist_thresh = 220           # mm
+min_check_samples = 10      # flatness checks shorter than this are ignored
+
+
+def find_flights(sources):
+    '''
+    Flights under the given paths or globs: directories with a pos.csv (plus
+    whichever of the other logs are there), standalone pos_<name>.csv logs
+    (eg. data/flatness-check/pos_grass.csv) and telemetry archives (.cfta).
+    Directories are searched recursively
+    '''
+    flights = []
+    for source in sources:
+        for path in sorted(glob.glob(source, recursive=True)) or [source]:
+            if os.path.isdir(path):
+                for root, _, fnames in os.walk(path):
+                    flights += [os.path.join(root, fname) for fname in sorted(fnames)
+                                if fname.endswith('.cfta') or fname.startswith('pos_') and fname.endswith('.csv')]
+                    if 'pos.csv' in fnames:
+                        flights.append(root)
+            elif os.path.isfile(path):
+                flights.append(path)
+    return list(dict.fromkeys(os.path.normpath(flight) for flight in flights))
+
+
+def load_flight(flight):
+    '''
+    Logs of a flight in the layout of telemetry_archive.load(): {stream: {'t': ..., column: ...}}
+    '''
+    if flight.endswith('.cfta'):
+        return load(flight, names=list(streams))
+    if os.path.isfile(flight):
+        files = {'pos': flight}
+    else:
+        files = {name: os.path.join(flight, name + '.csv') for name in streams}
+    data = {}
+    for name, filename in files.items():
+        if not os.path.isfile(filename):
+            continue
+        table = read_csv_log(filename, streams[name])
+        data[name] = {'t': table[0]}
+        for (column, precision), values in zip(streams[name], table[1:]):
+            data[name][column] = values.astype(bool) if precision is None else values * precision
+    return data
+
+
+def analyze(flight, light_thresh=light_thresh, dist_thresh=dist_thresh):
+    '''
+    Standard metrics of one flight: flight time, distance, flatness (z std of
+    the whole flight and of every flatness check), light, obstacle events,
+    battery and the energy estimated from thrust. Metrics of missing logs are NaN
+    '''
+    start = time.perf_counter()
+    metrics = {'flight': flight, 'error': None}
+    try:
+        data = load_flight(flight)
+        index = IntervalIndex.build(data, light_thresh=light_thresh, dist_thresh=dist_thresh)
+        pos = data['pos']
+        metrics['samples'] = len(pos['t'])
+        metrics['flight time (s)'] = (pos['t'][-1] - pos['t'][0]) / 1000
+        # as energy.py: between block means of x/y, over the span of the thrust log if there is one
+        pos_t, pos_x, pos_y, start = pos['t'], pos['x'], pos['y'], None
+        if 'thrust' in data and len(data['thrust']['t']):
+            start = data['thrust']['t'][0]
+            inside = (pos_t >= start) & (pos_t <= data['thrust']['t'][-1])
+            pos_t, pos_x, pos_y = pos_t[inside], pos_x[inside], pos_y[inside]
+        metrics['distance (m)'] = float(block_distance(pos_t, pos_x, pos_y, start=start)[0].sum())
+        metrics['z std (mm)'] = 1000 * float(np.std(pos['z']))
+        samples, _, stds = index.stats('pos.z', 'flatness-check')
+        stds = stds[samples >= min_check_samples]
+        metrics['flatness checks'] = len(stds)
+        metrics['best flatness (mm)'] = 1000 * float(stds.min()) if len(stds) else np.nan
+        metrics['last flatness (mm)'] = 1000 * float(stds[-1]) if len(stds) else np.nan
+        if 'intensity' in data and len(data['intensity']['t']):
+            intensity = data['intensity']['intensity']
+            metrics['mean intensity (lux)'] = float(np.mean(intensity))
+            metrics['max intensity (lux)'] = float(np.max(intensity))
+            metrics['lit fraction'] = float(np.mean(intensity > light_thresh))
+        if 'range' in data and len(data['range']['t']):
+            closest = np.min([data['range'][d] for d in ['left', 'front', 'right', 'back']], axis=0)
+            metrics['obstacle events'] = len(index.spans['obstacle'][0])
+            metrics['min range (mm)'] = float(np.min(closest))
+        if 'vbat' in data and len(data['vbat']['t']):
+            metrics['vbat start (V)'] = float(data['vbat']['vbat'][0])
+            metrics['vbat end (V)'] = float(data['vbat']['vbat'][-1])
+        if 'thrust' in data and len(data['thrust']['t']) > 1:
+            t, thrust = data['thrust']['t'], data['thrust']['thrust']
+            power = hover_power * relative_power(thrust, np.median(thrust))
+            metrics['energy (Wh)'] = float(np.sum((power[1:] + power[:-1]) / 2 * np.diff(t) / 1000) / 3600)
+    except Exception as error:
+        # one unreadable flight shouldn't stop a batch of hundreds
+        metrics['error'] = '{}: {}'.format(type(error).__name__, error)
+    metrics['analysis time (s)'] = time.perf_counter() - start
+    return metrics
+
+
+def run(job):
+    flight, light_thresh, dist_thresh = job
+    return analyze(flight, light_thresh, dist_thresh)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Standard metrics of many flights at once, on a worker pool')
+    parser.add_argument('sources', type=str, nargs='*', default=['../data/'], help='Flight directories, logs, archives or globs (eg. "field/**/*.cfta"); directories are searched recursively')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='Worker processes')
+    parser.add_argument('--light_thresh', type=float, default=light_thresh, help='Intensity counted as lit (lux)')
+    parser.add_argument('--dist_thresh', type=float, default=dist_thresh, help='Range counted as an obstacle (mm)')
+    parser.add_argument('-o', '--output', type=str, default='../flight-summary.csv', help='Summary table')
+    args = parser.parse_args()
+
+    flights = find_flights(args.sources)
+    if not flights:
+        parser.error('No flights found in {}'.format(' '.join(args.sources)))
+    print('{} flights on {} processes'.format(len(flights), args.jobs))
+    start = time.perf_counter()
+    jobs = [(flight, args.light_thresh, args.dist_thresh) for flight in flights]
+    with Pool(args.jobs) as pool:
+        summary = pd.DataFrame(pool.imap_unordered(run, jobs))
+    print('Analyzed in {:.1f} s'.format(time.perf_counter() - start))
+    summary = summary.sort_values('flight').reset_index(drop=True)
+    summary.to_csv(args.output, index=False)
+    with pd.option_context('display.max_rows', 50, 'display.max_columns', None, 'display.width', 250):
+        print(summary.drop(columns=['analysis time (s)']).to_string(index=False, float_format='{:.3g}'.format))
+    failed = summary['error'].notna().sum()
+    if failed:
+        print('{} flights could not be analyzed'.format(failed))
+    print('Saved {}'.format(args.output))
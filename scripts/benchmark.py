@@ -0,0 +1,228 @@
+import argparse
+import csv
+import datetime
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd  # to read csv, more convenient than csv module
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from downsampling import downsampled_scatter
+from rolling_stats import rolling_mean_std
+
+
+datadir = '../data/flatness-check/'
+# alignment with the per-sample argmin loop of flatness-check.py is O(N*M), skip it above this many operations
+max_argmin_work = 2e9
+
+
+def git_commit():
+    '''
+    Current commit (with a + if the tree has local changes), so results can be compared across commits
+    '''
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD'], stderr=subprocess.DEVNULL) != 0
+        return commit + ('+' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def scale_log(time_arr, columns, scale):
+    '''
+    Repeat a log scale times, shifting the timestamps so that they keep increasing
+    '''
+    period = int(np.median(np.diff(time_arr)))
+    span = time_arr[-1] - time_arr[0] + period
+    scaled_time = (time_arr[None, :] + span * np.arange(scale)[:, None]).ravel()
+    return scaled_time, [np.tile(c, scale) for c in columns]
+
+
+def load_recorded(scale):
+    '''
+    The flatness-check flight (pos, intensity, range) scaled to scale times its length
+    '''
+    pos = np.genfromtxt(datadir + 'pos.csv', delimiter=',', dtype=None, encoding=None)
+    intensity = np.loadtxt(datadir + 'intensity.csv', delimiter=',')
+    ranges = np.loadtxt(datadir + 'range.csv', delimiter=',')
+    time_pos, (x, y, z, flags) = scale_log(pos['f0'], [pos['f1'], pos['f2'], pos['f3'], pos['f4'].astype(str) == 'True'], scale)
+    time_i, (lux,) = scale_log(intensity[:,0].astype(np.int64), [intensity[:,1]], scale)
+    time_r, (left, front, right, back) = scale_log(ranges[:,0].astype(np.int64), [ranges[:,i] for i in range(1, 5)], scale)
+    return {'time_pos': time_pos, 'x': x, 'y': y, 'z': z, 'checking_flatness': flags,
+            'time_i': time_i, 'intensity': lux, 'time_r': time_r, 'range': (left, front, right, back)}
+
+
+def timed(func, repeat):
+    '''
+    Best wall time (s) of repeat runs of func
+    '''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+#######################################
+# Benchmarks: each returns a list of (name, seconds)
+#######################################
+def bench_csv_parsing(data, tmpdir, repeat):
+    posfile = os.path.join(tmpdir, 'pos.csv')
+    with open(posfile, 'w') as filehandler:
+        for row in zip(data['time_pos'], data['x'], data['y'], data['z'], data['checking_flatness']):
+            filehandler.write("{},{},{},{},{}\n".format(*row))
+
+    def parse_csv_module():
+        # as in flatness-check.py
+        with open(posfile) as filehandle:
+            time_pos, x, y, z, checking_flatness = [], [], [], [], []
+            for line in csv.reader(filehandle):
+                time_pos.append(int(line[0]))
+                x.append(float(line[1]))
+                y.append(float(line[2]))
+                z.append(float(line[3]))
+                checking_flatness.append(line[-1] == "True")
+
+    def parse_pandas():
+        pd.read_csv(posfile, header=None)
+
+    return [('csv.reader', timed(parse_csv_module, repeat)), ('pandas.read_csv', timed(parse_pandas, repeat))]
+
+
+def bench_alignment(data, tmpdir, repeat):
+    time_pos, time_i, x = data['time_pos'], data['time_i'], data['x']
+
+    def align_argmin():
+        # as in flatness-check.py
+        x_adj = np.zeros(len(time_i))
+        for i in range(len(time_i)):
+            x_adj[i] = x[np.argmin(np.abs(time_pos-time_i[i]))]
+
+    def align_searchsorted():
+        idx = np.clip(np.searchsorted(time_pos, time_i), 1, len(time_pos) - 1)
+        idx -= (time_i - time_pos[idx - 1]) < (time_pos[idx] - time_i)
+        x[idx]
+
+    results = [('searchsorted', timed(align_searchsorted, repeat))]
+    if len(time_pos) * len(time_i) <= max_argmin_work:
+        results.append(('argmin loop', timed(align_argmin, repeat)))
+    return results
+
+
+def bench_statistics(data, tmpdir, repeat):
+    z, flags = data['z'], data['checking_flatness']
+
+    def std_blocks():
+        # as in flatness-check.py, for every checking_flatness block
+        edges = np.where(np.diff(flags))[0] + 1
+        for block in edges[:len(edges)//2*2].reshape(-1, 2):
+            np.std(z[block[0]:block[1]])
+
+    return [('std', timed(lambda: np.std(z), repeat)), ('std blocks', timed(std_blocks, repeat)),
+            ('rolling std x4 windows', timed(lambda: rolling_mean_std(z, [50, 100, 200, 400]), repeat))]
+
+
+def bench_callbacks(data, tmpdir, repeat):
+    try:
+        import controller
+    except ImportError as e:
+        print('Skipping callback benchmark: {}'.format(e))
+        return []
+    from charging_model import ChargingLookup
+    controller.charging_lookup = ChargingLookup.from_csv('../data/charging-lookup.csv', controller.panel)
+    controller.checking_flatness = False
+    controller.battery.publish(0, 3.7)
+    pos_samples = [{'stateEstimate.x': x, 'stateEstimate.y': y, 'stateEstimate.z': z} for x, y, z in zip(data['x'].tolist(), data['y'].tolist(), data['z'].tolist())]
+    range_samples = [{'range.left': l, 'range.front': f, 'range.right': r, 'range.back': b} for l, f, r, b in zip(*[c.tolist() for c in data['range']])]
+    intensity_samples = [{'BH1750.intensity': i} for i in data['intensity'].tolist()]
+    results = []
+    with open(os.devnull, 'w') as devnull:
+        controller.pos_file_handler = controller.range_file_handler = controller.intensity_file_handler = devnull
+        for name, callback, samples in [('log_pos_callback', controller.log_pos_callback, pos_samples),
+                                        ('log_range_callback', controller.log_range_callback, range_samples),
+                                        ('log_intensity_callback', controller.log_intensity_callback, intensity_samples)]:
+            stdout, sys.stdout = sys.stdout, devnull  # some callbacks print every sample
+            try:
+                seconds = timed(lambda: [callback(t, sample, None) for t, sample in enumerate(samples)], repeat)
+            finally:
+                sys.stdout = stdout
+            results.append((name + ' per sample', seconds / len(samples)))
+    return results
+
+
+def bench_rendering(data, tmpdir, repeat):
+    x, y, z = data['x'], data['y'], data['z']
+
+    def render(downsample, fmt):
+        fig, ax = plt.subplots(figsize=(3.5, 3.5))
+        if downsample:
+            downsampled_scatter(ax, x, y, c=z, dpi=300, s=3, cmap='viridis')
+        else:
+            ax.scatter(x, y, s=3, c=z, cmap='viridis')
+        buf = io.BytesIO()
+        fig.savefig(buf, format=fmt, dpi=300)
+        plt.close(fig)
+        return buf.tell()
+
+    results = []
+    for fmt in ['png', 'pdf']:
+        for downsample in [False, True]:
+            name = '{} scatter{}'.format(fmt, ' (downsampled)' if downsample else '')
+            results.append((name, timed(lambda: render(downsample, fmt), repeat)))
+            results.append((name + ' bytes', render(downsample, fmt)))
+    return results
+
+
+benchmarks = {'csv': bench_csv_parsing, 'alignment': bench_alignment, 'statistics': bench_statistics,
+              'callbacks': bench_callbacks, 'rendering': bench_rendering}
+
+
+def read_results(filename, commit):
+    '''
+    {(benchmark, name, scale): value} of the latest run of a commit in a results file
+    '''
+    results = {}
+    if not os.path.isfile(filename):
+        return results
+    with open(filename) as filehandle:
+        for row in csv.DictReader(filehandle):
+            if row['commit'] == commit:
+                results[(row['benchmark'], row['name'], int(row['scale']))] = float(row['value'])
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the analysis and controller hot paths on recorded data scaled up')
+    parser.add_argument('-s', '--scales', type=int, nargs='+', default=[10, 100, 1000], help='How many times to repeat the recorded flight')
+    parser.add_argument('-b', '--benchmarks', type=str, nargs='+', default=list(benchmarks), choices=list(benchmarks), help='Benchmarks to run')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Runs per measurement (best is kept)')
+    parser.add_argument('-o', '--output', type=str, default='../benchmark-results.csv', help='Results file (appended to)')
+    parser.add_argument('-c', '--compare', type=str, help='Commit to compare the results against')
+    args = parser.parse_args()
+
+    commit = git_commit()
+    date = datetime.datetime.now().isoformat(timespec='seconds')
+    baseline = read_results(args.output, args.compare) if args.compare else {}
+    new_file = not os.path.isfile(args.output)
+    with open(args.output, 'a') as results_file, tempfile.TemporaryDirectory() as tmpdir:
+        writer = csv.writer(results_file)
+        if new_file:
+            writer.writerow(['commit', 'date', 'benchmark', 'name', 'scale', 'samples', 'value'])
+        for scale in args.scales:
+            data = load_recorded(scale)
+            print('Scale {}x ({} position samples)'.format(scale, len(data['time_pos'])))
+            for benchmark in args.benchmarks:
+                for name, value in benchmarks[benchmark](data, tmpdir, args.repeat):
+                    writer.writerow([commit, date, benchmark, name, scale, len(data['time_pos']), value])
+                    results_file.flush()
+                    line = '  {}: {}: {:.6g}'.format(benchmark, name, value)
+                    if (benchmark, name, scale) in baseline:
+                        line += ' ({:.2f}x of {})'.format(value / baseline[(benchmark, name, scale)], args.compare)
+                    print(line)
+    print('Saved {}'.format(args.output))
@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+class CallbackProfiler:
+    '''
+    Lightweight profiling of the logging callbacks.
+
+    wrap() returns a callback that counts invocations and total / max run time,
+    both per callback and per LogConfig. wrap_file() returns a file handler that
+    counts the bytes written from inside a profiled callback. Profiling can be
+    switched on and off at any time with the enabled attribute; when disabled a
+    wrapped callback costs one attribute check. start_dump() periodically writes
+    a json snapshot of the metrics to a local file and/or serves it over HTTP on
+    localhost.
+    '''
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        # name -> [invocations, total time (s), max time (s), bytes written]
+        self.callbacks = {}
+        self.logconfs = {}
+        self.started = time.time()
+        self._current = threading.local()
+        self._dump_thread = None
+        self._server = None
+        self._stop = threading.Event()
+
+    def _entries(self, name, logconf_name):
+        if name not in self.callbacks:
+            self.callbacks[name] = [0, 0.0, 0.0, 0]
+        if logconf_name not in self.logconfs:
+            self.logconfs[logconf_name] = [0, 0.0, 0.0, 0]
+        return self.callbacks[name], self.logconfs[logconf_name]
+
+    def wrap(self, callback, name=None):
+        '''
+        Profiled version of a LogConfig data callback (timestamp, data, logconf)
+        '''
+        if name is None:
+            name = callback.__name__
+        current = self._current
+
+        def profiled_callback(timestamp, data, logconf):
+            if not self.enabled:
+                return callback(timestamp, data, logconf)
+            entries = self._entries(name, getattr(logconf, 'name', str(logconf)))
+            current.entries = entries
+            start = time.perf_counter()
+            try:
+                return callback(timestamp, data, logconf)
+            finally:
+                elapsed = time.perf_counter() - start
+                current.entries = None
+                for entry in entries:
+                    entry[0] += 1
+                    entry[1] += elapsed
+                    if elapsed > entry[2]:
+                        entry[2] = elapsed
+        return profiled_callback
+
+    def wrap_file(self, file_handler):
+        '''
+        File handler whose writes are counted against the callback writing them
+        '''
+        return ProfiledFile(file_handler, self._current)
+
+    def reset(self):
+        self.callbacks = {}
+        self.logconfs = {}
+        self.started = time.time()
+
+    def snapshot(self):
+        '''
+        Metrics as a json-serializable dict
+        '''
+        elapsed = max(time.time() - self.started, 1e-9)
+
+        def summary(entries):
+            return {name: {'invocations': count, 'rate (Hz)': count / elapsed, 'total time (s)': total,
+                           'mean time (us)': 1e6 * total / count if count else 0.0, 'max time (us)': 1e6 * maximum,
+                           'thread share': total / elapsed, 'bytes written': written}
+                    for name, (count, total, maximum, written) in list(entries.items())}
+        return {'time': time.time(), 'enabled': self.enabled, 'elapsed (s)': elapsed,
+                'callbacks': summary(self.callbacks), 'logconfs': summary(self.logconfs)}
+
+    def dump(self, filename):
+        '''
+        Write a snapshot to filename (replaced atomically, so readers never see a partial file)
+        '''
+        with open(filename + '.tmp', 'w') as filehandler:
+            json.dump(self.snapshot(), filehandler, indent=2)
+        os.replace(filename + '.tmp', filename)
+
+    def start_dump(self, interval=5.0, filename=None, port=None):
+        '''
+        Dump a snapshot to filename every interval seconds and/or serve the latest
+        metrics at http://localhost:port/ (GET /enable and /disable switch profiling)
+        '''
+        self._stop.clear()
+        if filename is not None:
+            def dump_loop():
+                while not self._stop.wait(interval):
+                    self.dump(filename)
+                self.dump(filename)
+            self._dump_thread = threading.Thread(target=dump_loop, name='profiler-dump', daemon=True)
+            self._dump_thread.start()
+        if port is not None:
+            profiler = self
+
+            class MetricsHandler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path == '/enable':
+                        profiler.enabled = True
+                    elif self.path == '/disable':
+                        profiler.enabled = False
+                    body = json.dumps(profiler.snapshot(), indent=2).encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass  # keep the console for the controller
+
+            self._server = HTTPServer(('127.0.0.1', port), MetricsHandler)
+            threading.Thread(target=self._server.serve_forever, name='profiler-http', daemon=True).start()
+
+    def stop_dump(self):
+        self._stop.set()
+        if self._dump_thread is not None:
+            self._dump_thread.join()
+            self._dump_thread = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class ProfiledFile:
+    '''
+    Thin wrapper around a file handler counting the bytes written by the
+    profiled callback currently running on this thread
+    '''
+
+    def __init__(self, file_handler, current):
+        self.file_handler = file_handler
+        self._current = current
+
+    def write(self, s):
+        entries = getattr(self._current, 'entries', None)
+        if entries is not None:
+            for entry in entries:
+                entry[3] += len(s)
+        return self.file_handler.write(s)
+
+    def __getattr__(self, name):
+        return getattr(self.file_handler, name)
@@ -0,0 +1,170 @@
+import argparse
+import datetime
+import os
+import re  # regular expressions
+import numpy as np
+import pandas as pd  # to read/write csv, more convenient than csv module
+
+
+catalog_name = 'catalog.csv'
+columns = ['path', 'experiment', 'kind', 'panel', 'thrust', 'hover', 'trial', 'surface', 'variant',
+           'rows', 't_start', 't_end', 'size', 'mtime_ns']
+# charging tables only have a date and time of day, recorded in 2021 (PST) as in charging-curve.py
+charging_year = '2021'
+charging_tz = datetime.timezone(datetime.timedelta(hours=-8))
+
+# file name patterns of the datasets, matched against the path relative to data/
+patterns = [('charging', 'charging', re.compile(r'^charging/(?P<panel>[^/]+)\.csv$')),
+            ('charging', 'charging-inside', re.compile(r'^charging/inside/(?P<panel>[^/]+)\.csv$')),
+            ('discharging', 'vbat', re.compile(r'^discharging/vbat_t-(?P<thrust>\d+)_n-(?P<trial>\d+)\.csv$')),
+            ('discharging', 'vbat', re.compile(r'^discharging/vbat_(?P<hover>h)_n-(?P<trial>\d+)\.csv$')),
+            ('flatness-check', 'pos', re.compile(r'^flatness-check/pos_(?P<surface>[a-z]+)(_(?P<variant>[a-z]+))?\.csv$')),
+            ('charging', 'lookup', re.compile(r'^charging-lookup\.csv$')),
+            (None, None, re.compile(r'^(?:(?P<experiment>[^/]+)/)?(?P<kind>pos|range|intensity|vbat|thrust|phase|events|clock)\.csv$'))]
+
+
+def describe(datadir, path):
+    '''
+    Metadata of one dataset (path relative to datadir), None if it is not one
+    '''
+    for experiment, kind, pattern in patterns:
+        match = pattern.match(path)
+        if match is None:
+            continue
+        groups = match.groupdict()
+        entry = dict.fromkeys(columns)
+        entry.update({'path': path, 'experiment': experiment or groups.get('experiment') or 'flight',
+                      'kind': kind or groups['kind'], 'panel': groups.get('panel'),
+                      'thrust': int(groups['thrust']) if groups.get('thrust') else None,
+                      'hover': groups.get('hover') is not None, 'trial': int(groups['trial']) if groups.get('trial') else None,
+                      'surface': groups.get('surface'), 'variant': groups.get('variant')})
+        entry.update(scan(os.path.join(datadir, path), entry['kind']))
+        return entry
+    return None
+
+
+def scan(filename, kind):
+    '''
+    Row count and time span (ms: crazyflie uptime for the logs, epoch for the charging tables) of a file
+    '''
+    stat = os.stat(filename)
+    info = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'rows': 0, 't_start': None, 't_end': None}
+    if kind in ('charging', 'charging-inside', 'lookup'):
+        data = pd.read_csv(filename)
+        info['rows'] = len(data)
+        # some readings have no time of day
+        stamped = data.iloc[:,:2].dropna() if kind != 'lookup' else data.iloc[:0]
+        if len(stamped):
+            stamps = [datetime.datetime.strptime('{}/{}-{}'.format(charging_year, d, t), '%Y/%m/%d-%H:%M').replace(tzinfo=charging_tz)
+                      for d, t in zip(stamped.iloc[:,0], stamped.iloc[:,1])]
+            info['t_start'], info['t_end'] = int(stamps[0].timestamp() * 1000), int(stamps[-1].timestamp() * 1000)
+        return info
+    with open(filename) as filehandle:
+        lines = [line for line in filehandle if line.strip()]
+    info['rows'] = len(lines)
+    if lines:
+        info['t_start'], info['t_end'] = int(float(lines[0].split(',')[0])), int(float(lines[-1].split(',')[0]))
+    return info
+
+
+def typed(table):
+    '''
+    Catalog columns with their types (nullable, most datasets only have some of the fields)
+    '''
+    return table.astype({'path': 'string', 'experiment': 'string', 'kind': 'string', 'panel': 'string', 'thrust': 'Int64',
+                         'hover': bool, 'trial': 'Int64', 'surface': 'string', 'variant': 'string', 'rows': 'Int64',
+                         't_start': 'Int64', 't_end': 'Int64', 'size': 'Int64', 'mtime_ns': 'Int64'})
+
+
+class Catalog:
+    '''
+    Metadata of every dataset under data/, kept in data/catalog.csv.
+
+    update() rescans the directory tree but only reads the files that are new
+    or changed (size or modification time) since the last update, and drops
+    the ones that disappeared. find() and files() query the catalog, so tools
+    open exactly the files they need instead of matching file names
+    themselves, eg. files(experiment='discharging', hover=True) or
+    files(kind='charging', panel='MPT6-75(4-panels)').
+    '''
+
+    def __init__(self, datadir='../data/', update=True):
+        self.datadir = datadir
+        self.filename = os.path.join(datadir, catalog_name)
+        table = pd.read_csv(self.filename) if os.path.isfile(self.filename) else None
+        if table is not None and list(table.columns) == columns:
+            self.table = typed(table)
+        else:
+            # no catalog yet, or one written with other columns: everything is rescanned
+            self.table = typed(pd.DataFrame(columns=columns))
+        if update:
+            self.update()
+
+    def update(self):
+        '''
+        Bring the catalog up to date, returns the number of (re)scanned files
+        '''
+        # modification times as integer ns, a float mtime doesn't survive the csv round trip exactly
+        known = {row.path: (row.size, row.mtime_ns) for row in self.table.itertuples()}
+        present, entries = set(), []
+        for root, _, fnames in os.walk(self.datadir):
+            for fname in fnames:
+                path = os.path.relpath(os.path.join(root, fname), self.datadir).replace(os.sep, '/')
+                stat = os.stat(os.path.join(root, fname))
+                present.add(path)
+                if known.get(path) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                entry = describe(self.datadir, path)
+                if entry is not None:
+                    entries.append(entry)
+        stale = set(known) - present | {entry['path'] for entry in entries}
+        if not entries and not stale:
+            return 0
+        table = self.table[~self.table['path'].isin(stale)]
+        if entries:
+            table = pd.concat([table, pd.DataFrame(entries, columns=columns)], ignore_index=True) if len(table) else pd.DataFrame(entries, columns=columns)
+        self.table = typed(table.sort_values('path').reset_index(drop=True))
+        self.table.to_csv(self.filename, index=False)
+        return len(entries)
+
+    def find(self, **criteria):
+        '''
+        Catalog rows matching all the criteria (column=value, or column=list of values)
+        '''
+        mask = np.ones(len(self.table), dtype=bool)
+        for column, value in criteria.items():
+            if column not in self.table:
+                raise KeyError('Unknown catalog column {}, expected one of {}'.format(column, columns))
+            if isinstance(value, (list, tuple, set)):
+                mask &= self.table[column].isin(value).to_numpy()
+            elif value is None:
+                mask &= self.table[column].isna().to_numpy()
+            else:
+                mask &= (self.table[column] == value).fillna(False).to_numpy(dtype=bool)
+        return self.table[mask]
+
+    def files(self, **criteria):
+        '''
+        Paths (joined with datadir) of the datasets matching the criteria
+        '''
+        return [os.path.join(self.datadir, path) for path in self.find(**criteria)['path']]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Index (incrementally) and query the datasets under data/')
+    parser.add_argument('-d', '--datadir', type=str, default='../data/', help='Data directory')
+    parser.add_argument('-q', '--query', type=str, nargs='*', default=[], help='Criteria as column=value, eg. experiment=discharging hover=True')
+    args = parser.parse_args()
+
+    catalog = Catalog(args.datadir, update=False)
+    print('Scanned {} new or changed files'.format(catalog.update()))
+    criteria = {}
+    for criterion in args.query:
+        column, value = criterion.split('=', 1)
+        if value in ('True', 'False'):
+            value = value == 'True'
+        elif re.match(r'^-?\d+$', value):
+            value = int(value)
+        criteria[column] = value
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(catalog.find(**criteria).drop(columns=['size', 'mtime_ns']).to_string(index=False))
@@ -0,0 +1,154 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd  # to read csv, more convenient than csv module
+
+
+# Battery used on the drone (see README)
+battery_capacity = 250      # mAh
+vbat_empty = 3.0            # V
+vbat_full = 4.2             # V
+
+# Lookup table settings
+max_lux = 120000            # lux, a bit above the brightest recorded sample
+n_bins = 241                # 500 lux per bin
+
+
+def read_charging_data(datafile):
+    '''
+    Read a charging log and return (lux, Iout in mA, efficiency) for the
+    samples where the charger was actually connected and lux was measured
+    '''
+    data = pd.read_csv(datafile)
+    data = data.astype({'Lux': 'Float64', 'Iin (mA)': 'Float64', 'Vin': 'Float64', 'Iout (mA)': 'Float64', 'Vout': 'Float64', 'Notes': 'string', 'Date': 'string', 'Time': 'string', 'Efficiency': 'float'})
+    # Remove the open circuit readings and the ones without a lux reading (eg. indoor charging)
+    trimmed_data = data.loc[(data.get('Notes') != 'Open circuit') & data.get('Lux').notna()]
+    lux_arr = np.asarray(trimmed_data.get('Lux'), dtype=float)
+    Iout_arr = np.asarray(trimmed_data.get('Iout (mA)'), dtype=float)
+    efficiency_arr = np.asarray(trimmed_data.get('Efficiency'), dtype=float)
+    return lux_arr, Iout_arr, efficiency_arr
+
+
+def fit_charging_model(lux_arr, Iout_arr, efficiency_arr):
+    '''
+    Least squares fits of charging current and efficiency against light intensity.
+    Current is fit as a line through the origin (no light, no current),
+    efficiency as a straight line.
+    Returns (current slope [mA/lux], efficiency polynomial coefficients)
+    '''
+    current_slope = np.sum(lux_arr * Iout_arr) / np.sum(lux_arr**2)
+    efficiency_coeffs = np.polyfit(lux_arr, efficiency_arr, 1)
+    return current_slope, efficiency_coeffs
+
+
+def build_lookup_table(datadir, max_lux=max_lux, n_bins=n_bins):
+    '''
+    Fit the charging model for every panel configuration in datadir and
+    evaluate it on a uniform lux grid.
+    Returns (lux grid, {panel: (Iout grid, efficiency grid)})
+    '''
+    lux_grid = np.linspace(0, max_lux, n_bins)
+    tables = {}
+    for datafile in sorted(os.listdir(datadir)):
+        if not (os.path.isfile(os.path.join(datadir, datafile)) and datafile.endswith('.csv')):
+            continue
+        panel = datafile[:-len('.csv')]
+        lux_arr, Iout_arr, efficiency_arr = read_charging_data(os.path.join(datadir, datafile))
+        if len(lux_arr) < 2:
+            continue
+        current_slope, efficiency_coeffs = fit_charging_model(lux_arr, Iout_arr, efficiency_arr)
+        print('{}: Iout = {:.4e} mA/lux * lux, efficiency = {:.4e} * lux + {:.4f}'.format(panel, current_slope, efficiency_coeffs[0], efficiency_coeffs[1]))
+        tables[panel] = (current_slope * lux_grid, np.clip(np.polyval(efficiency_coeffs, lux_grid), 0, 1))
+    return lux_grid, tables
+
+
+def save_lookup_table(filename, lux_grid, tables):
+    '''
+    Write the lookup table as csv: one row per lux bin, an Iout and an
+    Efficiency column per panel configuration
+    '''
+    header = ['Lux']
+    columns = [lux_grid]
+    for panel, (Iout_grid, efficiency_grid) in tables.items():
+        header.extend([panel + ' Iout (mA)', panel + ' Efficiency'])
+        columns.extend([Iout_grid, efficiency_grid])
+    np.savetxt(filename, np.column_stack(columns), fmt='%.4f', delimiter=',', header=','.join(header), comments='')
+
+
+def charge_needed_from_vbat(vbat):
+    '''
+    Rough charge (mAh) needed to fill the battery, assuming charge is linear in vbat
+    '''
+    soc = min(max((vbat - vbat_empty) / (vbat_full - vbat_empty), 0.0), 1.0)
+    return (1.0 - soc) * battery_capacity
+
+
+class ChargingLookup:
+    '''
+    Constant time lookup of charging current, efficiency and time to recharge
+    for a light intensity reading (eg. BH1750.intensity). Plain python lists
+    are used so that a lookup is a couple of list indexings, no numpy overhead.
+    '''
+    __slots__ = ('panel', 'lux_step', 'inv_lux_step', 'last_bin', 'Iout', 'efficiency')
+
+    def __init__(self, lux_grid, Iout_grid, efficiency_grid, panel=None):
+        self.panel = panel
+        self.lux_step = float(lux_grid[1] - lux_grid[0])
+        self.inv_lux_step = 1.0 / self.lux_step
+        self.last_bin = len(lux_grid) - 1
+        self.Iout = [float(i) for i in Iout_grid]
+        self.efficiency = [float(e) for e in efficiency_grid]
+
+    @classmethod
+    def from_csv(cls, filename, panel):
+        '''
+        Load the columns for one panel configuration from a table written by save_lookup_table
+        '''
+        data = pd.read_csv(filename)
+        return cls(np.asarray(data.get('Lux')), np.asarray(data.get(panel + ' Iout (mA)')), np.asarray(data.get(panel + ' Efficiency')), panel=panel)
+
+    def _interpolate(self, table, intensity):
+        # Intensities outside the recorded range are clamped to the table ends
+        pos = intensity * self.inv_lux_step
+        if pos <= 0:
+            return table[0]
+        if pos >= self.last_bin:
+            return table[self.last_bin]
+        i = int(pos)
+        frac = pos - i
+        return table[i] + frac * (table[i + 1] - table[i])
+
+    def charging_current(self, intensity):
+        '''
+        Expected charger output current (mA) at the given light intensity (lux)
+        '''
+        return self._interpolate(self.Iout, intensity)
+
+    def charging_efficiency(self, intensity):
+        '''
+        Expected charger efficiency (0-1) at the given light intensity (lux)
+        '''
+        return self._interpolate(self.efficiency, intensity)
+
+    def time_to_recharge(self, intensity, charge_needed=battery_capacity):
+        '''
+        Expected time (s) to put charge_needed (mAh) back in the battery at the
+        given light intensity (lux). Infinite if no charging current is expected.
+        '''
+        current = self._interpolate(self.Iout, intensity)
+        if current <= 0:
+            return float('inf')
+        return 3600.0 * charge_needed / current
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fit charging current and efficiency against light intensity and export a lookup table')
+    parser.add_argument('-d', '--datadir', type=str, default='../data/charging/', help='Directory with the charging logs')
+    parser.add_argument('-o', '--output', type=str, default='../data/charging-lookup.csv', help='Output lookup table (csv)')
+    parser.add_argument('-m', '--max_lux', type=float, default=max_lux, help='Largest light intensity in the table (lux)')
+    parser.add_argument('-n', '--n_bins', type=int, default=n_bins, help='Number of lux bins in the table')
+    args = parser.parse_args()
+
+    lux_grid, tables = build_lookup_table(args.datadir, max_lux=args.max_lux, n_bins=args.n_bins)
+    save_lookup_table(args.output, lux_grid, tables)
+    print('Saved {}'.format(args.output))
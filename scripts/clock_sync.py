@@ -0,0 +1,124 @@
+import argparse
+import os
+import time
+from collections import deque
+import numpy as np
+from sensor_state import SensorState
+
+
+class ClockSync:
+    '''
+    Host time of drone timestamps, from the arrival times of the log packets.
+
+    Every sample arrives some latency after its drone timestamp, so
+    host = offset + (1 + drift) * drone + latency with latency >= 0. The
+    samples with the smallest apparent latency in every bin_ms of drone time
+    lie on the line, so offset and drift are fitted (least squares) to those
+    minima over the last window bins, and refitted every time a bin closes.
+    The offset therefore includes the minimum radio latency; the remaining
+    error is the jitter of the minima (about a ms at the 100 Hz position log).
+
+    observe() is called by the logging callbacks (single writer) and returns
+    the host time of the sample. to_host() and to_drone() convert either way
+    from any thread, the fit is published through a SensorState. Times are
+    ms for the drone and s since the epoch (time.time()) for the host, so
+    drones logged from different hosts can be compared too. If log_file is
+    set, every fit is written to it (drone_ms,reference,offset,drift) so
+    host_times() can attach host time to the recorded logs afterwards.
+    '''
+
+    def __init__(self, bin_ms=1000, window=120, log_file=None):
+        self.bin_ms = bin_ms
+        self.log_file = log_file
+        # drone ms the fit is relative to, host s at that drone time, drift (s/s)
+        self.fit = SensorState(('reference', 'offset', 'drift'))
+        self.reference = None
+        # [bin, x (s since reference), y (host - x)] of the earliest arrival in every bin
+        self.bins = deque(maxlen=window)
+
+    def observe(self, timestamp, host=None):
+        '''
+        Record the arrival of a sample with drone timestamp (ms), returns its host time
+        '''
+        if host is None:
+            host = time.time()
+        if self.reference is None:
+            self.reference = timestamp
+        x = (timestamp - self.reference) / 1000
+        y = host - x
+        current = int((timestamp - self.reference) // self.bin_ms)
+        if self.bins and self.bins[-1][0] == current:
+            if y < self.bins[-1][2]:
+                self.bins[-1][1], self.bins[-1][2] = x, y
+                if len(self.bins) == 1:
+                    self.refit(timestamp)
+        else:
+            self.bins.append([current, x, y])
+            self.refit(timestamp)
+        # the writer can use the fit directly
+        reference, offset, drift = self.fit.values
+        return offset + (timestamp - reference) / 1000 * (1 + drift)
+
+    def refit(self, timestamp):
+        if len(self.bins) < 3:
+            # not enough time to see any drift yet
+            offset, drift = min(b[2] for b in self.bins), 0.0
+        else:
+            # the last bin is still open, its minimum may come down further
+            xy = np.array([(b[1], b[2]) for b in list(self.bins)[:-1]])
+            drift, offset = (float(c) for c in np.polyfit(xy[:,0], xy[:,1], 1))
+        self.fit.publish(self.reference, offset, drift)
+        if self.log_file is not None:
+            self.log_file.write("{},{},{!r},{!r}\n".format(timestamp, self.reference, offset, drift))
+
+    @property
+    def synced(self):
+        return self.fit.version > 0
+
+    def to_host(self, timestamp):
+        '''
+        Host time (s) of a drone timestamp (ms)
+        '''
+        reference, offset, drift = self.fit.read(self.fit.new_buffer())
+        return offset + (timestamp - reference) / 1000 * (1 + drift)
+
+    def to_drone(self, host):
+        '''
+        Drone timestamp (ms) of a host time (s), eg. of a key press or a command
+        '''
+        reference, offset, drift = self.fit.read(self.fit.new_buffer())
+        return reference + 1000 * (host - offset) / (1 + drift)
+
+
+def host_times(timestamps, clock_log):
+    '''
+    Host times (s) of drone timestamps (ms) of a recorded log, using the fits
+    of clock_log (array of drone_ms,reference,offset,drift rows) valid at
+    each sample (the first one for samples before it)
+    '''
+    timestamps = np.asarray(timestamps, dtype=float)
+    fit = clock_log[np.maximum(np.searchsorted(clock_log[:,0], timestamps, side='right') - 1, 0)]
+    x = (timestamps - fit[:,1]) / 1000
+    return fit[:,2] + x * (1 + fit[:,3])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Attach host time to the logs of a flight using the clock fits in clock.csv')
+    parser.add_argument('-d', '--datadir', type=str, default='../data/', help='Directory with clock.csv and the logs')
+    parser.add_argument('-w', '--write', action='store_true', default=False, help='Write host_<log>.csv with the host time (s) as first column')
+    args = parser.parse_args()
+
+    clock_log = np.loadtxt(os.path.join(args.datadir, 'clock.csv'), delimiter=',', ndmin=2)
+    print('{} fits over {:.1f} s of drone time, last drift estimate {:.1f} ppm'.format(
+        len(clock_log), (clock_log[-1,0] - clock_log[0,0]) / 1000, 1e6 * clock_log[-1,3]))
+    if args.write:
+        for name in ['pos', 'range', 'intensity', 'vbat', 'thrust', 'phase']:
+            filename = os.path.join(args.datadir, name + '.csv')
+            if not os.path.isfile(filename):
+                continue
+            with open(filename) as filehandle:
+                lines = [line for line in filehandle if line.strip()]
+            hosts = host_times([float(line.split(',')[0]) for line in lines], clock_log)
+            with open(os.path.join(args.datadir, 'host_' + name + '.csv'), 'w') as filehandle:
+                filehandle.writelines('{:.4f},{}'.format(host, line) for host, line in zip(hosts, lines))
+            print('Saved {}'.format(os.path.join(args.datadir, 'host_' + name + '.csv')))
@@ -14,6 +14,19 @@ import argparse
 import os
 from collections import deque
 import time
+from charging_model import ChargingLookup, charge_needed_from_vbat
+from telemetry_overlay import TelemetryOverlay
+from callback_profiler import CallbackProfiler
+from sensor_state import SensorState
+from clock_sync import ClockSync
+from status_output import StatusOutput
+from anomaly_detectors import default_monitor
+from link_watchdog import LinkWatchdog
+from mission import Mission, FLATNESS_CHECK, default_settle_times
+from trajectories import Trajectory, square_check_time
+from surface_classifier import SurfaceClassifier, model_file
+from telemetry_ring import TelemetryRing
+from setpoint_streamer import SetpointStreamer
 
 
 # TODO: add these to argparse
@@ -26,13 +39,41 @@ turn_rate = 360.0 / 10.0    # rot/s
 square_side = 0.4           # m
 light_thresh = 1000         # lux (indoor light). Change to 100,000 lux for outdoors
 dist_thresh = 220           # mm
-sleep_time = 0.050          # sec
+sleep_time = 0.050          # sec, period of the landing site selection steps
 fwd_distance = 0.4          # m
 flatness_threshold = 0.015  # m
+flatness_trajectory = 'circle'  # 'square', 'circle', 'spiral', 'lawnmower' or None for the stop-and-go square
+flatness_samples = 400      # z samples to collect per flatness check
+max_vel = 0.5               # m/s, top speed along the flatness-check trajectory
+landing_surfaces = ['flat']  # surfaces (of surface_classifier.py) the drone may land on
+surface_confidence = 0.95   # probability of another surface at which a flatness check is cut short
 vbat_threshold = 2.8        # V
+telemetry_fps = 10          # Hz, frame rate cap of the telemetry panel
+status_interval = 1.0       # s, repeated status lines (vbat, intensity) are printed at most this often
+telemetry_ring = 'crazyflie-telemetry'  # shared-memory ring other processes can read the live logs from (telemetry_ring.py), None to disable
+panel = 'MPT4.8-75(2-panels)'  # mounted solar panels, one of the configurations in ../data/charging-lookup.csv
 
 is_FlowDeck_attached = True
 checking_flatness = False
+# Latest sample of each stream, written by the logging callbacks and read lock-free
+position = SensorState(('timestamp', 'x', 'y', 'z'))
+ranges = SensorState(('timestamp', 'left', 'front', 'right', 'back'))
+light = SensorState(('timestamp', 'intensity'))
+battery = SensorState(('timestamp', 'vbat'))
+# Running sums of z - takeoff_height while checking flatness (std without storing the samples)
+z_sums = SensorState(('n', 'sum', 'sum_sq'))
+# Surface type from the latest z samples while checking flatness (generate the model with surface_classifier.py)
+# NOTE: flat is learned from one stop-and-go log at 0.2 m/s, not yet checked on the faster trajectories
+surface_classifier = SurfaceClassifier.load(model_file) if os.path.isfile(model_file) else None
+z_window = deque(maxlen=surface_classifier.window if surface_classifier is not None else 1)
+# Host time of the drone timestamps, estimated from the arrival of every log packet
+clock = ClockSync()
+# Console output, written from its own thread so printing never holds up the callbacks
+status = StatusOutput(key_interval=status_interval)
+# Streaming checks on vbat, the multiranger and z, acted on in the control loop
+anomalies = default_monitor(takeoff_height, on_event=lambda event: status.post('Anomaly: ' + event.message))
+# Every sample also goes to the shared-memory ring, created in main
+ring = None
 ## Only output errors from the logging framework
 logging.basicConfig(level=logging.ERROR)
 
@@ -44,29 +85,44 @@ def FlowDeckCheck(name, value):
     global is_FlowDeck_attached
     if value:
         is_FlowDeck_attached = True
-        print('Flow Deck is attached!')
+        status.post('Flow Deck is attached!')
     else:
         is_FlowDeck_attached = False
-        print('Flow Deck is NOT attached!')
+        status.post('Flow Deck is NOT attached!')
 
 
 def log_pos_callback(timestamp, data, logconf):
     '''
     Logging callback function for position
     '''
+    clock.observe(timestamp)
     # print("t={},x={},y={},z={},checking_flatness?={}\n".format(timestamp, data['stateEstimate.x'], data['stateEstimate.y'], data['stateEstimate.z'], checking_flatness))
-    pos_file_handler.write("{},{},{},{},{}\n".format(timestamp, data['stateEstimate.x'], data['stateEstimate.y'], data['stateEstimate.z'], checking_flatness))
+    x, y, z = data['stateEstimate.x'], data['stateEstimate.y'], data['stateEstimate.z']
+    position.publish(timestamp, x, y, z)
+    if ring is not None:
+        ring['pos'].publish(timestamp, x, y, z, checking_flatness)
+    pos_file_handler.write("{},{},{},{},{}\n".format(timestamp, x, y, z, checking_flatness))
     if checking_flatness:
-        global zrange
-        zrange.append(data['stateEstimate.z'])
+        anomalies.feed('z', timestamp, z)
+        z_window.append(z)
+        n, z_sum, z_sum_sq = z_sums.values  # this callback is the only writer
+        dz = z - takeoff_height
+        z_sums.publish(n + 1, z_sum + dz, z_sum_sq + dz*dz)
 
 
 def log_range_callback(timestamp, data, logconf):
     '''
     Logging callback function for multiranger
     '''
-    global range_left, range_front, range_right, range_back
+    clock.observe(timestamp)
     range_left, range_front, range_right, range_back = data['range.left'], data['range.front'], data['range.right'], data['range.back']
+    ranges.publish(timestamp, range_left, range_front, range_right, range_back)
+    if ring is not None:
+        ring['range'].publish(timestamp, range_left, range_front, range_right, range_back)
+    anomalies.feed('range.left', timestamp, range_left)
+    anomalies.feed('range.front', timestamp, range_front)
+    anomalies.feed('range.right', timestamp, range_right)
+    anomalies.feed('range.back', timestamp, range_back)
     # print("t={},left={},front={},right={},back={}\n"_format(timestamp, range_left, range_front, range_right, range_back))
     range_file_handler.write("{},{},{},{},{}\n".format(timestamp, range_left, range_front, range_right, range_back))
 
@@ -75,9 +131,13 @@ def log_intensity_callback(timestamp, data, logconf):
     '''
     Logging callback function for light intensity
     '''
-    global intensity
+    clock.observe(timestamp)
     intensity = data['BH1750.intensity']
-    print("t={},intensity={}".format(timestamp, intensity))
+    light.publish(timestamp, intensity)
+    if ring is not None:
+        ring['intensity'].publish(timestamp, intensity)
+    # battery is written from this same (cflib) thread, so its values can be read directly
+    status.post("t={},intensity={},time to recharge={:.1f} min".format(timestamp, intensity, charging_lookup.time_to_recharge(intensity, charge_needed_from_vbat(battery.values[1]))/60), key='intensity')
     intensity_file_handler.write("{},{}\n".format(timestamp, intensity))
 
 
@@ -85,9 +145,13 @@ def log_vbat_callback(timestamp, data, logconf):
     '''
     Logging callback function for battery voltage
     '''
-    global vbat
+    clock.observe(timestamp)
     vbat = data['pm.vbat']
-    print("t={}, vbat={} V".format(timestamp, vbat))
+    battery.publish(timestamp, vbat)
+    if ring is not None:
+        ring['vbat'].publish(timestamp, vbat)
+    anomalies.feed('vbat', timestamp, vbat)
+    status.post("t={}, vbat={} V".format(timestamp, vbat), key='vbat')
     vbat_file_handler.write("{},{}\n".format(timestamp, vbat))
 
 
@@ -95,39 +159,76 @@ def log_thrust_callback(timestamp, data, logconf):
     '''
     Logging callback function for thrust
     '''
+    clock.observe(timestamp)
     # print("t={}, thrust={} V".format(timestamp, data['stabilizer.thrust']))
+    if ring is not None:
+        ring['thrust'].publish(timestamp, data['stabilizer.thrust'])
     thrust_file_handler.write("{},{}\n".format(timestamp, data['stabilizer.thrust']))
 
 
-def flatness_check(mc):
-    global checking_flatness, flatness
-    mc.stop()
-    time.sleep(1)
-    # Go to bottom-left corner of square
-    mc.left(square_side/2, velocity=strafe_vel)
-    mc.stop()
-    mc.back(square_side/2, velocity=strafe_vel)
-    mc.stop()
-    time.sleep(1)
-    # Start checking the flatness
-    checking_flatness = True
-    mc.forward(square_side, velocity=forward_vel)
-    mc.stop()
-    mc.right(square_side, velocity=strafe_vel)
-    mc.stop()
-    mc.back(square_side, velocity=strafe_vel)
-    mc.stop()
-    mc.left(square_side, velocity=strafe_vel)
-    mc.stop()
-    checking_flatness = False
-    # Go back to the center of the square
-    mc.forward(square_side/2, velocity=forward_vel)
-    mc.stop()
-    mc.right(square_side/2, velocity=strafe_vel)
-    mc.stop()
-    time.sleep(1)
-    flatness = np.std(np.asarray(zrange))
-    print("Standard deviation of zrange is: {}".format(flatness))
+telemetry_buffers = (battery.new_buffer(), light.new_buffer(), ranges.new_buffer(), position.new_buffer())
+
+
+def telemetry_snapshot():
+    '''
+    Current values for the telemetry panel (same order as telemetry_channels)
+    '''
+    battery_buf, light_buf, range_buf, position_buf = telemetry_buffers
+    battery.read(battery_buf)
+    light.read(light_buf)
+    ranges.read(range_buf)
+    position.read(position_buf)
+    return battery_buf[1], light_buf[1], range_buf[2], range_buf[4], range_buf[1], range_buf[3], position_buf[3]
+
+
+# label, unit, format, min, max, warn below, style
+telemetry_channels = [('vbat', 'V', '{:.2f}', vbat_threshold, 4.2, vbat_threshold, 'gauge'),
+                      ('intensity', 'lux', '{:.0f}', 0, 2 * light_thresh, light_thresh, 'gauge'),
+                      ('front', 'mm', '{:.0f}', 0, 4000, dist_thresh, 'gauge'),
+                      ('back', 'mm', '{:.0f}', 0, 4000, dist_thresh, 'gauge'),
+                      ('left', 'mm', '{:.0f}', 0, 4000, dist_thresh, 'gauge'),
+                      ('right', 'mm', '{:.0f}', 0, 4000, dist_thresh, 'gauge'),
+                      ('z', 'm', '{:.3f}', None, None, None, 'sparkline')]
+
+
+def set_checking_flatness(value):
+    # the mission tells the position callback when to accumulate z
+    global checking_flatness
+    if value:
+        anomalies.reset('z')
+        z_window.clear()
+    checking_flatness = value
+
+
+def surface_check():
+    '''
+    Reason to give up on the site before the flatness check is over, if the
+    latest z samples are confidently not from one of landing_surfaces
+    '''
+    if surface_classifier is None or len(z_window) < z_window.maxlen:
+        return None
+    # list() of a deque runs in C, so the position callback can't append in the middle
+    z = list(z_window)
+    if 1 - surface_classifier.probability(z, landing_surfaces) >= surface_confidence:
+        return 'Surface looks like {}'.format(surface_classifier.classify(z)[0])
+    return None
+
+
+def log_phase(phase):
+    '''
+    Start of a flight phase (manual, mission states, land), stamped with the
+    time of the latest position sample so energy.py can split the flight
+    '''
+    status.post("Phase: {}".format(phase))
+    phase_file_handler.write("{},{}\n".format(int(position.read(position.new_buffer())[0]), phase))
+
+
+def log_event(event):
+    '''
+    Host-side event (eg. a key press) with its host time and the matching drone time
+    '''
+    host = time.time()
+    event_file_handler.write("{:.4f},{:.0f},{}\n".format(host, clock.to_drone(host) if clock.synced else float('nan'), event))
 #######################################
 
 
@@ -137,82 +238,114 @@ if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description='Script to control the drone')
     parser.add_argument('-u', '--uri', type=str, default='69', help='URI of the crazyflie to connect to')
+    parser.add_argument('-p', '--profile', action='store_true', default=False, help='Profile the logging callbacks from the start (toggle with p)')
+    parser.add_argument('--metrics_file', type=str, help='File to periodically write callback metrics to (json)')
+    parser.add_argument('--metrics_port', type=int, help='Serve callback metrics at http://localhost:<port>/')
+    parser.add_argument('-s', '--stream_rate', type=float, help='Stream setpoints through cf.commander at this rate (Hz) instead of using MotionCommander')
+    parser.add_argument('--metrics_interval', type=float, default=5.0, help='Seconds between metrics file dumps')
     # TODO: add flags to enable / disable logging of each log variable
     args = parser.parse_args()
 
     cflib.crtp.init_drivers(enable_debug_driver=False)
+    status.start()
+    if telemetry_ring is not None:
+        ring = TelemetryRing(telemetry_ring, create=True)
+
+    # Expected charging rate for the mounted panels (generate with charging_model.py)
+    charging_lookup = ChargingLookup.from_csv("../data/charging-lookup.csv", panel)
 
-    with SyncCrazyflie('radio://0/'+args.uri+'/2M/E7E7E7E7E7', cf=Crazyflie(rw_cache=os.path.expanduser("~") + "/.cache")) as scf:
+    # Per-callback metrics (invocations, time, bytes written)
+    profiler = CallbackProfiler(enabled=args.profile)
+    profiler.start_dump(interval=args.metrics_interval, filename=args.metrics_file, port=args.metrics_port)
+
+    uri = 'radio://0/'+args.uri+'/2M/E7E7E7E7E7'
+    with SyncCrazyflie(uri, cf=Crazyflie(rw_cache=os.path.expanduser("~") + "/.cache")) as scf:
         scf.cf.param.add_update_callback(group="deck", name="bcFlow2", cb=FlowDeckCheck)
+        # Reconnects (and restarts logging into the same files) if the radio link drops mid-flight
+        watchdog = LinkWatchdog(scf.cf, uri, output=status.post,
+                                on_lost=lambda host: log_event('link lost'),
+                                on_restored=lambda host, outage, attempts: log_event('link restored after {:.3f} s ({} attempts)'.format(outage, attempts)))
 
         # Logging position
         # Overwrite logfile contents
         pos_file_handler = open("../data/pos.csv", "w")
         pos_file_handler.close()
-        pos_file_handler = open("../data/pos.csv", "a")
+        pos_file_handler = profiler.wrap_file(open("../data/pos.csv", "a"))
         logconf_pos = LogConfig(name='position', period_in_ms=10)
         logconf_pos.add_variable('stateEstimate.x', 'float')
         logconf_pos.add_variable('stateEstimate.y', 'float')
         logconf_pos.add_variable('stateEstimate.z', 'float')
-        scf.cf.log.add_config(logconf_pos)
-        logconf_pos.data_received_cb.add_callback(log_pos_callback)
+        watchdog.watch(logconf_pos)
+        logconf_pos.data_received_cb.add_callback(profiler.wrap(log_pos_callback))
 
         # Logging range
         # Overwrite logfile contents
         range_file_handler = open("../data/range.csv", "w")
         range_file_handler.close()
-        range_file_handler = open("../data/range.csv", "a")
+        range_file_handler = profiler.wrap_file(open("../data/range.csv", "a"))
         logconf_range = LogConfig(name='range', period_in_ms=10)
         logconf_range.add_variable('range.front', 'float')
         logconf_range.add_variable('range.back', 'float')
         logconf_range.add_variable('range.left', 'float')
         logconf_range.add_variable('range.right', 'float')
-        scf.cf.log.add_config(logconf_range)
-        logconf_range.data_received_cb.add_callback(log_range_callback)
+        watchdog.watch(logconf_range)
+        logconf_range.data_received_cb.add_callback(profiler.wrap(log_range_callback))
 
         # Logging intensity
         # Overwrite logfile contents
         intensity_file_handler = open("../data/intensity.csv", "w")
         intensity_file_handler.close()
-        intensity_file_handler = open("../data/intensity.csv", "a")
+        intensity_file_handler = profiler.wrap_file(open("../data/intensity.csv", "a"))
         logconf_intensity = LogConfig(name='intensity', period_in_ms=200)
         logconf_intensity.add_variable('BH1750.intensity', 'float')
-        scf.cf.log.add_config(logconf_intensity)
-        logconf_intensity.data_received_cb.add_callback(log_intensity_callback)
+        watchdog.watch(logconf_intensity)
+        logconf_intensity.data_received_cb.add_callback(profiler.wrap(log_intensity_callback))
 
         # Logging vbat
         # Overwrite logfile contents
         vbat_file_handler = open("../data/vbat.csv", "w")
         vbat_file_handler.close()
-        vbat_file_handler = open("../data/vbat.csv", "a")
-        logconf_vbat = LogConfig(name='vbat', period_in_ms=1000)
+        vbat_file_handler = profiler.wrap_file(open("../data/vbat.csv", "a"))
+        logconf_vbat = LogConfig(name='vbat', period_in_ms=100)
         logconf_vbat.add_variable('pm.vbat', 'float')
-        scf.cf.log.add_config(logconf_vbat)
-        logconf_vbat.data_received_cb.add_callback(log_vbat_callback)
+        watchdog.watch(logconf_vbat)
+        logconf_vbat.data_received_cb.add_callback(profiler.wrap(log_vbat_callback))
 
         # Logging thrust
         # Overwrite logfile contents
         thrust_file_handler = open("../data/thrust.csv", "w")
         thrust_file_handler.close()
-        thrust_file_handler = open("../data/thrust.csv", "a")
-        logconf_thrust = LogConfig(name='thrust', period_in_ms=1000)
+        thrust_file_handler = profiler.wrap_file(open("../data/thrust.csv", "a"))
+        logconf_thrust = LogConfig(name='thrust', period_in_ms=100)
         logconf_thrust.add_variable('stabilizer.thrust', 'float')
-        scf.cf.log.add_config(logconf_thrust)
-        logconf_thrust.data_received_cb.add_callback(log_thrust_callback)
+        watchdog.watch(logconf_thrust)
+        logconf_thrust.data_received_cb.add_callback(profiler.wrap(log_thrust_callback))
+
+        # Logging flight phases
+        phase_file_handler = open("../data/phase.csv", "w")
+        # Logging host events and the clock fits to put host time on the logs (clock_sync.py)
+        event_file_handler = open("../data/events.csv", "w")
+        clock.log_file = open("../data/clock.csv", "w")
 
-        intensity, range_left, range_front, range_right, range_back, vbat = 0, 0, 0, 0, 0, 0
+        # Reader-side buffers for the sensor states
+        battery_buf = battery.new_buffer()
 
         if is_FlowDeck_attached:
-            mc = MotionCommander(scf, default_height=takeoff_height)
+            if args.stream_rate is not None:
+                # lowest command latency: new commands go out right away, and are repeated at stream_rate
+                mc = SetpointStreamer(scf, default_height=takeoff_height, rate=args.stream_rate)
+            else:
+                mc = MotionCommander(scf, default_height=takeoff_height)
             mc.take_off(height=takeoff_height, velocity=takeoff_velocity)
             # with MotionCommander(scf, default_height=takeoff_height) as mc:
             time.sleep(1)
             # Start logging
-            logconf_pos.start()
-            logconf_range.start()
-            logconf_intensity.start()
-            logconf_vbat.start()
-            logconf_thrust.start()
+            watchdog.start_logging(logconf_pos)
+            watchdog.start_logging(logconf_range)
+            watchdog.start_logging(logconf_intensity)
+            watchdog.start_logging(logconf_vbat)
+            watchdog.start_logging(logconf_thrust)
+            watchdog.start()
 
             # Init pygame
             pygame.init()
@@ -225,18 +358,54 @@ if __name__ == '__main__':
             text = titlefont.render('Crazyflie controller', True, (255, 255, 255)); screen.blit(text, (8,10))
             descfont = pygame.font.SysFont('hack', 18)
             text = descfont.render('Keys: w,s,a,d> move;   q,e> turn;   f> stop;   z>land', True, (255, 255, 255)); screen.blit(text, (5, int(win_height/2 - 10)))
-            text = descfont.render('g> flatness check and land', True, (255, 255, 255)); screen.blit(text, (5, int(win_height/2 + 10)))
+            text = descfont.render('g> flatness check and land;  p> profiling', True, (255, 255, 255)); screen.blit(text, (5, int(win_height/2 + 10)))
             # text = descfont.render('Press Esc to quit.', True, (255, 255, 255)); screen.blit(text, (5,win_height/2 + 10))
             pygame.display.flip()
+            # Live telemetry in the bottom part of the window
+            overlay = TelemetryOverlay(screen, telemetry_channels, telemetry_snapshot, (5, int(win_height/2 + 35), win_width - 10, int(win_height/2 - 40)), fps=telemetry_fps)
             # PyGame loop
+            mission = None
+            low_battery = False
+            # the multiranger failed before the mission started (its detector only alarms once)
+            range_failed = False
+            # sized to collect flatness_samples at the position log rate over the area of the square
+            trajectory = None
+            if flatness_trajectory is not None:
+                trajectory = Trajectory(flatness_trajectory, area=square_side**2, samples=flatness_samples,
+                                        sample_rate=1000/logconf_pos.period_in_ms, max_vel=max_vel)
+                # both start with the mission's settle time, the square also flies to its corner and back unmeasured
+                settle = default_settle_times[FLATNESS_CHECK]
+                square_total, square_measuring = square_check_time(square_side, forward_vel, strafe_vel, pauses=1, pause_time=settle)
+                status.post('Flatness check: {} of {:.1f} s, {:.0f} samples/s of flight (square: {:.1f} s, {:.0f} samples/s)'.format(
+                    flatness_trajectory, trajectory.duration + settle, trajectory.samples_per_second(settle),
+                    square_total, square_measuring * trajectory.sample_rate / square_total))
+            log_phase('manual')
             while(1):
                 try:
+                    overlay.update()
+                    for anomaly in anomalies.pop_events():
+                        log_event('anomaly ' + anomaly.message)
+                        if anomaly.stream == 'vbat':
+                            # sagging under load, start looking for a landing site now
+                            low_battery = True
+                        elif anomaly.stream.startswith('range'):
+                            # can't avoid obstacles without the multiranger
+                            range_failed = True
+                            if mission is not None:
+                                mission.abort()
+                        elif anomaly.stream == 'z' and mission is not None:
+                            mission.discard_check()
                     # To exit
                     event = pygame.event.poll()
+                    if event.type == KEYDOWN:
+                        log_event('key ' + pygame.key.name(event.key))
                     # Here, the drone is being controlled manually when battery is not low.
                     # This behaviour can be changed as per desired application
                     if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
                         break
+                    elif event.type == KEYDOWN and event.key in (K_w, K_s, K_a, K_d, K_q, K_e, K_f) and mission is not None:
+                        # the mission is flying (and only resends a velocity when it changes), z still lands
+                        status.post('Mission running, ignoring {}'.format(pygame.key.name(event.key)))
                     elif event.type == KEYDOWN and event.key == K_w:
                         mc.stop()
                         mc.start_forward(velocity=forward_vel)
@@ -257,65 +426,30 @@ if __name__ == '__main__':
                         mc.start_turn_right(rate=turn_rate)
                     elif event.type == KEYDOWN and event.key == K_f:
                         mc.stop()
+                    elif event.type == KEYDOWN and event.key == K_p:
+                        profiler.enabled = not profiler.enabled
+                        status.post('Callback profiling {}'.format('enabled' if profiler.enabled else 'disabled'))
                     # elif event.type == KEYDOWN and event.key == K_g:
-                    elif vbat < vbat_threhold:  # when battery is low:
-                        # Keep moving forward till there's enough light.
-                        # This behaviour can be changed to a random walk or anything else as desired
-                        while intensity < light_thresh:
-                            try:
-                                print("Light intensity < threshold")
-                                if no obstacle, keep moving forward
-                                if(range_left > dist_thresh and
-                                   range_front > dist_thresh and
-                                   range_right > dist_thresh and
-                                   range_back > dist_thresh):
-                                mc.start_forward(forward_vel)
-                                time.sleep(sleep_time)
-                                # Else avoid the obstacle by moving directly away from it.
-                                # This behaviour can be changed to turning away, wall-following
-                                # or anything else as desired
-                                else:
-                                    dist_arr = np.array([range_left, range_front,
-                                                         range_right, range_back])
-                                    smallest_dist = np.argmin(dist_arr)
-                                    if smallest_dist == 0:
-                                      print('Obstacle to left, moving right....')
-                                      mc.start_right(strafe_vel)
-                                    elif smallest_dist == 1:
-                                      print('Obstacle to front, moving back....')
-                                      mc.start_back(strafe_vel)
-                                    elif smallest_dist == 2:
-                                      print('Obstacle to right, moving left....')
-                                      mc.start_left(strafe_vel)
-                                    elif smallest_dist == 3:
-                                      print('Obstacle to back, moving forward....')
-                                      mc.start_forward(forward_vel)
-                                    time.sleep(sleep_time)
-                            except KeyboardInterrupt:
-                                break
+                    elif mission is None and (low_battery or battery.version > 0 and battery.read(battery_buf)[1] < vbat_threshold):  # when battery is low:
+                        # Autonomous landing site selection: keep moving forward till there's enough light
+                        # (avoiding obstacles), check flatness on a square around the area and move on till a
+                        # flat place is found. Driven by mission.tick() below so the loop keeps running.
+                        # This behaviour can be changed to a random walk, a different trajectory etc. in mission.py
+                        mission = Mission(mc, position, ranges, light, z_sums, set_checking_flatness,
+                                          forward_vel=forward_vel, strafe_vel=strafe_vel, square_side=square_side,
+                                          light_thresh=light_thresh, dist_thresh=dist_thresh, fwd_distance=fwd_distance,
+                                          flatness_threshold=flatness_threshold, trajectory=trajectory, tick_period=sleep_time,
+                                          surface_check=surface_check, on_transition=log_phase, output=status.post)
+                        if range_failed:
+                            # no obstacle avoidance, land here instead of seeking light
+                            mission.abort()
+                    elif event.type == KEYDOWN and event.key == K_z:
                         mc.stop()
-                        print("Light intensity > threshold! Checking flatness...")
-                        zrange = []
-                        flatness = 1  # initialize to some large value
-                        flatness_check(mc)
-                        # keep checking in different places till a flat landing place is found
-                        while flatness > flatness_threshold:
-                            try:
-                                print("Not flat. Checking flatness at another place...")
-                                zrange = []
-                                # Move forward by some distance to check for flatness again.
-                                # This behaviour can be changed to a random walk or anything else as desired
-                                mc.forward(fwd_distance)
-                                # Collect time of flight measurements while moving in a square around the area
-                                # to be tested for flatness.
-                                # This behaviour can be changed to a different trajectory (for eg. a circle) as desired
-                                flatness_check(mc)
-                            except KeyboardInterrupt:
-                                break
                         break
-                        elif event.type == KEYDOWN and event.key == K_z:
-                            mc.stop()
-                            break
+                    # the mission waits while the link is down, its sensor values are stale
+                    if mission is not None and watchdog.link_up and not mission.tick():
+                        # flat place with enough light found
+                        break
                 except KeyboardInterrupt:
                     mc.stop()
                     break
@@ -323,14 +457,23 @@ if __name__ == '__main__':
             # when all three conditions are satisfied, land
             mc.stop()
             # Stop logging and end
-            logconf_pos.stop()
+            watchdog.stop()
             pos_file_handler.close()
-            logconf_range.stop()
             range_file_handler.close()
-            logconf_intensity.stop()
             intensity_file_handler.close()
-            logconf_vbat.stop()
             vbat_file_handler.close()
-            logconf_thrust.stop()
             thrust_file_handler.close()
+            if mission is None or not mission.done:
+                log_phase('land')
+            phase_file_handler.close()
+            event_file_handler.close()
+            clock.log_file.close()
+            profiler.stop_dump()
+            if ring is not None:
+                # the callbacks stop publishing before the memory goes away
+                closing, ring = ring, None
+                closing.close()
             mc.land()
+            if args.stream_rate is not None:
+                status.post(mc.report())
+    status.stop()
@@ -5,6 +5,8 @@ from cflib.crazyflie.log import LogConfig
 import logging
 import os
 import time
+from link_watchdog import LinkWatchdog
+from setpoint_streamer import SetpointStreamer
 
 
 hover_thrust = []
@@ -53,6 +55,7 @@ if __name__ == '__main__':
     parser.add_argument('-u', '--uri', type=str, default='69', help='URI of the crazyflie to connect to')
     parser.add_argument('-v', '--log_vbat', action='store_true', default=False, help='Log battery voltage')
     parser.add_argument('-w', '--write_to_file', action='store_true', default=False, help='Write logging variables to file')
+    parser.add_argument('--stream_rate', type=float, help='Hover with setpoints streamed through cf.commander at this rate (Hz) instead of MotionCommander')
     parser.add_argument('-n', '--trial_no', type=int, help='Trial number (for saving vbat information to file)')
     args = parser.parse_args()
 
@@ -71,8 +74,9 @@ if __name__ == '__main__':
 
     # Connect to the crazyflie
     cf = Crazyflie(rw_cache=os.path.expanduser("~") + "/.cache")
-    cf.open_link('radio://0/' + args.uri + '/2M/E7E7E7E7E7')
-    time.sleep(5)  # give some time to establish connection; 5 sec seems to work
+    # Reconnects (and restarts logging into the same file) if the radio link drops during a run
+    watchdog = LinkWatchdog(cf, 'radio://0/' + args.uri + '/2M/E7E7E7E7E7', connect_timeout=5)
+    watchdog.connect()  # waits until connected; 5 sec at most
     print('radio://0/' + args.uri + '/2M/E7E7E7E7E7' + " connected?: " + str(cf.is_connected()))
 
     # Logging battery voltage
@@ -93,7 +97,7 @@ if __name__ == '__main__':
             vbat_file_handler = open("../data/" + filename, "a")
         logconf_vbat = LogConfig(name="Battery voltage", period_in_ms=1000)
         logconf_vbat.add_variable('pm.vbat', 'float')
-        cf.log.add_config(logconf_vbat)
+        watchdog.watch(logconf_vbat)
         logconf_vbat.data_received_cb.add_callback(log_vbat_callback)
 
     if args.thrust is not None:
@@ -111,7 +115,8 @@ if __name__ == '__main__':
         
         time.sleep(3)  # wait for some time before starting logging battery voltage
         if args.log_vbat:
-            logconf_vbat.start()  # start logging battery voltage
+            watchdog.start_logging(logconf_vbat)  # start logging battery voltage
+            watchdog.start()
 
         spin()
 
@@ -133,14 +138,16 @@ if __name__ == '__main__':
         from cflib.positioning.motion_commander import MotionCommander
         logconf_thrust = LogConfig(name="Thrust", period_in_ms=1000)
         logconf_thrust.add_variable('stabilizer.thrust', 'float')
-        cf.log.add_config(logconf_thrust)
+        watchdog.watch(logconf_thrust)
         logconf_thrust.data_received_cb.add_callback(log_thrust_callback)
-        with MotionCommander(cf, default_height=takeoff_height) as mc:
+        commander = MotionCommander(cf, default_height=takeoff_height) if args.stream_rate is None else SetpointStreamer(cf, default_height=takeoff_height, rate=args.stream_rate)
+        with commander as mc:
             print("Take off " + 'radio://0/' + args.uri + '/2M/E7E7E7E7E7' + " at hover thrust.")
             mc.stop()
             time.sleep(3)  # give some time to take off before starting logging battery voltage
-            logconf_vbat.start()  # start logging battery voltage
-            logconf_thrust.start()  # start logging thrust
+            watchdog.start_logging(logconf_vbat)  # start logging battery voltage
+            watchdog.start_logging(logconf_thrust)  # start logging thrust
+            watchdog.start()
 
             pygame.init()
             win_width=400
@@ -183,22 +190,26 @@ if __name__ == '__main__':
                         mc.stop()
                     elif event.type == KEYDOWN and event.key == K_z:
                         mc.stop()
-                        logconf_vbat.stop()
+                        watchdog.stop_logging(logconf_vbat)
                         break
                 except KeyboardInterrupt:
                     break
 
-            logconf_thrust.stop()
+            watchdog.stop(stop_logging=False)
+            watchdog.stop_logging(logconf_thrust)
             mc.land()
             print('radio://0/' + args.uri + '/2M/E7E7E7E7E7' + " landed.")
+            if args.stream_rate is not None:
+                print(mc.report())
             print("Stopped logging thrust.")
             print("Average hover thrust for the flight was: {} %".format(sum(hover_thrust)*100/len(hover_thrust)/((2**16)-1)))
     else:
         spin()
 
     # Stop logging battery voltage
+    watchdog.stop(stop_logging=False)
     if args.log_vbat:
-        logconf_vbat.stop()
+        watchdog.stop_logging(logconf_vbat)
         print("Stopped logging vbat.")
         if args.write_to_file:
             vbat_file_handler.close()
@@ -0,0 +1,252 @@
+import argparse
+import re
+import time
+import numpy as np
+import pandas as pd  # to read/write csv, more convenient than csv module
+from energy import nominal_vbat, relative_power
+
+
+# single panels (footprint m^2, mass g), the configurations in data/charging are counts of these
+panel_specs = {'MPT4.8-75': (0.094 * 0.073, 1.98),
+               'MPT6-75': (0.114 * 0.073, 2.30)}
+design_lux = 100000         # lux, outdoors in sun (the controller's outdoor light threshold)
+max_area_ratio = 1.0        # panel area / l^2 the folding mounts can carry (the drone carries about 0.8)
+chunk = 1 << 20             # designs evaluated at once
+# 3 sqrt(3) / 2: below this harvest-to-weight ratio no panel area makes enough power (see DesignSpace)
+critical = 1.5 * np.sqrt(3)
+
+
+def scaling_fits(m, l, l_a, p):
+    '''
+    Fits of the scaling argument (see plots/scaling-argument.py) over the
+    drones in data/drone-data.ods: density rho [g/m3] (m = rho * l**3), array
+    loading gamma [g/m2] (m = gamma * l_a**2) and hover power per gram rho_p
+    [W/g] (p = rho_p * m, least squares in log space)
+    '''
+    rho = np.exp(np.sqrt(np.mean((np.log(m) - np.log(l**3))**2)))
+    gamma = np.exp(np.sqrt(np.mean((np.log(m) - np.log(l_a**2))**2)))
+    rho_p = np.exp(np.mean(np.log(p) - np.log(m)))
+    return rho, gamma, rho_p
+
+
+def crossover(rho, gamma):
+    '''
+    (mass g, length m) where the aircraft size (m / rho)**(1/3) and the PV
+    cell size (m / gamma)**(1/2) lines meet
+    '''
+    return gamma**3 / rho**2, gamma / rho
+
+
+def read_drone_data(filename):
+    data = pd.read_excel(filename, engine='odf', sheet_name='data')
+    return [np.asarray(data.get(column), dtype=float) for column in ['m (g)', 'l (m)', 'l_a (m)', 'p (W)']]
+
+
+def panel_yields(filename, lux=design_lux):
+    '''
+    {configuration: (power delivered to the battery per m^2 of panel [W/m2],
+    panel mass per m^2 [g/m2], charger efficiency)} at the given light, from
+    the measured lookup table (charging_model.py)
+    '''
+    data = pd.read_csv(filename)
+    panels = {}
+    for column in data.columns:
+        if not column.endswith(' Iout (mA)'):
+            continue
+        name = column[:-len(' Iout (mA)')]
+        match = re.match(r'(.+)\((\d+)-panels\)$', name)
+        if match is None or match.group(1) not in panel_specs:
+            continue
+        area, mass = panel_specs[match.group(1)]
+        count = int(match.group(2))
+        Iout = np.interp(lux, data['Lux'], data[column])
+        efficiency = np.interp(lux, data['Lux'], data[name + ' Efficiency'])
+        panels[name] = (Iout * nominal_vbat / 1000 / (count * area), mass / area, float(efficiency))
+    return panels
+
+
+class DesignSpace:
+    '''
+    Solar-powered hovering designs: airframe mass m (g), panel area A (m^2),
+    panel configuration k and hover power per gram of airframe w (W/g).
+
+    The panels weigh sigma_k * A and hover power grows with the total mass
+    as thrust^1.5 (energy.relative_power), so the harvested / hover power
+    ratio is
+        r = y_k A / (w m u^1.5),  u = 1 + sigma_k A / m
+    with y_k the measured yield (W/m^2). In s = sqrt(u), r = target is the
+    cubic s^3 - c s^2 + c = 0 with c = y_k / (sigma_k w target), which has
+    roots s > 1 (the smallest and largest area reaching the target) exactly
+    when c >= 3 sqrt(3) / 2. r peaks at u = 3, ie. panels weighing twice the
+    airframe, whatever the mass. The panels must also fit the airframe,
+    A <= max_area_ratio * l^2 with l = (m / rho)^(1/3) from the scaling fit;
+    the smallest area grows as m and the room as m^(2/3), so every panel
+    configuration and power has an exact break-even mass above which the
+    target can't be reached.
+
+    evaluate() scores any arrays of designs, sweep() a full grid in chunks;
+    break_even_area(), best() and break_even_mass() give the region
+    boundaries from the closed forms, not to grid resolution.
+    '''
+
+    def __init__(self, panels, rho, max_area_ratio=max_area_ratio):
+        self.names = list(panels)
+        self.yields = np.array([panels[name][0] for name in self.names])
+        self.sigmas = np.array([panels[name][1] for name in self.names])
+        self.rho = rho
+        self.max_area_ratio = max_area_ratio
+
+    @classmethod
+    def from_data(cls, drone_data='../data/drone-data.ods', lookup='../data/charging-lookup.csv', lux=design_lux, max_area_ratio=max_area_ratio):
+        rho, _, _ = scaling_fits(*read_drone_data(drone_data))
+        return cls(panel_yields(lookup, lux), rho, max_area_ratio)
+
+    def max_area(self, mass):
+        '''
+        Largest panel area (m^2) an airframe of mass (g) can carry
+        '''
+        return self.max_area_ratio * (np.asarray(mass) / self.rho)**(2 / 3)
+
+    def evaluate(self, mass, area, panel, power):
+        '''
+        Total mass (g), hover power (W), harvested power (W), their ratio and
+        whether the panels fit, for arrays of designs (panel as indices into names)
+        '''
+        mass, area, panel, power = np.broadcast_arrays(mass, area, panel, power)
+        total = mass + self.sigmas[panel] * area
+        hover = power * mass * relative_power(total, mass)
+        harvest = self.yields[panel] * area
+        return {'total mass (g)': total, 'hover power (W)': hover, 'harvested power (W)': harvest,
+                'ratio': harvest / hover, 'fits': area <= self.max_area(mass)}
+
+    def _panel_masses(self, panel, power, target):
+        # (smallest, largest) panel mass / airframe mass u - 1 at which the ratio
+        # reaches target, from the roots s > 1 of s^3 - c s^2 + c (the third one
+        # is negative), NaN below critical
+        c = self.yields[panel] / (self.sigmas[panel] * np.asarray(power) * target)
+        c = np.where(c >= critical, c, np.nan)
+        # trigonometric solution of the depressed cubic t^3 + p t + q, s = t + c / 3
+        p, q = -c**2 / 3, c - 2 * c**3 / 27
+        radius = 2 * np.sqrt(-p / 3)
+        angle = np.arccos(np.clip(3 * q / (p * radius), -1, 1)) / 3
+        roots = []
+        for s in (c / 3 + radius * np.cos(angle - 2 * np.pi / 3), c / 3 + radius * np.cos(angle)):
+            # the small root is close to 1 for large c, polish u - 1 itself on c (u - 1) = u^1.5
+            v = s**2 - 1
+            for _ in range(2):
+                v = v - (c * v - (1 + v)**1.5) / (c - 1.5 * np.sqrt(1 + v))
+            roots.append(v)
+        return roots
+
+    def break_even_area(self, mass, panel, power, target=1.0):
+        '''
+        (smallest, largest) panel area (m^2) at which harvested / hover power
+        reaches target (1: continuous hover), NaN where none does, ignoring
+        whether the panels fit
+        '''
+        low, high = self._panel_masses(panel, power, target)
+        mass, sigma = np.asarray(mass), self.sigmas[panel]
+        return mass * low / sigma, mass * high / sigma
+
+    def best(self, mass, panel, power):
+        '''
+        (area m^2, ratio) of the best design that fits: panels weighing twice
+        the airframe, or as many as fit
+        '''
+        area = np.minimum(2 * np.asarray(mass) / self.sigmas[panel], self.max_area(mass))
+        return area, self.evaluate(mass, area, panel, power)['ratio']
+
+    def break_even_mass(self, panel, power, target=1.0):
+        '''
+        Largest airframe mass (g) whose smallest break-even area still fits on
+        it, NaN where no area reaches target
+        '''
+        low, _ = self._panel_masses(panel, power, target)
+        return (self.max_area_ratio * self.sigmas[panel] / low)**3 / self.rho**2
+
+    def sweep(self, masses, areas, panels, powers, target=1.0, chunk=chunk):
+        '''
+        Every combination of masses (g), areas (m^2), panels (names) and
+        powers (W/g), evaluated chunk designs at a time. One row per
+        (mass, panel, power): how many of the areas are feasible (ratio >=
+        target and fitting), the feasible range and the best ratio on the
+        grid, next to the exact break-even areas, best design and break-even mass
+        '''
+        masses, areas, powers = np.asarray(masses, dtype=float), np.asarray(areas, dtype=float), np.asarray(powers, dtype=float)
+        panels = np.array([self.names.index(name) for name in panels])
+        shape = (len(masses), len(panels), len(powers))
+        groups = int(np.prod(shape))
+        feasible = np.zeros(groups, dtype=np.int64)
+        lowest, highest, best_ratio = np.full(groups, np.nan), np.full(groups, np.nan), np.zeros(groups)
+        # areas vary fastest, so a chunk is whole rows of (mass, panel, power) x areas
+        step = max(1, chunk // len(areas))
+        for first in range(0, groups, step):
+            group = np.arange(first, min(first + step, groups))
+            i, j, k = np.unravel_index(group, shape)
+            result = self.evaluate(masses[i, None], areas, panels[j, None], powers[k, None])
+            ok = (result['ratio'] >= target) & result['fits']
+            feasible[group] = ok.sum(axis=1)
+            fitting = np.where(result['fits'], result['ratio'], 0.0)
+            best_ratio[group] = fitting.max(axis=1)
+            any_ok = ok.any(axis=1)
+            # first and last feasible area (the feasible areas of a row are contiguous)
+            lowest[group[any_ok]] = areas[np.argmax(ok[any_ok], axis=1)]
+            highest[group[any_ok]] = areas[len(areas) - 1 - np.argmax(ok[any_ok, ::-1], axis=1)]
+        i, j, k = np.unravel_index(np.arange(groups), shape)
+        mass, panel, power = masses[i], panels[j], powers[k]
+        low, high = self.break_even_area(mass, panel, power, target)
+        best_area, best_exact = self.best(mass, panel, power)
+        room = self.max_area(mass)
+        return pd.DataFrame({'mass (g)': mass, 'panel': np.array(self.names)[panel], 'hover power (W/g)': power,
+                             'max area (m2)': room, 'feasible areas': feasible,
+                             'grid min area (m2)': lowest, 'grid max area (m2)': highest, 'grid best ratio': best_ratio,
+                             'min area (m2)': low, 'max useful area (m2)': high, 'feasible': low <= room,
+                             'best area (m2)': best_area, 'best ratio': best_exact, 'best duty cycle': best_exact / (1 + best_exact),
+                             'break-even mass (g)': self.break_even_mass(panel, power, target)})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sweep airframe mass, panel area, panel configuration and hover power of solar-powered hovering designs')
+    parser.add_argument('--masses', type=float, nargs=3, default=[0.1, 10000, 400], metavar=('MIN', 'MAX', 'N'), help='Airframe masses (g), log spaced')
+    parser.add_argument('--areas', type=float, nargs=3, default=[1e-4, 10, 500], metavar=('MIN', 'MAX', 'N'), help='Panel areas (m^2), log spaced')
+    parser.add_argument('--powers', type=float, nargs=3, default=[0.01, 1, 50], metavar=('MIN', 'MAX', 'N'), help='Hover power per gram of airframe (W/g), log spaced')
+    parser.add_argument('-p', '--panels', type=str, nargs='+', help='Panel configurations (default all in the lookup table)')
+    parser.add_argument('-r', '--ratio', type=float, default=1.0, help='Harvested / hover power a design needs (1: continuous hover, 0.05: about 5%% of the time in the air)')
+    parser.add_argument('-l', '--lux', type=float, default=design_lux, help='Light the panels get (lux)')
+    parser.add_argument('--max_area_ratio', type=float, default=max_area_ratio, help='Largest panel area / l^2 an airframe can carry')
+    parser.add_argument('--drone_data', type=str, default='../data/drone-data.ods', help='Drones of the scaling argument')
+    parser.add_argument('--lookup', type=str, default='../data/charging-lookup.csv', help='Charging lookup table (charging_model.py)')
+    parser.add_argument('-o', '--output', type=str, default='../design-sweep.csv', help='Feasibility per (mass, panel, power)')
+    args = parser.parse_args()
+
+    rho, gamma, rho_p = scaling_fits(*read_drone_data(args.drone_data))
+    mass, length = crossover(rho, gamma)
+    print('Scaling fits: rho = {:.0f} g/m3, gamma = {:.0f} g/m2, rho_p = {:.3f} W/g; aircraft and PV cell size meet at {:.3g} g, {:.1f} mm'.format(rho, gamma, rho_p, mass, 1000 * length))
+    yields = panel_yields(args.lookup, args.lux)
+    space = DesignSpace(yields, rho, args.max_area_ratio)
+    panels = args.panels or space.names
+    for name in panels:
+        k = space.names.index(name)
+        # the ratio peaks at c = critical, ie. y / (sigma * rho_p * critical) with the panel mass free
+        peak = space.yields[k] / (space.sigmas[k] * rho_p * critical)
+        limit = space.break_even_mass(k, rho_p, args.ratio)
+        print('{}: {:.1f} W/m2 at {:.0f} lux ({:.1%} charger efficiency), {:.0f} g/m2; at rho_p the ratio peaks at {:.3g}{}'.format(
+            name, space.yields[k], args.lux, yields[name][2], space.sigmas[k], peak,
+            ', reaching {:g} up to {:.3g} g of airframe'.format(args.ratio, limit) if np.isfinite(limit) else ''))
+    masses = np.logspace(np.log10(args.masses[0]), np.log10(args.masses[1]), int(args.masses[2]))
+    areas = np.logspace(np.log10(args.areas[0]), np.log10(args.areas[1]), int(args.areas[2]))
+    powers = np.logspace(np.log10(args.powers[0]), np.log10(args.powers[1]), int(args.powers[2]))
+    designs = len(masses) * len(areas) * len(panels) * len(powers)
+    start = time.perf_counter()
+    table = space.sweep(masses, areas, panels, powers, args.ratio)
+    elapsed = time.perf_counter() - start
+    print('{} designs in {:.2f} s ({:.3g} designs/s)'.format(designs, elapsed, designs / elapsed))
+    print('{} of {} (mass, panel, power) combinations reach a ratio of {:g}'.format(int(table['feasible'].sum()), len(table), args.ratio))
+    regions = table[table['feasible']].groupby(['panel', 'hover power (W/g)'])['mass (g)'].max()
+    if len(regions):
+        print('Largest feasible airframe mass (g) on the grid, per panel and hover power:')
+        # about ten of the powers
+        summary = regions.unstack(0).iloc[::max(1, len(powers) // 10)]
+        print(summary.to_string(float_format='{:.3g}'.format))
+    table.to_csv(args.output, index=False)
+    print('Saved {}'.format(args.output))
@@ -0,0 +1,120 @@
+import numpy as np
+
+
+def _bin_extrema(bin_ids, values):
+    '''
+    Indices of the smallest and the largest value in every occupied bin,
+    sorted (so the original sample order is kept)
+    '''
+    if len(values) == 0:
+        return np.zeros(0, dtype=int)
+    # Sort by bin first, then by value within each bin
+    order = np.lexsort((values, bin_ids))
+    sorted_bins = bin_ids[order]
+    first = np.flatnonzero(np.r_[True, sorted_bins[1:] != sorted_bins[:-1]])
+    last = np.r_[first[1:] - 1, len(order) - 1]
+    return np.unique(np.concatenate((order[first], order[last])))
+
+
+def axes_pixels(ax, dpi=None):
+    '''
+    Size (width, height) of the axes in pixels at the given dpi
+    (defaults to the figure dpi)
+    '''
+    fig = ax.get_figure()
+    if dpi is None:
+        dpi = fig.dpi
+    bbox = ax.get_window_extent().transformed(fig.dpi_scale_trans.inverted())
+    return max(int(np.ceil(bbox.width * dpi)), 1), max(int(np.ceil(bbox.height * dpi)), 1)
+
+
+def minmax_downsample(t, y, n_bins):
+    '''
+    Per-bin min/max downsampling of a time series.
+    t is split into n_bins equal bins (eg. one per horizontal pixel) and only
+    the smallest and largest y of each bin, plus the first and last samples,
+    are kept. Returns the indices of the kept samples, in order.
+    '''
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(t) <= 2 * n_bins:
+        return np.arange(len(t))
+    t0, t1 = t[0], t[-1]
+    span = t1 - t0 if t1 > t0 else 1.0
+    bin_ids = np.minimum(((t - t0) / span * n_bins).astype(int), n_bins - 1)
+    idx = _bin_extrema(bin_ids, y)
+    return np.unique(np.r_[0, idx, len(t) - 1])
+
+
+def lttb(t, y, n_out):
+    '''
+    Largest-Triangle-Three-Buckets downsampling of a time series to n_out samples.
+    Keeps the visual shape (peaks and troughs) of the curve. Returns the
+    indices of the kept samples, in order.
+    '''
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(t)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # First and last samples are always kept, the rest is split into n_out-2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    idx = np.zeros(n_out, dtype=int)
+    idx[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        # average point of the next bucket (or the last sample)
+        if i < n_out - 3:
+            next_start, next_stop = edges[i + 1], edges[i + 2]
+            t_avg, y_avg = t[next_start:next_stop].mean(), y[next_start:next_stop].mean()
+        else:
+            t_avg, y_avg = t[-1], y[-1]
+        # pick the point forming the largest triangle with the previously selected point and the next average
+        areas = np.abs((t[a] - t_avg) * (y[start:stop] - y[a]) - (t[a] - t[start:stop]) * (y_avg - y[a]))
+        a = start + np.argmax(areas)
+        idx[i + 1] = a
+    return idx
+
+
+def trajectory_downsample(x, y, c, shape, extent=None):
+    '''
+    Per-pixel min/max downsampling of a colored trajectory (eg. x, y colored by z).
+    The plane is split into shape=(width, height) pixels over extent=(left, right, bottom, top)
+    (defaults to the data bounds) and only the samples with the smallest and
+    largest c in each pixel are kept, so the color extremes are still visible.
+    Samples outside the extent are dropped. Returns the indices of the kept samples, in order.
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    c = np.asarray(c, dtype=float)
+    width, height = shape
+    if extent is None:
+        extent = (np.min(x), np.max(x), np.min(y), np.max(y))
+    left, right, bottom, top = extent
+    xspan = right - left if right > left else 1.0
+    yspan = top - bottom if top > bottom else 1.0
+    ix = np.floor((x - left) / xspan * width).astype(int)
+    iy = np.floor((y - bottom) / yspan * height).astype(int)
+    # Samples right on the top/right edge belong to the last pixel
+    ix[x == right] = width - 1
+    iy[y == top] = height - 1
+    visible = np.flatnonzero((ix >= 0) & (ix < width) & (iy >= 0) & (iy < height))
+    return visible[_bin_extrema(iy[visible] * width + ix[visible], c[visible])]
+
+
+def downsampled_scatter(ax, x, y, c=None, dpi=300, extent=None, rasterized=True, **kwargs):
+    '''
+    Drop-in replacement for ax.scatter for long trajectories: samples are reduced
+    to the per-pixel color extremes at the given output dpi and, if rasterized,
+    drawn as a single image in vector outputs (eps/pdf), so drawing time and
+    file size don't grow with the length of the log.
+    '''
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if c is not None and np.ndim(c) > 0 and len(c) == len(x):
+        idx = trajectory_downsample(x, y, c, axes_pixels(ax, dpi), extent=extent)
+        c = np.asarray(c)[idx]
+    else:
+        idx = trajectory_downsample(x, y, np.zeros(len(x)), axes_pixels(ax, dpi), extent=extent)
+    return ax.scatter(x[idx], y[idx], c=c, rasterized=rasterized, **kwargs)
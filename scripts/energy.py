@@ -0,0 +1,120 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd  # to write csv, more convenient than csv module
+from charging_model import battery_capacity, charge_needed_from_vbat
+
+
+nominal_vbat = 3.7          # V, to express the capacity in Wh
+hover_power = 7.9           # W, a 250 mAh battery lasts about 7 min in hover
+grid_period = 10            # ms, thrust is interpolated on this grid before integrating
+distance_period = 500       # ms, x/y are averaged over blocks this long before summing steps (estimator noise isn't distance)
+
+
+def read_phases(datadir):
+    '''
+    (start timestamps, phase names) of a flight. From phase.csv (written by
+    the controller at every mission transition) if present, otherwise just
+    'flight' and 'flatness-check' from the checking_flatness column of pos.csv
+    '''
+    phase_file = os.path.join(datadir, 'phase.csv')
+    if os.path.isfile(phase_file):
+        phases = np.genfromtxt(phase_file, delimiter=',', dtype=None, encoding=None)
+        phases = np.atleast_1d(phases)
+        return phases['f0'].astype(np.int64), phases['f1'].astype(str)
+    pos = np.genfromtxt(os.path.join(datadir, 'pos.csv'), delimiter=',', dtype=None, encoding=None)
+    checking = pos['f4'].astype(str) == 'True'
+    starts = np.concatenate([[0], np.where(np.diff(checking))[0] + 1])
+    return pos['f0'][starts].astype(np.int64), np.where(checking[starts], 'flatness-check', 'flight')
+
+
+def phase_index(t, phase_start, phase_names, names):
+    '''
+    Index in names of the phase every timestamp in t belongs to (samples before the first phase count in it)
+    '''
+    current = np.maximum(np.searchsorted(phase_start, t, side='right') - 1, 0)
+    return np.array([names.index(name) for name in phase_names])[current]
+
+
+def relative_power(thrust, hover_thrust):
+    '''
+    Power relative to hover: induced power grows as thrust^1.5 (momentum theory)
+    '''
+    return (np.maximum(thrust, 0.0) / hover_thrust)**1.5
+
+
+def block_distance(t, x, y, start=None, period=distance_period):
+    '''
+    Horizontal steps (m) between the means of x/y over blocks of period (ms)
+    from start (default the first sample), and the mean time of the block
+    every step ends in
+    '''
+    block = ((t - (t[0] if start is None else start)) // period).astype(np.int64)
+    counts = np.bincount(block)
+    used = counts > 0
+    block_t, block_x, block_y = [np.bincount(block, weights=v)[used] / counts[used] for v in (t, x, y)]
+    return np.hypot(np.diff(block_x), np.diff(block_y)), block_t[1:]
+
+
+def energy_by_phase(datadir, hover_power=hover_power):
+    '''
+    Energy (Wh) spent in every phase of the flight logged in datadir.
+
+    Thrust is interpolated on a grid_period grid and turned into power with
+    relative_power() scaled to hover_power at the median thrust of the flight,
+    then integrated per phase. Also returns the duration and the horizontal
+    distance flown in every phase (over the time span of the thrust log too,
+    between x/y averaged over distance_period blocks), and the total energy
+    implied by the vbat drop as a cross-check.
+    '''
+    thrust = np.loadtxt(os.path.join(datadir, 'thrust.csv'), delimiter=',', ndmin=2)
+    vbat = np.loadtxt(os.path.join(datadir, 'vbat.csv'), delimiter=',', ndmin=2)
+    pos = np.genfromtxt(os.path.join(datadir, 'pos.csv'), delimiter=',', dtype=None, encoding=None)
+    phase_start, phase_names = read_phases(datadir)
+    names = list(dict.fromkeys(phase_names))
+
+    t = np.arange(thrust[0,0], thrust[-1,0] + 1, grid_period)
+    power = hover_power * relative_power(np.interp(t, thrust[:,0], thrust[:,1]), np.median(thrust[:,1]))
+    grid_phase = phase_index(t, phase_start, phase_names, names)
+    energy = np.bincount(grid_phase, weights=power * grid_period / 1000, minlength=len(names)) / 3600
+    duration = np.bincount(grid_phase, minlength=len(names)) * grid_period / 1000
+
+    # distance over the same time span as the energy, between block means of x/y
+    inside = (pos['f0'] >= thrust[0,0]) & (pos['f0'] <= thrust[-1,0])
+    step, step_t = block_distance(pos['f0'][inside], pos['f1'][inside], pos['f2'][inside], start=thrust[0,0])
+    pos_phase = phase_index(step_t, phase_start, phase_names, names)
+    distance = np.bincount(pos_phase, weights=step, minlength=len(names))
+
+    vbat_energy = (charge_needed_from_vbat(vbat[-1,1]) - charge_needed_from_vbat(vbat[0,1])) * np.mean(vbat[:,1]) / 1000
+    return names, duration, energy, distance, vbat_energy
+
+
+def energy_report(datadir, hover_power=hover_power):
+    '''
+    Per-phase report: duration, energy in Wh and % of the battery capacity, distance and Wh per metre
+    '''
+    names, duration, energy, distance, vbat_energy = energy_by_phase(datadir, hover_power)
+    capacity = battery_capacity * nominal_vbat / 1000
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_metre = np.where(distance > 0.01, energy / distance, np.nan)
+    report = pd.DataFrame({'phase': names, 'duration (s)': duration, 'energy (Wh)': energy,
+                           'capacity (%)': 100 * energy / capacity, 'distance (m)': distance, 'energy per metre (Wh/m)': per_metre})
+    total = pd.DataFrame({'phase': ['total'], 'duration (s)': [duration.sum()], 'energy (Wh)': [energy.sum()],
+                          'capacity (%)': [100 * energy.sum() / capacity], 'distance (m)': [distance.sum()],
+                          'energy per metre (Wh/m)': [energy.sum() / distance.sum() if distance.sum() > 0.01 else np.nan]})
+    return pd.concat([report, total], ignore_index=True), vbat_energy
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Energy spent in every phase of a logged flight')
+    parser.add_argument('-d', '--datadir', type=str, default='../data/', help='Directory with pos.csv, thrust.csv, vbat.csv and optionally phase.csv')
+    parser.add_argument('-p', '--hover_power', type=float, default=hover_power, help='Power drawn in hover (W)')
+    parser.add_argument('-o', '--output', type=str, help='Save the report as csv')
+    args = parser.parse_args()
+
+    report, vbat_energy = energy_report(args.datadir, args.hover_power)
+    print(report.to_string(index=False, float_format='{:.4g}'.format))
+    print('Energy from the vbat drop: {:.4g} Wh ({:.1f}% of capacity)'.format(vbat_energy, 100 * vbat_energy / (battery_capacity * nominal_vbat / 1000)))
+    if args.output:
+        report.to_csv(args.output, index=False)
+        print('Saved {}'.format(args.output))
@@ -0,0 +1,240 @@
+import argparse
+import os
+import numpy as np
+
+
+# thresholds as in controller.py
+light_thresh = 1000         # lux
+dist_thresh = 220           # mm
+vbat_threshold = 2.8        # V
+# columns whose per-span mean / std are answered from prefix sums
+summed = [('pos', 'z'), ('intensity', 'intensity'), ('vbat', 'vbat'), ('thrust', 'thrust')]
+
+
+def runs(flag):
+    '''
+    (first, end) row indices of every run of True in a boolean array
+    '''
+    edges = np.flatnonzero(np.diff(np.asarray(flag, dtype=np.int8), prepend=0, append=0))
+    return edges[::2], edges[1::2]
+
+
+def intersect(a, b):
+    '''
+    Intersection of two lists of sorted, disjoint, half-open spans (starts, ends)
+    '''
+    (a_starts, a_ends), (b_starts, b_ends) = a, b
+    # the b spans overlapping every a span are the contiguous range j0:j1
+    j0 = np.searchsorted(b_ends, a_starts, side='right')
+    j1 = np.searchsorted(b_starts, a_ends, side='left')
+    counts = np.maximum(j1 - j0, 0)
+    i = np.repeat(np.arange(len(a_starts)), counts)
+    j = np.repeat(j0 - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    return np.maximum(a_starts[i], b_starts[j]), np.minimum(a_ends[i], b_ends[j])
+
+
+class IntervalIndex:
+    '''
+    Time spans [start, end) (ms, drone timestamps) of the events of a flight,
+    from the first sample of a run to the sample after it, built once from
+    its logs: 'flatness-check' (checking_flatness), 'lit'
+    (intensity above light_thresh), 'obstacle' and 'obstacle.<direction>'
+    (range below dist_thresh), 'low-vbat' (below vbat_threshold) and
+    'phase.<name>' for the phases in phase.csv.
+
+    Spans of one kind are sorted and disjoint, so overlapping() and
+    contains() are binary searches and intersect() a merge. The index also
+    keeps prefix sums of z, intensity, vbat and thrust, so stats() gives the
+    mean and std of a column over any spans in O(log n) each instead of
+    scanning the samples.
+    '''
+
+    def __init__(self, spans, sums, thresholds=None):
+        # kind -> (starts, ends); 'stream.column' -> (t, sum, sum of squares, reference), prefix sums
+        # starting at 0 of the values minus the reference (the first value, against cancellation in the std)
+        self.spans = spans
+        self.sums = sums
+        self.thresholds = thresholds or {}
+
+    @classmethod
+    def build(cls, data, light_thresh=light_thresh, dist_thresh=dist_thresh, vbat_threshold=vbat_threshold, phases=None):
+        '''
+        Index of the logs of a flight (telemetry_archive.load() layout),
+        phases as (start timestamps, names) like energy.read_phases()
+        '''
+        def add(kind, t, flag):
+            first, end = runs(flag)
+            # a run at the end of the log lasts one more sampling period
+            after = np.r_[t[1:], t[-1] + (t[-1] - t[-2] if len(t) > 1 else 1)] if len(t) else t
+            spans[kind] = (t[first], after[end - 1])
+
+        spans = {}
+        if 'pos' in data:
+            add('flatness-check', data['pos']['t'], data['pos']['checking_flatness'])
+        if 'intensity' in data:
+            add('lit', data['intensity']['t'], data['intensity']['intensity'] > light_thresh)
+        if 'range' in data:
+            directions = ['left', 'front', 'right', 'back']
+            near = np.array([data['range'][d] < dist_thresh for d in directions])
+            add('obstacle', data['range']['t'], near.any(axis=0))
+            for direction, flag in zip(directions, near):
+                add('obstacle.' + direction, data['range']['t'], flag)
+        if 'vbat' in data:
+            add('low-vbat', data['vbat']['t'], data['vbat']['vbat'] < vbat_threshold)
+        if phases is not None and 'pos' in data and len(data['pos']['t']):
+            phase_start, phase_names = phases
+            # a phase lasts until the next one starts, the last one until the end of the log
+            phase_end = np.r_[phase_start[1:], data['pos']['t'][-1] + 1]
+            for name in dict.fromkeys(phase_names):
+                mask = phase_names == name
+                spans['phase.' + name] = (phase_start[mask], phase_end[mask])
+        sums = {}
+        for stream, column in summed:
+            if stream in data and len(data[stream]['t']):
+                values = np.asarray(data[stream][column], dtype=float)
+                reference = values[0]
+                values = values - reference
+                sums[stream + '.' + column] = (data[stream]['t'], np.r_[0.0, np.cumsum(values)], np.r_[0.0, np.cumsum(values**2)], reference)
+        return cls(spans, sums, {'light_thresh': light_thresh, 'dist_thresh': dist_thresh, 'vbat_threshold': vbat_threshold})
+
+    @classmethod
+    def for_flight(cls, flight, cache=True, rebuild=False, **thresholds):
+        '''
+        Index of a flight (directory, pos log or .cfta, see batch_analysis),
+        saved next to it (cache) and only rebuilt when the logs or thresholds
+        change, or with rebuild
+        '''
+        if os.path.isdir(flight):
+            filename = os.path.join(flight, 'index.npz')
+            sources = [os.path.join(flight, f) for f in os.listdir(flight) if f.endswith('.csv')]
+        else:
+            filename = flight + '.index.npz'
+            sources = [flight]
+        thresholds = dict({'light_thresh': light_thresh, 'dist_thresh': dist_thresh, 'vbat_threshold': vbat_threshold}, **thresholds)
+        mtime = max(os.path.getmtime(source) for source in sources)
+        if cache and not rebuild and os.path.isfile(filename) and os.path.getmtime(filename) >= mtime:
+            try:
+                index = cls.load(filename)
+            except KeyError:
+                # saved by an older version
+                index = None
+            if index is not None and index.thresholds == thresholds:
+                return index
+        from batch_analysis import load_flight
+        data = load_flight(flight)
+        phases = None
+        phase_file = os.path.join(flight, 'phase.csv')
+        if os.path.isdir(flight) and os.path.isfile(phase_file) and os.path.getsize(phase_file):
+            phase_log = np.atleast_1d(np.genfromtxt(phase_file, delimiter=',', dtype=None, encoding=None))
+            phases = phase_log['f0'].astype(np.int64), phase_log['f1'].astype(str)
+        index = cls.build(data, phases=phases, **thresholds)
+        if cache:
+            index.save(filename)
+        return index
+
+    @property
+    def kinds(self):
+        return list(self.spans)
+
+    def _spans(self, kind):
+        return self.spans[kind] if isinstance(kind, str) else kind
+
+    def overlapping(self, kind, t0, t1):
+        '''
+        Spans of kind overlapping [t0, t1)
+        '''
+        starts, ends = self._spans(kind)
+        first, last = np.searchsorted(ends, t0, side='right'), np.searchsorted(starts, t1, side='left')
+        return starts[first:last], ends[first:last]
+
+    def contains(self, kind, t):
+        '''
+        Whether each of the timestamps t falls in a span of kind
+        '''
+        starts, ends = self._spans(kind)
+        if not len(starts):
+            return np.zeros(np.shape(t), dtype=bool)
+        i = np.searchsorted(starts, t, side='right') - 1
+        return (i >= 0) & (np.asarray(t) < ends[np.maximum(i, 0)])
+
+    def intersect(self, *kinds):
+        '''
+        Spans where all the kinds (names or (starts, ends)) hold at once, eg. intersect('lit', 'flatness-check')
+        '''
+        spans = self._spans(kinds[0])
+        for kind in kinds[1:]:
+            spans = intersect(spans, self._spans(kind))
+        return spans
+
+    def duration(self, kind):
+        '''
+        Total time (s) covered by the spans of kind
+        '''
+        starts, ends = self._spans(kind)
+        return float(np.sum(ends - starts)) / 1000
+
+    def rows(self, column, spans):
+        '''
+        (first, end) indices of the samples of a column (eg. 'pos.z') inside every span
+        '''
+        t = self.sums[column][0]
+        starts, ends = self._spans(spans)
+        return np.searchsorted(t, starts, side='left'), np.searchsorted(t, ends, side='left')
+
+    def stats(self, column, spans):
+        '''
+        (samples, mean, std) of a column (eg. 'pos.z') over every span
+        '''
+        _, s1, s2, reference = self.sums[column]
+        first, end = self.rows(column, spans)
+        n = end - first
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = (s1[end] - s1[first]) / n
+            std = np.sqrt(np.maximum((s2[end] - s2[first]) / n - mean**2, 0.0))
+        return n, mean + reference, std
+
+    def save(self, filename):
+        arrays = {}
+        for kind, (starts, ends) in self.spans.items():
+            arrays['span_' + kind] = np.array([starts, ends])
+        for column, (t, s1, s2, reference) in self.sums.items():
+            arrays['t_' + column], arrays['sums_' + column], arrays['reference_' + column] = t, np.array([s1, s2]), reference
+        for name, value in self.thresholds.items():
+            arrays['threshold_' + name] = value
+        # np.savez appends .npz to names without it
+        with open(filename, 'wb') as filehandle:
+            np.savez(filehandle, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        data = np.load(filename)
+        spans = {name[len('span_'):]: tuple(data[name]) for name in data.files if name.startswith('span_')}
+        sums = {}
+        for name in data.files:
+            if name.startswith('t_'):
+                column = name[len('t_'):]
+                sums[column] = (data[name], *data['sums_' + column], float(data['reference_' + column]))
+        thresholds = {name[len('threshold_'):]: data[name].item() for name in data.files if name.startswith('threshold_')}
+        return cls(spans, sums, thresholds)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the interval index of a flight and list its spans')
+    parser.add_argument('flight', type=str, nargs='?', default='../data/flatness-check', help='Flight directory, pos log or .cfta archive')
+    parser.add_argument('--light_thresh', type=float, default=light_thresh, help='Intensity counted as lit (lux)')
+    parser.add_argument('--dist_thresh', type=float, default=dist_thresh, help='Range counted as an obstacle (mm)')
+    parser.add_argument('--vbat_threshold', type=float, default=vbat_threshold, help='Low battery voltage (V)')
+    parser.add_argument('--rebuild', action='store_true', default=False, help='Rebuild the saved index')
+    args = parser.parse_args()
+
+    index = IntervalIndex.for_flight(args.flight, rebuild=args.rebuild, light_thresh=args.light_thresh,
+                                     dist_thresh=args.dist_thresh, vbat_threshold=args.vbat_threshold)
+    for kind in index.kinds:
+        starts, ends = index.spans[kind]
+        print('{:16s} {:4d} spans, {:7.2f} s'.format(kind, len(starts), index.duration(kind)))
+    if 'pos.z' in index.sums and 'flatness-check' in index.spans:
+        n, _, std = index.stats('pos.z', 'flatness-check')
+        lit_checks = index.intersect('flatness-check', 'lit') if 'lit' in index.spans else ([], [])
+        for start, end, samples, sigma in zip(*index.spans['flatness-check'], n, std):
+            print('flatness check {}-{} ms: {} samples, std of z {:.1f} mm'.format(start, end, samples, 1000 * sigma))
+        print('{} flatness-check spans in the light'.format(len(lit_checks[0])))
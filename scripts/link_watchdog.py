@@ -0,0 +1,188 @@
+import threading
+import time
+from cflib.crazyflie.log import LogConfig
+
+
+class LinkWatchdog:
+    '''
+    Detects a dropped radio link and reconnects without ending the flight.
+
+    The link is considered lost when no log packet has arrived for
+    stall_periods periods of the fastest started LogConfig (at least
+    min_stall seconds), or right away when cflib reports connection_lost.
+    The supervision thread then closes the radio link and opens it again
+    with the same Crazyflie object, whose TOC cache (rw_cache) makes the
+    reconnection a CRC check instead of a TOC download. Logging is
+    registered again as soon as the log TOC is there (connected, without
+    waiting for the parameter values), with fresh copies of the watched
+    LogConfigs sharing their callbacks, so the samples keep going to the
+    same files. A connection attempt is given connect_timeout seconds and
+    retried until it succeeds or stop() is called.
+
+    Code keeps using the LogConfigs it passed to watch(): start_logging()
+    and stop_logging() act on whichever copy is current. on_lost(host) and
+    on_restored(host, outage, attempts) are called from the supervision
+    thread so the outage can be recorded; outages keeps
+    (lost host time, outage s, attempts) of every recovery.
+    '''
+
+    def __init__(self, cf, uri, stall_periods=3, min_stall=0.2, connect_timeout=2.0, check_interval=0.02,
+                 on_lost=None, on_restored=None, output=print):
+        self.cf = cf
+        self.uri = uri
+        self.stall_periods = stall_periods
+        self.min_stall = min_stall
+        self.connect_timeout = connect_timeout
+        self.check_interval = check_interval
+        self.on_lost = on_lost
+        self.on_restored = on_restored
+        self.output = output
+        # watched LogConfig -> copy registered on the current connection
+        self.current = {}
+        self.started = set()
+        self.outages = []
+        self.last_arrival = time.monotonic()
+        self.link_up = cf.is_connected()
+        self._connected = threading.Event()
+        # whether the last attempt ended with the connected callback (not failed, not timed out)
+        self._connect_ok = False
+        self._lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        cf.connected.add_callback(self._connected_cb)
+        cf.connection_failed.add_callback(self._failed_cb)
+        cf.connection_lost.add_callback(self._lost_cb)
+
+    def _connected_cb(self, uri):
+        self._connect_ok = True
+        self._connected.set()
+
+    def _failed_cb(self, uri, message):
+        # wake up connect() to retry right away
+        self._connect_ok = False
+        self._connected.set()
+
+    def _lost_cb(self, uri, message):
+        self._lost.set()
+
+    def _arrived(self, timestamp, data, logconf):
+        self.last_arrival = time.monotonic()
+
+    def connect(self, timeout=None):
+        '''
+        Open the link and wait until the log TOC is available, returns whether it is
+        '''
+        self._connect_ok = False
+        self._connected.clear()
+        self.cf.open_link(self.uri)
+        # only the connected callback counts, cf.is_connected() may still be True from before a stall
+        self.link_up = self._connected.wait(self.connect_timeout if timeout is None else timeout) and self._connect_ok
+        return self.link_up
+
+    def watch(self, logconf):
+        '''
+        Add logconf to the Crazyflie and register it again after every reconnection
+        '''
+        self.cf.log.add_config(logconf)
+        logconf.data_received_cb.add_callback(self._arrived)
+        self.current[logconf] = logconf
+        return logconf
+
+    def start_logging(self, logconf):
+        self.started.add(logconf)
+        self.last_arrival = time.monotonic()
+        self.current[logconf].start()
+
+    def stop_logging(self, logconf):
+        self.started.discard(logconf)
+        if self.link_up:
+            self.current[logconf].stop()
+
+    @property
+    def stall_time(self):
+        '''
+        Seconds without log packets after which the link is considered lost
+        '''
+        if not self.started:
+            return float('inf')
+        return max(self.stall_periods * min(logconf.period_in_ms for logconf in self.started) / 1000, self.min_stall)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='link-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self, stop_logging=True):
+        '''
+        Stop supervising (eg. before landing) and, by default, logging
+        '''
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if stop_logging:
+            for logconf in list(self.started):
+                self.stop_logging(logconf)
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            if self._lost.is_set() or time.monotonic() - self.last_arrival > self.stall_time:
+                self.recover()
+
+    def recover(self):
+        '''
+        Reconnect and restart logging, blocks until the link is back (or stop())
+        '''
+        lost = time.time()
+        start = time.monotonic()
+        self.link_up = False
+        self.output('Link lost ({:.0f} ms without log packets), reconnecting'.format(1000 * (start - self.last_arrival)))
+        if self.on_lost is not None:
+            self.on_lost(lost)
+        attempts = 0
+        while not self._stop.is_set():
+            attempts += 1
+            self._close()
+            self._lost.clear()
+            if self.connect() and self._relog():
+                break
+            self.output('Reconnection attempt {} failed'.format(attempts))
+        else:
+            return
+        outage = time.monotonic() - start
+        self.outages.append((lost, outage, attempts))
+        self.last_arrival = time.monotonic()
+        self.output('Link restored after {:.0f} ms ({} attempt{})'.format(1000 * outage, attempts, 's' if attempts > 1 else ''))
+        if self.on_restored is not None:
+            self.on_restored(time.time(), outage, attempts)
+
+    def _close(self):
+        # not cf.close_link(): it sends a zero thrust setpoint first, which
+        # would drop the drone if the link was only degraded
+        link, self.cf.link = self.cf.link, None
+        if link is not None:
+            link.close()
+        # what cflib's disconnected callback does, so is_connected() is False until the link is back
+        self.cf.connected_ts = None
+
+    def _relog(self):
+        '''
+        Register fresh copies of the watched LogConfigs (the drone reset its
+        log blocks on connection) and start the ones that were started
+        '''
+        try:
+            for logconf in self.current:
+                copy = LogConfig(name=logconf.name, period_in_ms=logconf.period_in_ms)
+                copy.variables = list(logconf.variables)
+                copy.default_fetch_as = list(logconf.default_fetch_as)
+                # same callbacks (including _arrived), so the samples go to the same files
+                copy.data_received_cb = logconf.data_received_cb
+                self.cf.log.add_config(copy)
+                self.current[logconf] = copy
+            for logconf in self.started:
+                self.current[logconf].start()
+        except (AttributeError, KeyError) as error:
+            # the link went down again while adding the configs
+            self.output('Could not restart logging: {}'.format(error))
+            return False
+        return True
@@ -0,0 +1,279 @@
+import math
+import time
+
+
+# Mission states
+SEEK_LIGHT = 'seek-light'
+AVOID = 'avoid'
+FLATNESS_CHECK = 'flatness-check'
+RELOCATE = 'relocate'
+LAND = 'land'
+# seconds to hover still when entering a state, unless Mission gets settle_times
+default_settle_times = {FLATNESS_CHECK: 0.3}
+
+
+class Mission:
+    '''
+    Non-blocking landing site selection: seek light, avoid obstacles, check
+    flatness, relocate, land.
+
+    tick() is called from the control loop as often as possible. Every
+    tick_period it reads the latest sensor snapshots, advances the current
+    state and only sends a new MotionCommander setpoint (start_linear_motion / stop) when the
+    commanded velocity changes, so the loop stays responsive (key presses,
+    telemetry) and every state can be preempted on the next sample: an
+    obstacle preempts seeking light, relocating or a flatness check, losing the
+    light while relocating goes back to seeking it. Moves are legs of a given
+    distance that end on the position estimate (with a time-based fallback),
+    so there are no fixed sleeps; the only waits are the per-state settle
+    times in settle_times. With a trajectory the flatness check flies it
+    instead of the square, as velocity setpoints along its speed profile.
+    While measuring, surface_check() (if given) is called every tick and may
+    return a reason to reject the site before the check is finished (eg. the
+    surface classifier recognizing grass), None otherwise.
+    '''
+
+    def __init__(self, mc, position, ranges, light, z_sums, set_checking_flatness,
+                 forward_vel=0.2, strafe_vel=0.2, square_side=0.4, light_thresh=1000, dist_thresh=220,
+                 fwd_distance=0.4, flatness_threshold=0.015, trajectory=None, tick_period=0.05, settle_times=None, leg_timeout=1.5,
+                 surface_check=None, on_transition=None, verbose=True, output=print):
+        self.mc = mc
+        self.position, self.ranges, self.light, self.z_sums = position, ranges, light, z_sums
+        self.set_checking_flatness = set_checking_flatness
+        self.forward_vel, self.strafe_vel = forward_vel, strafe_vel
+        self.square_side = square_side
+        self.light_thresh, self.dist_thresh = light_thresh, dist_thresh
+        self.fwd_distance = fwd_distance
+        self.flatness_threshold = flatness_threshold
+        # continuous flatness-check path (trajectories.Trajectory), None for the square legs
+        self.trajectory = trajectory
+        self.trajectory_start = None
+        # tick() only steps the mission every tick_period seconds
+        self.tick_period = tick_period
+        self.last_tick = float('-inf')
+        # seconds to hover still when entering a state (eg. before measuring flatness)
+        self.settle_times = dict(default_settle_times) if settle_times is None else settle_times
+        # legs end after leg_timeout times their nominal duration even without position updates
+        self.leg_timeout = leg_timeout
+        # early rejection of the site while measuring, None to always finish the check
+        self.surface_check = surface_check
+        # called with the new state at every transition (eg. to log the phases of the flight)
+        self.on_transition = on_transition
+        self.verbose = verbose
+        self.output = output
+        self.position_buf, self.range_buf, self.light_buf = position.new_buffer(), ranges.new_buffer(), light.new_buffer()
+        self.z_start = z_sums.new_buffer()
+        self.z_end = z_sums.new_buffer()
+        self.flatness = None
+        self.flatness_checks = 0
+        self.measuring = False
+        self.resume_state = SEEK_LIGHT
+        self.state = None
+        self.command = None
+        self.legs = []
+        self.leg = None
+        self.transition(SEEK_LIGHT)
+
+    def log(self, message):
+        if self.verbose:
+            self.output(message)
+
+    @property
+    def done(self):
+        return self.state == LAND
+
+    def transition(self, state, now=None):
+        if now is None:
+            now = time.monotonic()
+        self.log('Mission: {} -> {}'.format(self.state, state))
+        if self.on_transition is not None:
+            self.on_transition(state)
+        if self.measuring:
+            # interrupted check, its samples are discarded
+            self.set_checking_flatness(False)
+            self.measuring = False
+        self.state = state
+        self.state_start = now
+        self.legs, self.leg = [], None
+        if state == FLATNESS_CHECK:
+            self.flatness = None
+            self.trajectory_start = None
+            if self.trajectory is None:
+                self.legs = self.flatness_legs()
+        elif state == RELOCATE:
+            self.legs = [(self.forward_vel, 0.0, self.fwd_distance, False)]
+        elif state == LAND:
+            self.move(0.0, 0.0)
+
+    def abort(self, now=None):
+        '''
+        Land where the drone is (eg. a sensor the mission relies on failed)
+        '''
+        if self.state != LAND:
+            self.log('Mission aborted, landing')
+            self.transition(LAND, now)
+
+    def discard_check(self, now=None):
+        '''
+        Throw away the flatness check in progress (eg. the z estimate drifted) and try another place
+        '''
+        if self.state == FLATNESS_CHECK:
+            self.log('Flatness check discarded. Checking flatness at another place...')
+            self.transition(RELOCATE, now)
+
+    def flatness_legs(self):
+        '''
+        Legs (vx, vy, distance, checking_flatness) of the flatness check: to the
+        bottom-left corner of the square, around it while measuring, back to the center
+        '''
+        side, f, s = self.square_side, self.forward_vel, self.strafe_vel
+        return [(0.0, s, side/2, False), (-s, 0.0, side/2, False),
+                (f, 0.0, side, True), (0.0, -s, side, True), (-s, 0.0, side, True), (0.0, s, side, True),
+                (f, 0.0, side/2, False), (0.0, -s, side/2, False)]
+
+    def move(self, vx, vy):
+        '''
+        Command a velocity, only talking to the drone if it changed
+        '''
+        if self.command == (vx, vy):
+            return
+        self.command = (vx, vy)
+        if vx == 0.0 and vy == 0.0:
+            self.mc.stop()
+        else:
+            self.mc.start_linear_motion(vx, vy, 0.0)
+
+    def obstacle(self):
+        '''
+        Index (left, front, right, back) of the closest obstacle within dist_thresh, or None.
+        0 mm readings are dropouts, not obstacles
+        '''
+        _, left, front, right, back = self.ranges.read(self.range_buf)
+        dists = [d if d > 0 else math.inf for d in (left, front, right, back)]
+        closest = min(range(4), key=dists.__getitem__)
+        return closest if dists[closest] <= self.dist_thresh else None
+
+    def avoid(self, obstacle):
+        '''
+        Move directly away from the obstacle (index from obstacle())
+        '''
+        f, s = self.forward_vel, self.strafe_vel
+        self.move(*[(0.0, -s), (-f, 0.0), (0.0, s), (f, 0.0)][obstacle])
+
+    def follow_legs(self, now):
+        '''
+        Advance the current leg; returns True once all legs are flown
+        '''
+        _, x, y, _ = self.position.read(self.position_buf)
+        if self.leg is not None:
+            vx, vy, distance, _ = self.legs[0]
+            x0, y0, t0 = self.leg
+            speed = math.hypot(vx, vy)
+            if math.hypot(x - x0, y - y0) >= distance or now - t0 >= self.leg_timeout * distance / speed:
+                self.legs.pop(0)
+                self.leg = None
+        if not self.legs:
+            if self.measuring:
+                self.stop_measuring()
+            return True
+        if self.leg is None:
+            vx, vy, _, checking = self.legs[0]
+            if checking and not self.measuring:
+                self.start_measuring()
+            elif not checking and self.measuring:
+                self.stop_measuring()
+            self.leg = (x, y, now)
+            self.move(vx, vy)
+        return False
+
+    def follow_check(self, now):
+        if self.trajectory is None:
+            return self.follow_legs(now)
+        return self.follow_trajectory(now)
+
+    def follow_trajectory(self, now):
+        '''
+        Fly the flatness-check trajectory, measuring all along; returns True once it is flown
+        '''
+        if self.trajectory_start is None:
+            self.trajectory_start = now
+            self.start_measuring()
+        velocity = self.trajectory.velocity(now - self.trajectory_start)
+        if velocity is None:
+            self.move(0.0, 0.0)
+            self.stop_measuring()
+            return True
+        self.move(*velocity)
+        return False
+
+    def start_measuring(self):
+        self.set_checking_flatness(True)
+        self.z_sums.read(self.z_start)
+        self.measuring = True
+
+    def stop_measuring(self):
+        '''
+        Standard deviation of z over the samples collected since start_measuring()
+        '''
+        self.set_checking_flatness(False)
+        self.measuring = False
+        z_start, z_end = self.z_start, self.z_sums.read(self.z_end)
+        n = max(z_end[0] - z_start[0], 1)
+        z_mean = (z_end[1] - z_start[1]) / n
+        self.flatness = math.sqrt(max((z_end[2] - z_start[2]) / n - z_mean**2, 0.0))
+
+    def tick(self, now=None):
+        '''
+        Advance the mission by one step. Returns False once it is time to land.
+        '''
+        if now is None:
+            now = time.monotonic()
+        state = self.state
+        if state == LAND:
+            return False
+        if now - self.last_tick < self.tick_period:
+            return True
+        self.last_tick = now
+        obstacle = self.obstacle()
+        if state == AVOID:
+            if obstacle is None:
+                self.transition(self.resume_state, now)
+            else:
+                self.avoid(obstacle)
+            return True
+        if obstacle is not None:
+            self.log('Obstacle ({}), avoiding....'.format(['left', 'front', 'right', 'back'][obstacle]))
+            # a flatness check interrupted by an obstacle is abandoned, look for another site
+            self.resume_state = SEEK_LIGHT if state == SEEK_LIGHT else RELOCATE
+            self.transition(AVOID, now)
+            self.avoid(obstacle)
+            return True
+        intensity = self.light.read(self.light_buf)[1]
+        if state == SEEK_LIGHT:
+            if intensity >= self.light_thresh:
+                self.log('Light intensity > threshold! Checking flatness...')
+                self.transition(FLATNESS_CHECK, now)
+            else:
+                self.move(self.forward_vel, 0.0)
+        elif state == RELOCATE:
+            if intensity < self.light_thresh:
+                self.transition(SEEK_LIGHT, now)
+            elif self.follow_legs(now):
+                self.transition(FLATNESS_CHECK, now)
+        elif state == FLATNESS_CHECK:
+            if now - self.state_start < self.settle_times.get(FLATNESS_CHECK, 0.0):
+                self.move(0.0, 0.0)
+            elif self.follow_check(now):
+                self.flatness_checks += 1
+                self.log('Standard deviation of zrange is: {}'.format(self.flatness))
+                if self.flatness is not None and self.flatness <= self.flatness_threshold:
+                    self.transition(LAND, now)
+                else:
+                    self.log('Not flat. Checking flatness at another place...')
+                    self.transition(RELOCATE, now)
+            elif self.measuring and self.surface_check is not None:
+                reason = self.surface_check()
+                if reason is not None:
+                    self.log('{}. Checking flatness at another place...'.format(reason))
+                    self.transition(RELOCATE, now)
+        return self.state != LAND
@@ -0,0 +1,326 @@
+import argparse
+import inspect
+import itertools
+import math
+import os
+import time
+from collections import deque
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd  # to write csv, more convenient than csv module
+from sensor_state import SensorState
+from mission import Mission
+from energy import hover_power
+from charging_model import ChargingLookup, charge_needed_from_vbat
+from trajectories import Trajectory, kinds
+from surface_classifier import SurfaceClassifier, model_file
+from interval_index import runs
+
+
+# controller parameters that can be swept, defaults as in controller.py (the Mission defaults)
+swept = ['light_thresh', 'dist_thresh', 'flatness_threshold', 'square_side', 'fwd_distance', 'sleep_time']
+mission_defaults = {name: p.default for name, p in inspect.signature(Mission).parameters.items() if p.default is not inspect.Parameter.empty}
+defaults = {name: mission_defaults['tick_period' if name == 'sleep_time' else name] for name in swept}
+# flatness check as flown by controller.py, the trajectory is swept too ('none' for the stop-and-go square)
+flatness_trajectory = 'circle'
+flatness_samples = 400      # z samples to collect per flatness check
+max_vel = 0.5               # m/s, top speed along the flatness-check trajectory
+landing_surfaces = ['flat']  # surfaces (of surface_classifier.py) the drone may land on
+surface_confidence = 0.95   # probability of another surface at which a flatness check is cut short
+
+# simulation
+dt = 0.01                   # s, position log period
+sensor_period = 0.02        # s, range and light updates
+takeoff_height = 0.3        # m
+velocity_tau = 0.2          # s, first order response of the velocity to setpoints
+drone_radius = 0.05         # m
+range_max = 4000            # mm, multiranger limit
+max_time = 600              # s of simulated flight before giving up
+# z noise (std, m) over the recorded surfaces (pos_<surface>.csv), rough ground is drawn from rough_std
+surface_std = {'flat': 0.0086, 'grass': 0.0080, 'gravel': 0.0104, 'tiles': 0.0112}
+rough_std = (0.02, 0.06)
+ground_types = list(surface_std) + ['rough']
+floor = 'flat'              # ground between the patches, the patches are the other ground types
+# over the recorded surfaces z replays their flatness checks, so the surface classifier sees real z
+noise_dir = '../data/flatness-check/'
+g = 9.81                    # m/s^2
+safe_roughness = 0.015      # m, a landing site is safe below this z std (independent of the swept threshold)
+grid_step = 0.02            # m, resolution of the light and roughness maps
+
+
+class Environment:
+    '''
+    Random arena: walls, round obstacles, lit patches over a dim background
+    and ground patches of the other recorded surfaces or rough ground over a
+    floor of the recorded flat surface
+    '''
+
+    def __init__(self, seed, size=6.0, n_obstacles=6, n_lights=5, n_grounds=8, ambient_lux=200, patch_lux=(1000, 5000)):
+        rng = np.random.default_rng(seed)
+        self.size = size
+        self.obstacles = np.column_stack([rng.uniform(-size/2 + 0.5, size/2 - 0.5, (n_obstacles, 2)), rng.uniform(0.1, 0.4, n_obstacles)])
+        self.lights = np.column_stack([rng.uniform(-size/2, size/2, (n_lights, 2)), rng.uniform(0.5, 1.5, n_lights), rng.uniform(*patch_lux, n_lights)])
+        self.ambient_lux = ambient_lux * rng.lognormal(0, 0.3)
+        grounds = np.column_stack([rng.uniform(-size/2, size/2, (n_grounds, 2)), rng.uniform(0.3, 1.0, n_grounds)])
+        kinds = rng.choice([k for k in ground_types if k != floor], n_grounds)
+        self.grounds = [(g, surface_std[k] if k != 'rough' else rng.uniform(*rough_std)) for g, k in zip(grounds, kinds)]
+        self.ground_kinds = kinds
+        self.background_std = surface_std[floor]
+        # light and roughness maps, so the simulation loop only indexes them
+        centers = np.arange(-size/2, size/2, grid_step) + grid_step/2
+        gx, gy = np.meshgrid(centers, centers, indexing='ij')
+        self.lux_map = np.full(gx.shape, self.ambient_lux)
+        for lx, ly, r, lux in self.lights:
+            inside = np.hypot(gx - lx, gy - ly) < r
+            self.lux_map[inside] = np.maximum(self.lux_map[inside], lux)
+        self.roughness_map = np.full(gx.shape, self.background_std)
+        self.ground_map = np.full(gx.shape, ground_types.index(floor))  # index into ground_types
+        for ((px, py, r), std), kind in zip(self.grounds, self.ground_kinds):
+            inside = np.hypot(gx - px, gy - py) < r
+            self.roughness_map[inside] = std  # the latest patch on top
+            self.ground_map[inside] = ground_types.index(kind)
+        self.obstacle_list = self.obstacles.tolist()
+        # start somewhere free, away from the walls
+        while True:
+            self.start = rng.uniform(-size/2 + 0.5, size/2 - 0.5, 2)
+            if not self.collides(*self.start, margin=0.3):
+                break
+        self.rng = rng
+
+    def collides(self, x, y, margin=0.0):
+        if max(abs(x), abs(y)) > self.size/2 - drone_radius - margin:
+            return True
+        return any(math.hypot(ox - x, oy - y) < r + drone_radius + margin for ox, oy, r in self.obstacle_list)
+
+    def cell(self, x, y):
+        last = self.lux_map.shape[0] - 1
+        return min(max(int((x + self.size/2) / grid_step), 0), last), min(max(int((y + self.size/2) / grid_step), 0), last)
+
+    def lux(self, x, y):
+        return float(self.lux_map[self.cell(x, y)])
+
+    def roughness(self, x, y):
+        return float(self.roughness_map[self.cell(x, y)])
+
+    def ground(self, x, y):
+        return int(self.ground_map[self.cell(x, y)])
+
+    def ranges(self, x, y):
+        '''
+        Distances (mm) left (+y), front (+x), right (-y), back (-x) to the walls and obstacles
+        '''
+        half = self.size / 2
+        dists = [half - y, half - x, half + y, half + x]
+        for ox, oy, r in self.obstacle_list:
+            dx, dy = ox - x, oy - y
+            # (direction, distance along the ray, distance across it) for the four rays
+            for i, along, across in ((0, dy, dx), (1, dx, dy), (2, -dy, dx), (3, -dx, dy)):
+                if along > 0 and abs(across) < r:
+                    dists[i] = min(dists[i], along - math.sqrt(r*r - across*across))
+        return [min(max(d, 0.0) * 1000, range_max) for d in dists]
+
+
+class SimulatedMC:
+    '''
+    The part of MotionCommander the mission uses, as velocity setpoints
+    '''
+
+    def __init__(self):
+        self.setpoint = (0.0, 0.0)
+
+    def start_linear_motion(self, vx, vy, vz):
+        self.setpoint = (vx, vy)
+
+    def stop(self):
+        self.setpoint = (0.0, 0.0)
+
+
+_models = {}
+
+
+def recorded_noise():
+    '''
+    z minus its mean over every flatness check of pos_<surface>.csv (m), per
+    surface, and the surface classifier, loaded once per worker
+    '''
+    if not _models:
+        for surface in surface_std:
+            pos = np.genfromtxt(noise_dir + 'pos_' + surface + '.csv', delimiter=',', dtype=None, encoding=None)
+            z = pos['f3']
+            _models[surface] = np.concatenate([z[start:end] - z[start:end].mean()
+                                               for start, end in zip(*runs(pos['f4'].astype(str) == 'True'))]).tolist()
+        _models['classifier'] = SurfaceClassifier.load(model_file) if os.path.isfile(model_file) else None
+    return _models
+
+
+def simulate(params, seed, battery_time=None):
+    '''
+    One headless mission in a random environment, from the moment the battery
+    is low until landing, with the flatness-check trajectory and surface
+    check of the controller. Returns outcome ('safe': on one of
+    landing_surfaces, smooth and lit, 'surface', 'rough', 'dark', 'crash' or
+    'battery'), time to land (s), energy used (Wh, hover power
+    scaled by relative_power() of the thrust tilted to accelerate) and the
+    landing site
+    '''
+    env = Environment(seed)
+    rng = env.rng
+    if battery_time is None:
+        battery_time = rng.uniform(90, 240)  # s of flight left when the mission starts
+    position, ranges, light = SensorState(('timestamp', 'x', 'y', 'z')), SensorState(('timestamp', 'left', 'front', 'right', 'back')), SensorState(('timestamp', 'intensity'))
+    z_sums = SensorState(('n', 'sum', 'sum_sq'))
+    checking = [False]
+    models = recorded_noise()
+    classifier = models['classifier'] if params['surface_check'] else None
+    z_window = deque(maxlen=classifier.window if classifier is not None else 1)
+
+    def set_checking_flatness(value):
+        if value:
+            z_window.clear()
+        checking[0] = value
+
+    def surface_check():
+        # as controller.surface_check()
+        if classifier is None or len(z_window) < z_window.maxlen:
+            return None
+        z = list(z_window)
+        if 1 - classifier.probability(z, landing_surfaces) >= surface_confidence:
+            return 'Surface looks like {}'.format(classifier.classify(z)[0])
+        return None
+
+    trajectory = None
+    if params['trajectory'] != 'none':
+        trajectory = Trajectory(params['trajectory'], area=params['square_side']**2, samples=flatness_samples,
+                                sample_rate=1/dt, max_vel=max_vel)
+    mc = SimulatedMC()
+    mission = Mission(mc, position, ranges, light, z_sums, set_checking_flatness,
+                      light_thresh=params['light_thresh'], dist_thresh=params['dist_thresh'],
+                      flatness_threshold=params['flatness_threshold'], square_side=params['square_side'],
+                      fwd_distance=params['fwd_distance'], trajectory=trajectory, tick_period=params['sleep_time'],
+                      surface_check=surface_check, verbose=False)
+    x, y = env.start
+    vx = vy = 0.0
+    t = 0.0
+    next_sensor = 0.0
+    n, z_sum, z_sum_sq = 0, 0.0, 0.0
+    energy = 0.0
+    outcome = None
+    alpha = 1 - math.exp(-dt / velocity_tau)
+    noise = rng.standard_normal(int(max_time / dt) + 1).tolist()
+    offsets = {surface: int(rng.integers(len(models[surface]))) for surface in surface_std}
+    step = 0
+    while t < max_time:
+        # drone
+        ax, ay = alpha * (mc.setpoint[0] - vx) / dt, alpha * (mc.setpoint[1] - vy) / dt
+        vx += ax * dt
+        vy += ay * dt
+        x += vx * dt
+        y += vy * dt
+        # relative_power() of the thrust tilted to accelerate, inline as it runs every step
+        energy += hover_power * (1 + (ax*ax + ay*ay) / (g*g))**0.75 * dt
+        timestamp = int(t * 1000)
+        ground = ground_types[env.ground(x, y)]
+        if ground == 'rough':
+            dz = noise[step] * env.roughness(x, y)
+        else:
+            recorded = models[ground]
+            # back and forth over the recording, wrapping around would put a jump in z (that the
+            # surface classifier takes for gravel) every few seconds
+            i = (offsets[ground] + step) % (2*len(recorded) - 2)
+            dz = recorded[i if i < len(recorded) else 2*len(recorded) - 2 - i]
+        step += 1
+        position.publish(timestamp, x, y, takeoff_height + dz)
+        if checking[0]:
+            n, z_sum, z_sum_sq = n + 1, z_sum + dz, z_sum_sq + dz*dz
+            z_sums.publish(n, z_sum, z_sum_sq)
+            z_window.append(takeoff_height + dz)
+        if t >= next_sensor:
+            if env.collides(x, y):
+                outcome = 'crash'
+                break
+            ranges.publish(timestamp, *[max(r + rng.normal(0, 5), 0.0) for r in env.ranges(x, y)])
+            light.publish(timestamp, env.lux(x, y) * rng.lognormal(0, 0.05))
+            next_sensor += sensor_period
+        if not mission.tick(t):
+            break
+        t += dt
+        if t > battery_time:
+            outcome = 'battery'
+            break
+    if outcome is None:
+        if t >= max_time:
+            outcome = 'battery'
+        elif ground_types[env.ground(x, y)] not in landing_surfaces:
+            outcome = 'surface'
+        elif env.roughness(x, y) > safe_roughness:
+            outcome = 'rough'
+        elif env.lux(x, y) < params['useful_lux']:
+            outcome = 'dark'
+        else:
+            outcome = 'safe'
+    return {'outcome': outcome, 'time to land (s)': t, 'energy (Wh)': energy / 3600,
+            'flatness checks': mission.flatness_checks, 'landing lux': env.lux(x, y), 'landing roughness (m)': env.roughness(x, y),
+            'landing surface': ground_types[env.ground(x, y)]}
+
+
+def run(job):
+    params, seed = job
+    result = simulate(params, seed)
+    result.update(params)
+    result['seed'] = seed
+    return result
+
+
+def summarize(results, charging_lookup=None):
+    '''
+    Success rate, time to land and energy per parameter combination
+    '''
+    keys = swept + ['trajectory', 'useful_lux', 'surface_check']
+    grouped = results.groupby(keys)
+    table = grouped.agg(runs=('outcome', 'size'),
+                        success_rate=('outcome', lambda o: np.mean(o == 'safe')),
+                        crash_rate=('outcome', lambda o: np.mean(o == 'crash')),
+                        battery_rate=('outcome', lambda o: np.mean(o == 'battery')),
+                        landing_surface_rate=('landing surface', lambda s: np.mean(s.isin(landing_surfaces))),
+                        median_time_to_land=('time to land (s)', 'median'),
+                        mean_energy=('energy (Wh)', 'mean'),
+                        mean_flatness_checks=('flatness checks', 'mean'))
+    if charging_lookup is not None:
+        # recharge time from the landing light, for the charge left after the mission (landed runs only)
+        landed = results[results['outcome'].isin(['safe', 'surface', 'rough', 'dark'])]
+        vbat_after = 3.0 + 0.2  # V, about where the low battery branch ends
+        recharge = landed.apply(lambda r: charging_lookup.time_to_recharge(r['landing lux'], charge_needed_from_vbat(vbat_after)) / 3600, axis=1)
+        table['median_recharge_h'] = recharge.groupby([landed[k] for k in keys]).median() if len(landed) else np.nan
+    return table.reset_index().sort_values('success_rate', ascending=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Monte Carlo sweep of the mission parameters over random simulated environments')
+    for name in swept:
+        parser.add_argument('--' + name, type=float, nargs='+', default=[defaults[name]], help='Values to sweep (default {})'.format(defaults[name]))
+    parser.add_argument('--trajectory', type=str, nargs='+', default=[flatness_trajectory], choices=kinds + ['none'], help='Flatness-check trajectories to sweep (default {}, none for the stop-and-go square)'.format(flatness_trajectory))
+    parser.add_argument('--no_surface_check', action='store_true', default=False, help='Fly every flatness check to the end, without the surface classifier')
+    parser.add_argument('--useful_lux', type=float, default=1000, help='Light a landing site needs to count as a success (lux)')
+    parser.add_argument('-n', '--runs', type=int, default=200, help='Random environments per parameter combination (the same ones for every combination)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='Worker processes')
+    parser.add_argument('--seed', type=int, default=0, help='First environment seed')
+    parser.add_argument('-o', '--output', type=str, default='../mission-sweep.csv', help='Summary table')
+    parser.add_argument('--runs_output', type=str, help='Also save every run')
+    parser.add_argument('--panel', type=str, default='MPT4.8-75(2-panels)', help='Panels for the recharge time column')
+    args = parser.parse_args()
+
+    combinations = [dict(zip(swept + ['trajectory'], values), useful_lux=args.useful_lux, surface_check=not args.no_surface_check)
+                    for values in itertools.product(*[getattr(args, name) for name in swept + ['trajectory']])]
+    jobs = [(params, args.seed + i) for params in combinations for i in range(args.runs)]
+    print('{} runs ({} combinations x {} environments) on {} processes'.format(len(jobs), len(combinations), args.runs, args.jobs))
+    start = time.perf_counter()
+    with Pool(args.jobs) as pool:
+        results = pd.DataFrame(pool.imap_unordered(run, jobs, chunksize=max(1, len(jobs) // (8 * args.jobs))))
+    print('Simulated in {:.1f} s'.format(time.perf_counter() - start))
+    if args.runs_output:
+        results.to_csv(args.runs_output, index=False)
+    table = summarize(results, ChargingLookup.from_csv('../data/charging-lookup.csv', args.panel))
+    table.to_csv(args.output, index=False)
+    with pd.option_context('display.max_rows', 50, 'display.width', 200):
+        print(table.to_string(index=False, float_format='{:.3g}'.format))
+    print('Saved {}'.format(args.output))
@@ -6,6 +6,9 @@ from matplotlib.dates import (MINUTELY, RRuleLocator, rrulewrapper, DateFormatte
 from matplotlib.lines import Line2D
 import pandas as pd  # to read csv, more convenient than csv module
 import datetime
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from catalog import Catalog
 
 
 # define colors
@@ -64,11 +67,12 @@ def set_size(width, fraction=1, subplots=(1, 1)):
 
 
 # data
-datadir = '../../data/charging/'
+datadir = '../../data/'
 # panel = 'MPT4.8-75(4-panels)'  # possible values: MPT4.8-75(4-panels), MPT4.8-75(4-panels), MPT6-75(4-panels)
 panel = 'MPT4.8-75(2-panels)'  # possible values: MPT4.8-75(4-panels), MPT4.8-75(4-panels), MPT6-75(4-panels)
 # panel = 'MPT6-75(4-panels)'  # possible values: MPT4.8-75(4-panels), MPT4.8-75(4-panels), MPT6-75(4-panels)
-datafile = datadir + panel + '.csv'
+catalog = Catalog(datadir)
+datafile = catalog.files(kind='charging', panel=panel)[0]
 data = pd.read_csv(datafile)
 data = data.astype({'Lux': 'Int64', 'Iin (mA)': 'Float64', 'Vin': 'Float64', 'Iout (mA)': 'Float64', 'Vout': 'Float64', 'Notes': 'string', 'Date': 'string', 'Time': 'string', 'Efficiency': 'float'})
 datetime_arr = np.asarray([datetime.datetime.strptime(d, '%Y/%m/%d-%H:%M %Z') for d in np.asarray('2021/' + data.iloc[:,0] + '-' + data.iloc[:,1] + ' PST')])
@@ -246,14 +250,13 @@ fig2 = plt.figure(2, figsize=set_size('ieee-columnwidth'))
 ax2 = fig2.add_subplot(1,1,1)
 efficiency_arr = []
 lux_arr = []
-for datafile in os.listdir(datadir):
-    if os.path.isfile(datadir + datafile):
-        data = pd.read_csv(datadir + datafile)
-        data = data.astype({'Lux': 'Int64', 'Iin (mA)': 'Float64', 'Vin': 'Float64', 'Iout (mA)': 'Float64', 'Vout': 'Float64', 'Notes': 'string', 'Date': 'string', 'Time': 'string', 'Efficiency': 'float'})
-        # Remove the open circuit readings (for plotting current, efficiency)
-        trimmed_data = data.loc[data.get('Notes') != 'Open circuit']
-        lux_arr.extend(list(trimmed_data.get('Lux')))
-        efficiency_arr.extend(list(trimmed_data.get('Efficiency')))
+for datafile in catalog.files(kind='charging'):
+    data = pd.read_csv(datafile)
+    data = data.astype({'Lux': 'Int64', 'Iin (mA)': 'Float64', 'Vin': 'Float64', 'Iout (mA)': 'Float64', 'Vout': 'Float64', 'Notes': 'string', 'Date': 'string', 'Time': 'string', 'Efficiency': 'float'})
+    # Remove the open circuit readings (for plotting current, efficiency)
+    trimmed_data = data.loc[data.get('Notes') != 'Open circuit']
+    lux_arr.extend(list(trimmed_data.get('Lux')))
+    efficiency_arr.extend(list(trimmed_data.get('Efficiency')))
 efficiency_arr = np.asarray(efficiency_arr)
 lux_arr = np.asarray(lux_arr)
 
@@ -273,9 +276,9 @@ plt.savefig('../../img/efficiency.png')
 print('Saved ../../img/efficiency.png')
 
 # Average efficiency for indoor charge
-for datafile in os.listdir(datadir + 'inside'):
-    data = pd.read_csv(datadir + 'inside/' + datafile)
+for datafile in catalog.files(kind='charging-inside'):
+    data = pd.read_csv(datafile)
     data = data.astype({'Lux': 'Int64', 'Iin (mA)': 'Float64', 'Vin': 'Float64', 'Iout (mA)': 'Float64', 'Vout': 'Float64', 'Notes': 'string', 'Date': 'string', 'Time': 'string', 'Efficiency': 'float'})
     # Remove the open circuit readings (for plotting current, efficiency)
     trimmed_data = data.loc[data.get('Notes') != 'Open circuit']
-    print("{}: avg efficiency is {}%".format(datadir+'inside/'+datafile, np.average(np.asarray(trimmed_data.get('Efficiency')))*100))
+    print("{}: avg efficiency is {}%".format(datafile, np.average(np.asarray(trimmed_data.get('Efficiency')))*100))
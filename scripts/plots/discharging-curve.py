@@ -1,9 +1,11 @@
 import os
-import re  # regular expressions
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.lines import Line2D
 import csv
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from catalog import Catalog
 
 
 # define colors
@@ -61,12 +63,9 @@ def set_size(width, fraction=1, subplots=(1, 1)):
     return (fig_width_in, fig_height_in)
 
 
-datadir = '../../data/discharging/'
+datadir = '../../data/'
 # Get all files with discharge data
-files = []
-for fname in os.listdir(datadir):
-    if re.match('^vbat_.*', fname) is not None:
-        files.append(fname)
+trials = Catalog(datadir).find(experiment='discharging')
 
 fig = plt.figure(1, figsize=set_size('ieee-columnwidth'))
 ax = fig.add_subplot(1,1,1)
@@ -75,9 +74,9 @@ t = []  # handlers for the thrust plots so that the legend can be ordered
 linestyles = ['dashdot', 'dotted', 'dashed', 'solid']
 excluded = [15, 30, 50, 85]
 ii = 0
-for fname in files:
-    isHover = re.match('vbat_.', fname).group(0)[-1] == 'h'
-    with open(datadir + fname) as filehandle:
+for trial in trials.itertuples():
+    isHover = trial.hover
+    with open(datadir + trial.path) as filehandle:
         time, voltage = [], []
         csv_reader = csv.reader(filehandle)
         for line in csv_reader:
@@ -88,12 +87,11 @@ for fname in files:
     for i in range(len(time)):
         time[i] -= t0
         time[i] /= (1000 * 60)
+    trial_no = trial.trial
     if not isHover:
-        thrust = int(re.search('_t-(\d*)_n-(\d*)\.csv', fname).group(1))
+        thrust = trial.thrust
         label = 'Thrust = {}\%'.format(str(thrust))
-        trial_no = int(re.search('_t-(\d*)_n-(\d*)\.csv', fname).group(2))
     else:
-        trial_no = int(re.search('_h_n-(\d*)\.csv', fname).group(1))
         # average thrust for vbat_h_n-1.csv (without panels) was 61.3%
         # average thrust for vbat_h_n-2.csv (with two MPT4.8-75) was 70.8%
         if trial_no == 1:
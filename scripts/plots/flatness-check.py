@@ -1,3 +1,5 @@
+import os
+import sys
 import numpy as np
 from scipy import ndimage
 import matplotlib.pyplot as plt
@@ -5,6 +7,10 @@ import matplotlib
 from matplotlib.ticker import MultipleLocator
 from matplotlib.lines import Line2D
 import csv
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from downsampling import downsampled_scatter
+from catalog import Catalog
+from interval_index import IntervalIndex
 
 
 # define colors
@@ -91,6 +97,9 @@ zorder= 3
 z_map = 'viridis'
 intensity_map = 'gray'
 ao_color = 'red'
+# reduce trajectories to the per-pixel z extremes at raster_dpi and rasterize them in eps/pdf
+downsample = True
+raster_dpi = 300
 
 # Colored plot
 fig1 = plt.figure(1, figsize=set_size('ieee-textwidth', subplots=(2,4), fraction=0.95))
@@ -100,7 +109,10 @@ image = ndimage.rotate(plt.imread(imagefile), -90)
 x0, y0 = -0.1, -0.35
 x1, y1 = 1.65, 0.65
 ax1.imshow(image, extent=[x0, x1, y0, y1])  # left, right, bottom, top
-ax1.scatter(x[beginning:end]+xoffset, y[beginning:end]+yoffset, marker='.', s=size, c=z[beginning:end], vmin=zmin, vmax=zmax, zorder=zorder, cmap=z_map)  # trajectory
+if downsample:
+    downsampled_scatter(ax1, x[beginning:end]+xoffset, y[beginning:end]+yoffset, c=z[beginning:end], dpi=raster_dpi, marker='.', s=size, vmin=zmin, vmax=zmax, zorder=zorder, cmap=z_map)  # trajectory
+else:
+    ax1.scatter(x[beginning:end]+xoffset, y[beginning:end]+yoffset, marker='.', s=size, c=z[beginning:end], vmin=zmin, vmax=zmax, zorder=zorder, cmap=z_map)  # trajectory
 ax1.scatter(x[beginning]+xoffset, y[beginning]+yoffset, marker='1', c='red', s=40, zorder=4)  # start point
 ax1.scatter(x[end]+xoffset, y[end]+yoffset, marker='v', c='green', s=40, zorder=4)  # end point
 ax1.set_xticklabels([])
@@ -134,41 +146,26 @@ for i in range(len(time_i)):
 light_thresh = 1000  # lux
 ax1.scatter(x_adj+xoffset, y_adj+yoffset, marker='s', s=8, c=intensity>light_thresh, zorder=2, cmap=intensity_map)
 
-# read obstacle avoidance data
+# obstacle and flatness-check spans of the flight (built once, saved next to the logs)
 dist_thresh = 120  # mm
-datafile = '../../data/flatness-check/range.csv'
-with open(datafile) as filehandle:
-    time_r, range_left, range_front, range_right, range_back = [], [], [], [], []
-    csv_reader = csv.reader(filehandle)
-    for line in csv_reader:
-        if float(line[1]) < dist_thresh or float(line[2]) < dist_thresh or float(line[3]) < dist_thresh or float(line[4]) < dist_thresh:
-            time_r.append(int(line[0]))
-            range_left.append(float(line[1]))
-            range_front.append(float(line[2]))
-            range_right.append(float(line[3]))
-            range_back.append(float(line[4]))
-time_r = np.asarray(time_r)
-range_left, range_front, range_right, range_back = np.asarray(range_left), np.asarray(range_front), np.asarray(range_right), np.asarray(range_back)
-x_adj, y_adj = np.zeros(len(time_r)), np.zeros(len(time_r))
-for i in range(len(time_r)):
-    x_adj[i] = x[np.argmin(np.abs(time_pos-time_r[i]))]
-    y_adj[i] = y[np.argmin(np.abs(time_pos-time_r[i]))]
-
-# obstacle avoidance
-ax1.scatter(x_adj+xoffset, y_adj+yoffset, marker='s', s=15, c=ao_color, zorder=1)
+index = IntervalIndex.for_flight('../../data/flatness-check', light_thresh=light_thresh, dist_thresh=dist_thresh)
+
+# obstacle avoidance: positions while any range was below dist_thresh
+near = index.contains('obstacle', time_pos)
+ax1.scatter(x[near]+xoffset, y[near]+yoffset, marker='s', s=15, c=ao_color, zorder=1)
 
 # Text annotations for recorded standard deviations
-blocks = np.split(np.where(np.diff(checking_flatness))[0] + 1, 2)
+_, _, stds = index.stats('pos.z', 'flatness-check')
 xs, ys = [0.8, 1.25], [0.68, 0.68]  # coordinates for the annotations
 colors = ['red', 'green']
-for block in blocks:
-    std = np.std(z[block[0]:block[1]])
-    ax1.text(xs.pop(0), ys.pop(0), r"$\sigma$={:.1f} mm".format(std*1000), fontsize='small', zorder=10, color=colors.pop(0), fontweight='bold')
+for std, xa, ya, color in zip(stds, xs, ys, colors):
+    ax1.text(xa, ya, r"$\sigma$={:.1f} mm".format(std*1000), fontsize='small', zorder=10, color=color, fontweight='bold')
 
 
 ## Flatness check on various surfaces
-datadir = '../../data/flatness-check/'
-fnames = ['pos_flat.csv', 'pos_grass.csv', 'pos_gravel.csv', 'pos_tiles.csv']
+surfaces = ['flat', 'grass', 'gravel', 'tiles']
+catalog = Catalog('../../data/')
+fnames = [catalog.files(experiment='flatness-check', kind='pos', surface=surface, variant=None)[0] for surface in surfaces]
 imgfnames = ['fc_flat.jpg', 'fc_grass.jpg', 'fc_gravel.jpg', 'fc_tiles.jpg']
 legends = ['Flat', 'Grass', 'Gravel', 'Tiles']
 subplot_poses = [1, 2, 5, 6]
@@ -176,7 +173,7 @@ txt_poses = [[-0.09,0.16], [1.05,0.21], [-0.11,0.11], [-0.34,0.13]]  # x, y
 extents = [[-0.25,0.15,-0.25,0.15], [0.9,1.3,-0.2,0.2], [-0.25,0.15,-0.3,0.1], [-0.48,-0.05,-0.3,0.12]]  # left, right, bottom, top
 # read data
 for fname, imgfname, legend, subplot_pose, extent, txt_pose in zip(fnames, imgfnames, legends, subplot_poses, extents, txt_poses):
-    with open(datadir+fname) as filehandle:
+    with open(fname) as filehandle:
         time, x, y, z, = [], [], [], []
         csv_reader = csv.reader(filehandle)
         for line in csv_reader:
@@ -193,7 +190,10 @@ for fname, imgfname, legend, subplot_pose, extent, txt_pose in zip(fnames, imgfn
         imagefile = '../../img/' + imgfname
         image = plt.imread(imagefile)
         ax2.imshow(image, extent=[extent[0], extent[1], extent[2], extent[3]])  # left, right, bottom, top
-        ax2.scatter(x, y, s=3, c=z, vmin=zmin, vmax=zmax, zorder=zorder, cmap=z_map)
+        if downsample:
+            downsampled_scatter(ax2, x, y, c=z, dpi=raster_dpi, s=3, vmin=zmin, vmax=zmax, zorder=zorder, cmap=z_map)
+        else:
+            ax2.scatter(x, y, s=3, c=z, vmin=zmin, vmax=zmax, zorder=zorder, cmap=z_map)
         ax2.scatter(x[0], y[0], marker='1', c='red', s=40, zorder=4)  # start point
         ax2.scatter(x[-1], y[-1], marker='v', c='green', s=40, zorder=4)  # end point
         ax2.set_xticklabels([])
@@ -217,9 +217,9 @@ cb.set_label(r'Height (m)')
 plt.legend([Line2D([0],[0],color='red',lw=0,marker='1',markersize=np.sqrt(40)), Line2D([0],[0],color='green',lw=0,marker='v',markersize=np.sqrt(40))], ['Start', 'Finish'], ncol=2, loc='center', bbox_to_anchor=[-12,-0.01])
 
 
-plt.savefig('../../img/flatness-check-colored.eps', bbox_inches='tight')
+plt.savefig('../../img/flatness-check-colored.eps', dpi=raster_dpi, bbox_inches='tight')
 print('Saved ../../img/flatness-check-colored.eps')
 plt.savefig('../../img/flatness-check-colored.png', bbox_inches='tight')
 print('Saved ../../img/flatness-check-colored.png')
-plt.savefig('../../img/flatness-check-colored.pdf', bbox_inches='tight')
+plt.savefig('../../img/flatness-check-colored.pdf', dpi=raster_dpi, bbox_inches='tight')
 print('Saved ../../img/flatness-check-colored.pdf')
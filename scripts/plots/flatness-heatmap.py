@@ -0,0 +1,113 @@
+import os
+import sys
+import numpy as np
+import matplotlib.pyplot as plt
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rolling_stats import rolling_mean_std, window_samples, flatness_grid
+
+
+# define colors
+default_blue = '#1f77b4'
+default_orange = '#ff7f0e'
+default_purple = '#9467bd'
+
+# Optional (but use consistent styles for all plots)
+# plt.style.use('seaborn')
+
+# According to the IEEE format
+plt.rcParams.update({
+    "text.usetex": True,
+    "font.family": "serif",
+    "font.serif": ["Times"],
+    "font.size": 10,
+    "legend.fontsize": 8,  # verify
+    "xtick.labelsize": 8,  # verify
+    "ytick.labelsize": 8,  # verify
+    "axes.labelsize": 10})
+
+
+def set_size(width, fraction=1, subplots=(1, 1)):
+    """Set figure dimensions to avoid scaling in LaTeX.
+    Parameters
+    ----------
+    width: float or string
+            Document width in points, or string of predined document type
+    fraction: float, optional
+            Fraction of the width which you wish the figure to occupy
+    subplots: array-like, optional
+            The number of rows and columns of subplots.
+    Returns
+    -------
+    fig_dim: tuple
+            Dimensions of figure in inches
+    """
+    if width == 'ieee-textwidth':
+        width_pt = 516
+    elif width == 'ieee-columnwidth':
+        width_pt = 252
+    else:
+        width_pt = width
+    # Width of figure (in pts)
+    fig_width_pt = width_pt * fraction
+    # Convert from pt to inches
+    inches_per_pt = 1 / 72.27
+    # Golden ratio to set aesthetic figure height
+    # https://disq.us/p/2940ij3
+    golden_ratio = (5**.5 - 1) / 2
+    # Figure width in inches
+    fig_width_in = fig_width_pt * inches_per_pt
+    # Figure height in inches
+    fig_height_in = fig_width_in * golden_ratio * (subplots[0] / subplots[1])
+    return (fig_width_in, fig_height_in)
+
+
+# data: full trajectories over each surface
+datadir = '../../data/flatness-check/'
+fnames = ['pos_grass_full.csv', 'pos_tiles_full.csv']
+legends = ['Grass', 'Tiles']
+windows = [0.5, 1, 2, 4]  # s
+cell_size = 0.05  # m
+# colormap, color limits (mm)
+flatness_map = 'magma'
+fmin, fmax = 0, 15
+
+fig = plt.figure(1, figsize=set_size('ieee-textwidth', subplots=(len(fnames), len(windows))))
+for row, (fname, legend) in enumerate(zip(fnames, legends)):
+    data = np.loadtxt(datadir + fname, delimiter=',', usecols=(0, 1, 2, 3))
+    time, x, y, z = data[:,0], data[:,1], data[:,2], data[:,3]
+    # rolling standard deviation of z along the whole trajectory, all windows at once
+    _, stds = rolling_mean_std(z, window_samples(time, windows))
+    export = []
+    for col, (window, std) in enumerate(zip(windows, stds)):
+        grid, extent = flatness_grid(x, y, std, cell_size)
+        ax = fig.add_subplot(len(fnames), len(windows), row*len(windows) + col + 1)
+        im = ax.imshow(grid*1000, extent=extent, origin='lower', vmin=fmin, vmax=fmax, cmap=flatness_map, interpolation='nearest')
+        ax.set_xticklabels([])
+        ax.set_yticklabels([])
+        ax.set_aspect('equal', 'box')
+        if row == 0:
+            ax.set_title('{} s window'.format(window), fontsize='small')
+        if col == 0:
+            ax.set_ylabel(legend)
+        # cell centers and flatness for the csv export
+        yc, xc = np.mgrid[0:grid.shape[0], 0:grid.shape[1]]
+        if col == 0:
+            export.extend([extent[0] + (xc.ravel() + 0.5)*cell_size, extent[2] + (yc.ravel() + 0.5)*cell_size])
+        export.append(grid.ravel())
+        print('{}, {} s window: median rolling std = {:.1f} mm'.format(fname, window, np.nanmedian(std)*1000))
+    # per-location flatness (m) for every window size
+    outfile = '../../img/flatness-heatmap_' + fname
+    np.savetxt(outfile, np.column_stack(export), fmt='%.5f', delimiter=',', header='x,y,' + ','.join('std_{}s'.format(w) for w in windows), comments='')
+    print('Saved ' + outfile)
+
+plt.subplots_adjust(left=0.05, right=0.87, top=0.92, bottom=0.02, wspace=0.05, hspace=0.15)
+cbaxes = fig.add_axes([0.9, 0.02, 0.02, 0.9])
+cb = plt.colorbar(im, cax=cbaxes)
+cb.set_label(r'Rolling $\sigma_z$ (mm)')
+
+plt.savefig('../../img/flatness-heatmap.eps', bbox_inches='tight')
+print('Saved ../../img/flatness-heatmap.eps')
+plt.savefig('../../img/flatness-heatmap.png', bbox_inches='tight')
+print('Saved ../../img/flatness-heatmap.png')
+plt.savefig('../../img/flatness-heatmap.pdf', bbox_inches='tight')
+print('Saved ../../img/flatness-heatmap.pdf')
@@ -1,6 +1,10 @@
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from design_space import crossover
 
 
 # define colors
@@ -103,9 +107,10 @@ ax1.set_xlabel('aircraft mass $m$ (g)')
 ax1.set_ylabel(r'characteristic length $\ell$ (m)')
 ax1.legend()
 
-# Print the point (length, metres) where the best fit lines for
-# predicted characteristic length and predicted solar panel length meet
-print("Best fit lines meet at: {} mm".format(1000*np.min(np.abs(l_predicted - la_predicted))))
+# Print the point where the best fit lines for predicted characteristic
+# length and predicted solar panel length meet (exactly, not on m_log)
+m_meet, l_meet = crossover(rho_est, gamma_est)
+print("Best fit lines meet at: {:.3g} g, {:.1f} mm".format(m_meet, 1000*l_meet))
 
 # mass vs length
 plt.loglog(m, l, 'x', color=default_orange, markersize=8, markeredgewidth=2)
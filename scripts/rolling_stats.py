@@ -0,0 +1,70 @@
+import numpy as np
+
+
+def rolling_mean_std(values, windows):
+    '''
+    Centered rolling mean and standard deviation of values for several window
+    sizes (in samples) at once. Both are computed from one pair of cumulative
+    sums, so the cost is O(N) per window whatever its size.
+    Returns (means, stds), arrays of shape (len(windows), len(values)) that are
+    NaN where the window doesn't fit inside the data.
+    '''
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    # Remove the mean first so that the sums of squares don't lose precision
+    # (z is ~0.3 m while the deviations of interest are ~mm)
+    centered = values - np.mean(values) if n else values
+    csum = np.r_[0.0, np.cumsum(centered)]
+    csum_sq = np.r_[0.0, np.cumsum(centered * centered)]
+    means = np.full((len(windows), n), np.nan)
+    stds = np.full((len(windows), n), np.nan)
+    for k, window in enumerate(windows):
+        window = int(window)
+        if window < 1 or window > n:
+            continue
+        start = np.arange(n - window + 1)
+        center = start + window // 2
+        s1 = csum[start + window] - csum[start]
+        s2 = csum_sq[start + window] - csum_sq[start]
+        mean = s1 / window
+        means[k, center] = mean + (np.mean(values) if n else 0.0)
+        stds[k, center] = np.sqrt(np.maximum(s2 / window - mean * mean, 0.0))
+    return means, stds
+
+
+def window_samples(time, seconds):
+    '''
+    Convert window lengths in seconds to samples using the median sample period
+    of time (ms, as logged by the crazyflie)
+    '''
+    period = np.median(np.diff(np.asarray(time, dtype=float))) / 1000.0
+    return [max(int(round(s / period)), 1) for s in seconds]
+
+
+def flatness_grid(x, y, flatness, cell_size, extent=None):
+    '''
+    Average flatness (eg. rolling std of z) per cell of a square grid over the
+    x-y plane. NaN samples (where the rolling window didn't fit) are ignored.
+    extent is (left, right, bottom, top), defaulting to the data bounds.
+    Returns (grid of shape (ny, nx), with NaN for cells without samples, extent)
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    flatness = np.asarray(flatness, dtype=float)
+    if extent is None:
+        extent = (np.min(x), np.max(x), np.min(y), np.max(y))
+    left, right, bottom, top = extent
+    nx = max(int(np.ceil((right - left) / cell_size)), 1)
+    ny = max(int(np.ceil((top - bottom) / cell_size)), 1)
+    ix = np.floor((x - left) / cell_size).astype(int)
+    iy = np.floor((y - bottom) / cell_size).astype(int)
+    # Samples right on the top/right edge belong to the last cell
+    ix[x == right] = nx - 1
+    iy[y == top] = ny - 1
+    valid = ~np.isnan(flatness) & (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+    cells = iy[valid] * nx + ix[valid]
+    counts = np.bincount(cells, minlength=nx * ny)
+    sums = np.bincount(cells, weights=flatness[valid], minlength=nx * ny)
+    grid = np.full(nx * ny, np.nan)
+    grid[counts > 0] = sums[counts > 0] / counts[counts > 0]
+    return grid.reshape(ny, nx), (left, left + nx * cell_size, bottom, bottom + ny * cell_size)
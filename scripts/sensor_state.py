@@ -0,0 +1,60 @@
+from array import array
+
+
+class SensorState:
+    '''
+    Latest sample of one telemetry stream, shared between the cflib receive
+    thread (single writer) and any number of reader threads without locks.
+
+    Values live in a fixed array of doubles guarded by a sequence number, as in
+    a seqlock: the writer makes the sequence odd, writes the values in place and
+    makes it even again. A reader copies the values into its own preallocated
+    buffer and retries if the sequence was odd or changed meanwhile, so it always
+    gets all the fields of one sample, never a mix of two. Nothing is allocated
+    per sample on either side.
+    '''
+    __slots__ = ('fields', 'values', '_seq')
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        # Only the writer may read this directly (eg. to update running sums)
+        self.values = array('d', bytes(8 * len(self.fields)))
+        self._seq = 0
+
+    def publish(self, *values):
+        '''
+        Store a new sample (one value per field). Writer thread only.
+        '''
+        self._seq += 1  # odd: write in progress
+        buf = self.values
+        for i in range(len(values)):
+            buf[i] = values[i]
+        self._seq += 1
+
+    def new_buffer(self):
+        '''
+        Buffer for read(), allocate once per reader
+        '''
+        return array('d', bytes(8 * len(self.fields)))
+
+    def read(self, out):
+        '''
+        Copy a consistent sample into out (from new_buffer()) and return it
+        '''
+        while True:
+            seq = self._seq
+            if seq & 1:
+                continue
+            out[:] = self.values
+            if self._seq == seq:
+                return out
+
+    @property
+    def version(self):
+        '''
+        Number of samples published so far (0 until the first sample arrives)
+        '''
+        return self._seq >> 1
+
+    def __repr__(self):
+        return 'SensorState({})'.format(', '.join('{}={}'.format(f, v) for f, v in zip(self.fields, self.read(self.new_buffer()))))
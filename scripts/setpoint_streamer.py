@@ -0,0 +1,173 @@
+import argparse
+import threading
+import time
+from collections import deque
+import numpy as np
+
+
+class SetpointStreamer:
+    '''
+    Hover setpoints (vx, vy, yaw rate, height) streamed straight through
+    cf.commander from a fixed-rate thread, instead of MotionCommander.
+
+    It has the part of the MotionCommander interface the scripts use
+    (take_off, land, start_linear_motion, start_forward, ..., stop, and the
+    context manager), so it can replace it. A new command is sent right away
+    from the caller's thread, so a reaction (eg. to an obstacle) reaches the
+    drone without waiting for the next period; the streaming thread then
+    keeps repeating it every 1/rate s on absolute deadlines (no drift) and
+    moves the height target for vertical velocities. How late every send was
+    against its deadline is kept for jitter() (a send later than a whole
+    period skips ahead and counts as missed).
+    '''
+
+    def __init__(self, crazyflie, default_height=0.3, rate=50.0, history=1000):
+        # SyncCrazyflie or Crazyflie, as for MotionCommander
+        self.cf = getattr(crazyflie, 'cf', crazyflie)
+        self.default_height = default_height
+        self.rate = rate
+        # (vx, vy, yaw rate) and (vz, height goal or None), each replaced as a whole
+        self.velocity = (0.0, 0.0, 0.0)
+        self.vertical = (0.0, None)
+        self.z = 0.0
+        self.lateness = deque(maxlen=history)
+        self.sent = 0
+        self.missed = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.take_off()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.land()
+
+    def take_off(self, height=None, velocity=0.2):
+        '''
+        Start streaming and climb to height (m) at velocity (m/s), blocks until there
+        '''
+        height = self.default_height if height is None else height
+        self.z = 0.0
+        self.velocity = (0.0, 0.0, 0.0)
+        self.vertical = (velocity, height)
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='setpoint-streamer', daemon=True)
+            self._thread.start()
+        time.sleep(height / velocity)
+        self.default_height = height
+
+    def land(self, velocity=0.2):
+        '''
+        Descend at velocity (m/s), stop the motors and the streaming thread
+        '''
+        self.velocity = (0.0, 0.0, 0.0)
+        self.vertical = (velocity, 0.0)
+        time.sleep(self.z / velocity)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.cf.commander.send_stop_setpoint()
+
+    def start_linear_motion(self, velocity_x_m, velocity_y_m, velocity_z_m, rate_yaw=0.0):
+        '''
+        Velocity (m/s, body frame) and yaw rate (deg/s) until the next command, sent now
+        '''
+        self.velocity = (velocity_x_m, velocity_y_m, rate_yaw)
+        self.vertical = (velocity_z_m, None) if velocity_z_m != 0.0 else (0.0, self.z)
+        self.send()
+
+    def stop(self):
+        self.start_linear_motion(0.0, 0.0, 0.0)
+
+    def start_forward(self, velocity=0.2):
+        self.start_linear_motion(velocity, 0.0, 0.0)
+
+    def start_back(self, velocity=0.2):
+        self.start_linear_motion(-velocity, 0.0, 0.0)
+
+    def start_left(self, velocity=0.2):
+        self.start_linear_motion(0.0, velocity, 0.0)
+
+    def start_right(self, velocity=0.2):
+        self.start_linear_motion(0.0, -velocity, 0.0)
+
+    def start_turn_left(self, rate=72.0):
+        # yaw rate positive counterclockwise (to the left), as MotionCommander sends it
+        self.start_linear_motion(0.0, 0.0, 0.0, rate)
+
+    def start_turn_right(self, rate=72.0):
+        self.start_linear_motion(0.0, 0.0, 0.0, -rate)
+
+    def send(self):
+        vx, vy, yaw_rate = self.velocity
+        self.cf.commander.send_hover_setpoint(vx, vy, yaw_rate, self.z)
+
+    def _run(self):
+        period = 1.0 / self.rate
+        deadline = time.perf_counter()
+        while not self._stop.is_set():
+            deadline += period
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            now = time.perf_counter()
+            # measured before the send, time spent inside send_hover_setpoint shows up in the next one
+            self.lateness.append(now - deadline)
+            if now - deadline > period:
+                # too late for this slot, start counting from now
+                self.missed += int((now - deadline) / period)
+                deadline = now
+            vz, goal = self.vertical
+            if goal is None:
+                self.z = max(self.z + vz * period, 0.0)
+            elif self.z != goal:
+                step = abs(vz) * period
+                self.z = min(self.z + step, goal) if self.z < goal else max(self.z - step, goal)
+            self.send()
+            self.sent += 1
+
+    def jitter(self):
+        '''
+        Send statistics: rate, setpoints sent, missed periods and how late the
+        recent sends were against their deadlines (ms). Lateness is taken
+        when the send starts, so the time spent inside send_hover_setpoint
+        is not part of it (it only delays the following sends)
+        '''
+        lateness = 1000 * np.array(list(self.lateness))
+        if not len(lateness):
+            lateness = np.zeros(1)
+        return {'rate (Hz)': self.rate, 'sent': self.sent, 'missed': self.missed,
+                'mean late (ms)': float(lateness.mean()), 'p99 late (ms)': float(np.percentile(lateness, 99)),
+                'max late (ms)': float(lateness.max())}
+
+    def report(self):
+        stats = self.jitter()
+        return 'Setpoints at {:.0f} Hz: {} sent, {} missed periods, started late by {:.2f} ms on average, {:.2f} ms p99, {:.2f} ms max (time inside the send excluded)'.format(
+            stats['rate (Hz)'], stats['sent'], stats['missed'], stats['mean late (ms)'], stats['p99 late (ms)'], stats['max late (ms)'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the send jitter of the setpoint streamer (without a drone)')
+    parser.add_argument('-r', '--rate', type=float, nargs='+', default=[20.0, 50.0, 100.0, 200.0], help='Rates to try (Hz)')
+    parser.add_argument('-t', '--time', type=float, default=3.0, help='Seconds per rate')
+    args = parser.parse_args()
+
+    class NoCommander:
+        # stands in for cf.commander, so only the scheduling is measured
+        def send_hover_setpoint(self, vx, vy, yawrate, zdistance):
+            pass
+
+        def send_stop_setpoint(self):
+            pass
+
+    class NoCrazyflie:
+        commander = NoCommander()
+
+    for rate in args.rate:
+        streamer = SetpointStreamer(NoCrazyflie(), default_height=0.05, rate=rate)
+        streamer.take_off(velocity=0.05 / args.time)
+        print(streamer.report())
+        streamer.land(velocity=1.0)
@@ -0,0 +1,155 @@
+import argparse
+import numpy as np
+
+
+def read_pos_log(datafile):
+    '''
+    Read a position log as written by controller.py (t, x, y, z, checking_flatness).
+    Returns (t, x, y, z, checking_flatness) arrays
+    '''
+    data = np.genfromtxt(datafile, delimiter=',', dtype=None, encoding=None, usecols=(0, 1, 2, 3, 4))
+    return (np.asarray(data['f0'], dtype=np.int64), np.asarray(data['f1'], dtype=float), np.asarray(data['f2'], dtype=float),
+            np.asarray(data['f3'], dtype=float), np.asarray(data['f4']).astype(str) == 'True')
+
+
+class SpatialIndex:
+    '''
+    Uniform grid index over the x-y positions of flight samples.
+
+    Samples are sorted by grid cell once; only occupied cells are stored (sorted
+    cell keys + start offsets), so memory scales with the flown area and not with
+    the bounding box. Radius, box and k-nearest queries only look at the cells
+    that can contain matches and return indices into the original arrays, in
+    increasing order (ie. in time order for a single log). Per-sample attributes
+    (eg. t, z, flight number) can be stored alongside and are saved with the index.
+    '''
+
+    def __init__(self, x, y, cell_size=0.05, **values):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.values = {name: np.asarray(v) for name, v in values.items()}
+        self.cell_size = float(cell_size)
+        if len(self.x):
+            self.x0, self.y0 = np.min(self.x), np.min(self.y)
+            self.nx = int(np.floor((np.max(self.x) - self.x0) / self.cell_size)) + 1
+            self.ny = int(np.floor((np.max(self.y) - self.y0) / self.cell_size)) + 1
+        else:
+            self.x0, self.y0, self.nx, self.ny = 0.0, 0.0, 1, 1
+        cells = self._cell_ids(self._ix(self.x), self._iy(self.y))
+        self.order = np.argsort(cells, kind='stable')
+        self.keys, self.starts = np.unique(cells[self.order], return_index=True)
+        self.ends = np.r_[self.starts[1:], len(self.order)]
+
+    @classmethod
+    def from_logs(cls, datafiles, cell_size=0.05):
+        '''
+        Build one index over several position logs. The flight number (position in
+        datafiles), t, z and checking_flatness of each sample are stored as values.
+        '''
+        logs = [read_pos_log(datafile) for datafile in datafiles]
+        return cls(np.concatenate([log[1] for log in logs]), np.concatenate([log[2] for log in logs]), cell_size=cell_size,
+                   t=np.concatenate([log[0] for log in logs]), z=np.concatenate([log[3] for log in logs]),
+                   checking_flatness=np.concatenate([log[4] for log in logs]),
+                   flight=np.concatenate([np.full(len(log[0]), i) for i, log in enumerate(logs)]))
+
+    def _ix(self, x):
+        return np.floor((np.asarray(x) - self.x0) / self.cell_size).astype(np.int64)
+
+    def _iy(self, y):
+        return np.floor((np.asarray(y) - self.y0) / self.cell_size).astype(np.int64)
+
+    def _cell_ids(self, ix, iy):
+        return iy * self.nx + ix
+
+    def _candidates(self, ix0, ix1, iy0, iy1):
+        '''
+        Indices of all samples in the cells [ix0, ix1] x [iy0, iy1]
+        '''
+        ix0, ix1 = max(ix0, 0), min(ix1, self.nx - 1)
+        iy0, iy1 = max(iy0, 0), min(iy1, self.ny - 1)
+        if ix0 > ix1 or iy0 > iy1 or len(self.keys) == 0:
+            return np.zeros(0, dtype=np.int64)
+        cells = self._cell_ids(np.arange(ix0, ix1 + 1)[None, :], np.arange(iy0, iy1 + 1)[:, None]).ravel()
+        pos = np.searchsorted(self.keys, cells)
+        found = pos < len(self.keys)
+        found[found] = self.keys[pos[found]] == cells[found]
+        pos = pos[found]
+        lengths = self.ends[pos] - self.starts[pos]
+        # concatenate the ranges [start, end) of every occupied cell without a python loop
+        offsets = np.repeat(self.starts[pos] - np.r_[0, np.cumsum(lengths)[:-1]], lengths)
+        return self.order[offsets + np.arange(np.sum(lengths))]
+
+    def box(self, left, right, bottom, top):
+        '''
+        Indices of the samples with left <= x <= right and bottom <= y <= top
+        '''
+        idx = self._candidates(int(self._ix(left)), int(self._ix(right)), int(self._iy(bottom)), int(self._iy(top)))
+        x, y = self.x[idx], self.y[idx]
+        return np.sort(idx[(x >= left) & (x <= right) & (y >= bottom) & (y <= top)])
+
+    def radius(self, cx, cy, r):
+        '''
+        Indices of the samples within distance r of (cx, cy)
+        '''
+        idx = self._candidates(int(self._ix(cx - r)), int(self._ix(cx + r)), int(self._iy(cy - r)), int(self._iy(cy + r)))
+        return np.sort(idx[(self.x[idx] - cx)**2 + (self.y[idx] - cy)**2 <= r * r])
+
+    def nearest(self, cx, cy, k=1):
+        '''
+        Indices of the k samples closest to (cx, cy), closest first
+        '''
+        k = min(k, len(self.x))
+        if k == 0:
+            return np.zeros(0, dtype=np.int64)
+        ix, iy = int(self._ix(cx)), int(self._iy(cy))
+        ring = 0
+        while True:
+            idx = self._candidates(ix - ring, ix + ring, iy - ring, iy + ring)
+            covers_all = ix - ring <= 0 and iy - ring <= 0 and ix + ring >= self.nx - 1 and iy + ring >= self.ny - 1
+            if len(idx) >= k:
+                dist = (self.x[idx] - cx)**2 + (self.y[idx] - cy)**2
+                closest = np.argpartition(dist, k - 1)[:k]
+                closest = closest[np.argsort(dist[closest], kind='stable')]
+                # every sample closer than ring cells around the query cell has been seen
+                if covers_all or np.sqrt(dist[closest[-1]]) <= ring * self.cell_size:
+                    return idx[closest]
+            elif covers_all:
+                return idx
+            ring += 1
+
+    def save(self, filename):
+        '''
+        Save the index (and its values) to a .npz file
+        '''
+        np.savez(filename, x=self.x, y=self.y, cell_size=self.cell_size, x0=self.x0, y0=self.y0, nx=self.nx, ny=self.ny,
+                 order=self.order, keys=self.keys, starts=self.starts,
+                 **{'value_' + name: v for name, v in self.values.items()})
+
+    @classmethod
+    def load(cls, filename):
+        '''
+        Load an index saved with save(), without rebuilding it
+        '''
+        data = np.load(filename)
+        index = cls.__new__(cls)
+        index.x, index.y = data['x'], data['y']
+        index.cell_size = float(data['cell_size'])
+        index.x0, index.y0 = float(data['x0']), float(data['y0'])
+        index.nx, index.ny = int(data['nx']), int(data['ny'])
+        index.order, index.keys, index.starts = data['order'], data['keys'], data['starts']
+        index.ends = np.r_[index.starts[1:], len(index.order)]
+        index.values = {name[len('value_'):]: data[name] for name in data.files if name.startswith('value_')}
+        return index
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a spatial index over position logs')
+    parser.add_argument('datafiles', type=str, nargs='+', help='Position logs (t,x,y,z,checking_flatness)')
+    parser.add_argument('-c', '--cell_size', type=float, default=0.05, help='Grid cell size (m)')
+    parser.add_argument('-o', '--output', type=str, default='../data/spatial-index.npz', help='Output index file (.npz)')
+    args = parser.parse_args()
+
+    index = SpatialIndex.from_logs(args.datafiles, cell_size=args.cell_size)
+    index.save(args.output)
+    print('Indexed {} samples from {} logs in {} cells'.format(len(index.x), len(args.datafiles), len(index.keys)))
+    print('Saved {}'.format(args.output))
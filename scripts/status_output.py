@@ -0,0 +1,104 @@
+import sys
+import threading
+import time
+from collections import deque
+
+
+class StatusOutput:
+    '''
+    Console output that never blocks the caller.
+
+    post() only appends to a bounded deque or replaces the latest message of
+    a key, under a lock held for a few dict and counter operations (the
+    keyed messages and the dropped count are read-modify-write, and posted
+    from several threads), so it is safe (and cheap) to call from the cflib
+    receive thread. A separate thread writes the messages out every
+    interval seconds: plain messages in order, identical consecutive ones as
+    one line with their count, at most max_lines per interval (the rest wait
+    for the next interval; only messages pushed out of a full queue are
+    dropped, and counted), and keyed messages (eg. the vbat print at every
+    sample) coalesced to the latest one, at most once per key_interval
+    seconds, with the number of lines it stands for. A slow terminal only
+    delays the output thread.
+    '''
+
+    def __init__(self, interval=0.1, key_interval=1.0, max_lines=20, max_queue=1000, stream=None):
+        self.interval = interval
+        self.key_interval = key_interval
+        self.max_lines = max_lines
+        self.stream = stream
+        self.queue = deque(maxlen=max_queue)
+        # key -> (pending message, number of posts it stands for); key -> time of the last write
+        self.latest = {}
+        self.written = {}
+        self.dropped = 0
+        # guards latest and dropped between the posting threads and flush()
+        self._lock = threading.Lock()
+        # first message of the next flush, popped when max_lines was reached
+        self.held = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def post(self, message, key=None):
+        '''
+        Queue a message, or replace the pending message of key
+        '''
+        with self._lock:
+            if key is None:
+                if len(self.queue) == self.queue.maxlen:
+                    self.dropped += 1
+                self.queue.append(message)
+            else:
+                pending = self.latest.get(key)
+                self.latest[key] = (message, pending[1] + 1 if pending is not None else 1)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='status-output', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        '''
+        Write out whatever is pending and stop the output thread
+        '''
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush(limit=False)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self, limit=True):
+        stream = self.stream if self.stream is not None else sys.stdout
+        # [message, count] of the plain messages, anything past max_lines stays queued for the next flush
+        plain = []
+        while self.held is not None or self.queue:
+            # popped before looking at it: peeking could race with post() pushing the oldest out of a full queue
+            if self.held is not None:
+                message, self.held = self.held, None
+            else:
+                message = self.queue.popleft()
+            if plain and message == plain[-1][0]:
+                plain[-1][1] += 1
+            elif limit and len(plain) == self.max_lines:
+                self.held = message
+                break
+            else:
+                plain.append([message, 1])
+        lines = [message if count == 1 else '{} (x{})'.format(message, count) for message, count in plain]
+        now = time.monotonic()
+        with self._lock:
+            keyed = [(key, self.latest.pop(key)) for key in list(self.latest)
+                     if not limit or now - self.written.get(key, -float('inf')) >= self.key_interval]
+            dropped, self.dropped = self.dropped, 0
+        for key, (message, count) in keyed:
+            self.written[key] = now
+            lines.append(message if count == 1 else '{} (+{} more)'.format(message, count - 1))
+        if dropped:
+            lines.append('[{} status lines dropped]'.format(dropped))
+        if lines:
+            stream.write('\n'.join(lines) + '\n')
+            stream.flush()
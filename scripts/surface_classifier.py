@@ -0,0 +1,157 @@
+import argparse
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from catalog import Catalog
+from interval_index import runs
+
+
+sample_rate = 100           # Hz, position log rate
+window = 50                 # z samples per classification (0.5 s at the position log rate)
+# spectral energy bands (Hz) of the detrended z window
+bands = [(0, 2), (2, 5), (5, 12), (12, 25), (25, 51)]
+model_file = '../data/surface-classifier.npz'
+
+
+def features(windows, sample_rate=sample_rate, bands=bands):
+    '''
+    Features of every row of windows (n_windows x window z samples, m), all at
+    once: log10 of the variance of the linearly detrended z, of the variance
+    of its first difference and of its energy in each band (Hann window)
+    '''
+    windows = np.atleast_2d(np.asarray(windows, dtype=float))
+    n = windows.shape[1]
+    t = np.arange(n) - (n - 1) / 2
+    # slow height changes (climbing, the estimator settling) are not the surface
+    detrended = windows - windows.mean(axis=1, keepdims=True)
+    detrended -= np.outer(detrended @ t / (t @ t), t)
+    spectrum = np.abs(np.fft.rfft(detrended * np.hanning(n), axis=1))**2
+    freqs = np.fft.rfftfreq(n, 1 / sample_rate)
+    columns = [detrended.var(axis=1), np.diff(detrended, axis=1).var(axis=1)]
+    columns += [spectrum[:, (freqs >= low) & (freqs < high)].sum(axis=1) for low, high in bands]
+    return np.log10(np.column_stack(columns) + 1e-12)
+
+
+def flatness_windows(filename, window=window, step=1):
+    '''
+    Windows of z over the flatness checks (checking_flatness) of a position log
+    '''
+    pos = np.genfromtxt(filename, delimiter=',', dtype=None, encoding=None)
+    checking = pos['f4'].astype(str) == 'True'
+    checks = [pos['f3'][start:end] for start, end in zip(*runs(checking)) if end - start >= window]
+    if not checks:
+        return np.zeros((0, window))
+    return np.concatenate([sliding_window_view(z, window)[::step] for z in checks])
+
+
+class SurfaceClassifier:
+    '''
+    Surface type from a short window of z: linear discriminant analysis on
+    the standardized features(), ie. one Gaussian per surface sharing a
+    covariance matrix, so classifying is a matrix product.
+
+    Trained on the labeled flatness checks (pos_flat/grass/gravel/tiles.csv),
+    it tells flat ground from the rest almost perfectly from half a second of
+    samples; grass is mostly recognized, gravel and tiles get confused with
+    each other.
+    '''
+
+    def __init__(self, labels, mean, scale, weights, bias, window=window, sample_rate=sample_rate):
+        self.labels = list(labels)
+        self.mean, self.scale = mean, scale
+        self.weights, self.bias = weights, bias
+        self.window = int(window)
+        self.sample_rate = float(sample_rate)
+
+    @classmethod
+    def fit(cls, X, y, labels, window=window, sample_rate=sample_rate, shrinkage=1e-3):
+        '''
+        Fit on features X (n x features) with labels y (indices into labels)
+        '''
+        X, y = np.asarray(X), np.asarray(y)
+        mean, scale = X.mean(axis=0), X.std(axis=0)
+        Xs = (X - mean) / scale
+        means = np.array([Xs[y == k].mean(axis=0) for k in range(len(labels))])
+        residuals = Xs - means[y]
+        cov = residuals.T @ residuals / (len(y) - len(labels)) + shrinkage * np.eye(X.shape[1])
+        weights = np.linalg.solve(cov, means.T).T
+        bias = -0.5 * np.sum(weights * means, axis=1) + np.log(np.bincount(y, minlength=len(labels)) / len(y))
+        return cls(labels, mean, scale, weights, bias, window, sample_rate)
+
+    def probabilities(self, X):
+        '''
+        Posterior probability of every surface (n x labels) for features X
+        '''
+        scores = ((np.atleast_2d(X) - self.mean) / self.scale) @ self.weights.T + self.bias
+        scores -= scores.max(axis=1, keepdims=True)
+        p = np.exp(scores)
+        return p / p.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        return np.array(self.labels)[np.argmax(self.probabilities(X), axis=1)]
+
+    def classify(self, z):
+        '''
+        (surface, probability) of the latest window of z samples (m)
+        '''
+        p = self.probabilities(features(np.asarray(z)[-self.window:], self.sample_rate))[0]
+        best = int(np.argmax(p))
+        return self.labels[best], float(p[best])
+
+    def probability(self, z, surfaces):
+        '''
+        Probability that the latest window of z samples (m) is over any of surfaces
+        '''
+        p = self.probabilities(features(np.asarray(z)[-self.window:], self.sample_rate))[0]
+        return float(sum(p[self.labels.index(surface)] for surface in surfaces if surface in self.labels))
+
+    def save(self, filename):
+        np.savez(filename, labels=np.array(self.labels), mean=self.mean, scale=self.scale, weights=self.weights,
+                 bias=self.bias, window=self.window, sample_rate=self.sample_rate)
+
+    @classmethod
+    def load(cls, filename):
+        data = np.load(filename)
+        return cls(data['labels'].tolist(), data['mean'], data['scale'], data['weights'], data['bias'],
+                   int(data['window']), float(data['sample_rate']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train the surface classifier on the labeled flatness checks and report its accuracy')
+    parser.add_argument('-d', '--datadir', type=str, default='../data/', help='Data directory')
+    parser.add_argument('-w', '--window', type=int, nargs='+', default=[window], help='Window sizes (samples) to evaluate; the first one is saved')
+    parser.add_argument('--holdout', type=float, default=0.4, help='Last fraction of every training log kept for testing')
+    parser.add_argument('--step', type=int, default=8, help='Samples between evaluated windows')
+    parser.add_argument('-o', '--output', type=str, default=model_file, help='Trained model')
+    args = parser.parse_args()
+
+    catalog = Catalog(args.datadir)
+    training = catalog.find(experiment='flatness-check', kind='pos', variant=None).dropna(subset=['surface'])
+    # other flights over the same surfaces (eg. pos_grass_full.csv), only for testing
+    testing = catalog.find(experiment='flatness-check', kind='pos').dropna(subset=['surface', 'variant'])
+    labels = sorted(training['surface'])
+    for size in args.window:
+        print('Window of {} samples ({:.2f} s)'.format(size, size / sample_rate))
+        train_X, train_y, tests, everything = [], [], [], []
+        for path, surface in zip(training['path'], training['surface']):
+            windows = flatness_windows(args.datadir + path, size)
+            split = int(len(windows) * (1 - args.holdout))
+            # no overlap between training and test windows
+            train_X.append(features(windows[:max(split - size, 0)]))
+            train_y.append(np.full(len(train_X[-1]), labels.index(surface)))
+            tests.append(('{} (last {:.0%})'.format(surface, args.holdout), surface, windows[split::args.step]))
+            everything.append((features(windows), labels.index(surface)))
+        for path, surface in zip(testing['path'], testing['surface']):
+            tests.append((path.split('/')[-1], surface, flatness_windows(args.datadir + path, size, args.step)))
+        model = SurfaceClassifier.fit(np.concatenate(train_X), np.concatenate(train_y), labels, window=size)
+        print('  {:28s} {:>8s} {:>9s}   predicted as {}'.format('test set', 'accuracy', 'flat/not', ' '.join(labels)))
+        for name, surface, windows in tests:
+            predicted = model.predict(features(windows))
+            counts = [int(np.sum(predicted == label)) for label in labels]
+            print('  {:28s} {:8.2f} {:9.2f}   {}'.format(name, np.mean(predicted == surface),
+                                                        np.mean((predicted == 'flat') == (surface == 'flat')), counts))
+        if size == args.window[0]:
+            # the saved model is trained on all of the labeled logs
+            model = SurfaceClassifier.fit(np.concatenate([X for X, _ in everything]),
+                                          np.concatenate([np.full(len(X), k) for X, k in everything]), labels, window=size)
+            model.save(args.output)
+            print('Saved {}'.format(args.output))
@@ -0,0 +1,203 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd  # to write csv, more convenient than csv module
+from scipy.signal import lfilter
+from rolling_stats import rolling_mean_std
+
+
+# recorded logs the statistics are learned from
+surface_logs = {'flat': 'flatness-check/pos_flat.csv', 'grass': 'flatness-check/pos_grass.csv',
+                'gravel': 'flatness-check/pos_gravel.csv', 'tiles': 'flatness-check/pos_tiles.csv'}
+pos_log = 'flatness-check/pos.csv'
+range_log = 'flatness-check/range.csv'  # data/range.csv was recorded without the multiranger deck
+intensity_log = 'flatness-check/intensity.csv'
+discharge_logs = ['discharging/vbat_h_n-1.csv', 'discharging/vbat_h_n-2.csv']
+thrust_log = 'thrust.csv'
+
+# flight behaviour of the synthetic drone
+flight_speed = 0.2          # m/s, typical forward_vel / strafe_vel
+velocity_correlation = 2.0  # s, how long the velocity direction persists
+flatness_interval = 60      # s between flatness checks
+flatness_duration = 8       # s, a square of 0.4 m at 0.2 m/s
+range_max = 4000            # mm, multiranger limit
+
+
+def ar1_fit(values):
+    '''
+    Mean, standard deviation and lag-1 autocorrelation of values
+    '''
+    values = np.asarray(values, dtype=float)
+    residual = values - np.mean(values)
+    phi = np.sum(residual[1:] * residual[:-1]) / np.sum(residual * residual) if np.any(residual) else 0.0
+    return float(np.mean(values)), float(np.std(values)), float(np.clip(phi, 0.0, 0.9999))
+
+
+def learn_statistics(datadir='../data/'):
+    '''
+    Basic statistics of the recorded logs: sample periods (ms), z noise per
+    surface type, intensity and range distributions, battery discharge shape
+    and hover thrust
+    '''
+    stats = {}
+    # position: sample period, hover height and z noise (around a 1 s rolling mean) per surface
+    pos = np.loadtxt(datadir + pos_log, delimiter=',', usecols=(0, 3))
+    stats['pos_period'] = float(np.median(np.diff(pos[:,0])))
+    stats['z'] = {}
+    for surface, fname in surface_logs.items():
+        z = np.loadtxt(datadir + fname, delimiter=',', usecols=3)
+        means, _ = rolling_mean_std(z, [int(1000 / stats['pos_period'])])
+        residual = (z - means[0])[~np.isnan(means[0])]
+        _, std, phi = ar1_fit(residual)
+        stats['z'][surface] = (float(np.mean(z)), std, phi)
+    # light intensity: log-normal with lag-1 correlation
+    intensity = np.loadtxt(datadir + intensity_log, delimiter=',')
+    stats['intensity_period'] = float(np.median(np.diff(intensity[:,0])))
+    stats['intensity'] = ar1_fit(np.log(np.maximum(intensity[:,1], 1.0)))
+    # multiranger: log-normal with lag-1 correlation per direction, plus the fraction of dropouts (0)
+    ranges = np.loadtxt(datadir + range_log, delimiter=',')
+    stats['range_period'] = float(np.median(np.diff(ranges[:,0])))
+    stats['range'] = tuple(float(f) for f in np.mean([ar1_fit(np.log(direction[direction > 0])) for direction in ranges[:,1:].T], axis=0))
+    stats['range_dropout'] = float(np.mean(ranges[:,1:] == 0))
+    # battery: discharge shape against normalized flight time, averaged over the hover flights
+    coeffs, durations, residuals, periods = [], [], [], []
+    for fname in discharge_logs:
+        vbat = np.loadtxt(datadir + fname, delimiter=',')
+        phase = (vbat[:,0] - vbat[0,0]) / (vbat[-1,0] - vbat[0,0])
+        c = np.polyfit(phase, vbat[:,1], 3)
+        coeffs.append(c)
+        durations.append((vbat[-1,0] - vbat[0,0]) / 1000)
+        residuals.append(vbat[:,1] - np.polyval(c, phase))
+        periods.append(np.median(np.diff(vbat[:,0])))
+    stats['vbat_period'] = float(np.median(periods))
+    stats['vbat_shape'] = [float(c) for c in np.mean(coeffs, axis=0)]
+    stats['vbat_duration'] = float(np.mean(durations))
+    stats['vbat_noise'] = float(np.std(np.concatenate(residuals)))
+    # thrust
+    thrust = np.loadtxt(datadir + thrust_log, delimiter=',')
+    stats['thrust_period'] = float(np.median(np.diff(thrust[:,0])))
+    stats['thrust'] = (float(np.mean(thrust[:,1])), float(np.std(thrust[:,1])))
+    return stats
+
+
+class FlightGenerator:
+    '''
+    Streams a synthetic flight chunk by chunk. Every signal is an AR(1)
+    process (filtered with the state carried over between chunks), so a
+    flight of any length can be produced in constant memory.
+    '''
+
+    def __init__(self, stats, surface='flat', seed=None, start_time=15000):
+        self.stats = stats
+        self.surface = surface
+        self.rng = np.random.default_rng(seed)
+        self.start_time = start_time
+        self.time = start_time  # ms, start of the next chunk
+        self.state = {'z': 0.0, 'vx': 0.0, 'vy': 0.0, 'intensity': 0.0, 'range': np.zeros(4)}
+        self.x, self.y = 0.0, 0.0
+        # sample phases, so that streams with long periods don't restart at every chunk
+        self.next_sample = {name: start_time for name in ['pos', 'range', 'intensity', 'vbat', 'thrust']}
+
+    def _timestamps(self, name, end):
+        period = self.stats[name + '_period']
+        t = np.arange(self.next_sample[name], end, period).astype(np.int64)
+        if len(t):
+            self.next_sample[name] = t[-1] + period
+        return t
+
+    def _ar1(self, key, n, phi, std, size=None):
+        '''
+        n samples of a zero mean AR(1) process continuing from self.state[key]
+        '''
+        shape = (n,) if size is None else (n, size)
+        if n == 0:
+            return np.zeros(shape)
+        innovations = self.rng.normal(0.0, std * np.sqrt(1 - phi**2), shape)
+        state = np.asarray(self.state[key], dtype=float)
+        out, _ = lfilter([1.0], [1.0, -phi], innovations, axis=0, zi=(phi * state).reshape((1,) + state.shape))
+        self.state[key] = out[-1]
+        return out
+
+    def chunk(self, seconds):
+        '''
+        The next seconds of flight as a dict of DataFrames laid out like the
+        controller's logs (pos, range, intensity, vbat, thrust)
+        '''
+        stats = self.stats
+        end = self.time + seconds * 1000
+        chunk = {}
+        # position: smooth random walk in x-y, surface dependent noise on z
+        t = self._timestamps('pos', end)
+        dt = stats['pos_period'] / 1000
+        phi_v = np.exp(-dt / velocity_correlation)
+        vx = self._ar1('vx', len(t), phi_v, flight_speed)
+        vy = self._ar1('vy', len(t), phi_v, flight_speed)
+        x = self.x + np.cumsum(vx) * dt
+        y = self.y + np.cumsum(vy) * dt
+        if len(t):
+            self.x, self.y = x[-1], y[-1]
+        z_mean, z_std, z_phi = stats['z'][self.surface]
+        z = z_mean + self._ar1('z', len(t), z_phi, z_std)
+        checking_flatness = ((t - self.start_time) / 1000) % flatness_interval >= flatness_interval - flatness_duration
+        chunk['pos'] = pd.DataFrame({'t': t, 'x': x, 'y': y, 'z': z, 'checking_flatness': checking_flatness})
+        # multiranger (left, front, right, back) with dropouts
+        t = self._timestamps('range', end)
+        r_mean, r_std, r_phi = stats['range']
+        ranges = np.minimum(np.exp(r_mean + self._ar1('range', len(t), r_phi, r_std, size=4)), range_max)
+        ranges[self.rng.random(ranges.shape) < stats['range_dropout']] = 0.0
+        chunk['range'] = pd.DataFrame({'t': t, 'left': ranges[:,0], 'front': ranges[:,1], 'right': ranges[:,2], 'back': ranges[:,3]})
+        # light intensity
+        t = self._timestamps('intensity', end)
+        i_mean, i_std, i_phi = stats['intensity']
+        chunk['intensity'] = pd.DataFrame({'t': t, 'intensity': np.exp(i_mean + self._ar1('intensity', len(t), i_phi, i_std))})
+        # battery: discharge shape, recharged (duty cycled) at the end of every discharge
+        t = self._timestamps('vbat', end)
+        phase = (((t - self.start_time) / 1000) % stats['vbat_duration']) / stats['vbat_duration']
+        chunk['vbat'] = pd.DataFrame({'t': t, 'vbat': np.polyval(stats['vbat_shape'], phase) + self.rng.normal(0, stats['vbat_noise'], len(t))})
+        # thrust
+        t = self._timestamps('thrust', end)
+        chunk['thrust'] = pd.DataFrame({'t': t, 'thrust': stats['thrust'][0] + self.rng.normal(0, stats['thrust'][1], len(t))})
+        self.time = end
+        return chunk
+
+    def chunks(self, duration, chunk_seconds=60):
+        '''
+        Yield chunks until duration (s) of flight has been generated
+        '''
+        remaining = duration
+        while remaining > 0:
+            seconds = min(chunk_seconds, remaining)
+            yield self.chunk(seconds)
+            remaining -= seconds
+
+
+def write_flight(outdir, generator, duration, chunk_seconds=60):
+    '''
+    Write a synthetic flight to outdir as pos.csv, range.csv, intensity.csv,
+    vbat.csv and thrust.csv (same format as controller.py), chunk by chunk
+    '''
+    names = ['pos', 'range', 'intensity', 'vbat', 'thrust']
+    file_handlers = {name: open(os.path.join(outdir, name + '.csv'), 'w') for name in names}
+    try:
+        for chunk in generator.chunks(duration, chunk_seconds):
+            for name in names:
+                chunk[name].to_csv(file_handlers[name], header=False, index=False, float_format='%.9g')
+    finally:
+        for file_handler in file_handlers.values():
+            file_handler.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate arbitrarily long synthetic flights with the statistics of the recorded logs')
+    parser.add_argument('-d', '--duration', type=float, default=3600, help='Flight duration (s)')
+    parser.add_argument('-s', '--surface', type=str, default='flat', choices=list(surface_logs), help='Surface type for the z noise')
+    parser.add_argument('-o', '--outdir', type=str, default='.', help='Directory to write the logs to')
+    parser.add_argument('-c', '--chunk', type=float, default=60, help='Seconds of flight generated (and held in memory) at a time')
+    parser.add_argument('--seed', type=int, help='Random seed')
+    parser.add_argument('--datadir', type=str, default='../data/', help='Directory with the recorded logs')
+    args = parser.parse_args()
+
+    stats = learn_statistics(args.datadir)
+    os.makedirs(args.outdir, exist_ok=True)
+    write_flight(args.outdir, FlightGenerator(stats, surface=args.surface, seed=args.seed), args.duration, args.chunk)
+    print('Saved a {} s synthetic flight over {} to {}'.format(args.duration, args.surface, args.outdir))
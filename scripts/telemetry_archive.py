@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import struct
+import time
+import zlib
+import numpy as np
+import pandas as pd  # to read csv, more convenient than csv module
+
+
+magic = b'CFTA'
+version = 1
+chunk_rows = 4096           # rows per independently compressed chunk
+
+# Layout of the controller logs: columns after the timestamp (ms) and their
+# precision (None: True/False flag). Values are stored as integer multiples of
+# the precision, so that is the resolution kept in the archive.
+streams = {'pos': [('x', 1e-4), ('y', 1e-4), ('z', 1e-4), ('checking_flatness', None)],
+           'range': [('left', 1.0), ('front', 1.0), ('right', 1.0), ('back', 1.0)],
+           'intensity': [('intensity', 1e-2)],
+           'vbat': [('vbat', 1e-4)],
+           'thrust': [('thrust', 1.0)]}
+# logs kept verbatim (compressed text)
+text_logs = ['phase', 'events', 'clock']
+
+
+def decimals(precision):
+    return max(int(round(-np.log10(precision))), 1)
+
+
+def read_csv_log(filename, columns):
+    '''
+    Integer columns of a log: timestamps and values quantized to their precision
+    '''
+    if os.path.getsize(filename) == 0:
+        return np.zeros((len(columns) + 1, 0), dtype=np.int64)
+    data = pd.read_csv(filename, header=None)
+    out = [data[0].to_numpy(dtype=np.int64)]
+    for i, (_, precision) in enumerate(columns):
+        values = data[i + 1]
+        if precision is None:
+            out.append((values.astype(str) == 'True').to_numpy(dtype=np.int64))
+        else:
+            out.append(np.round(values.to_numpy(dtype=float) / precision).astype(np.int64))
+    return np.array(out)
+
+
+def encode_column(values):
+    '''
+    Delta encoding in the narrowest integer type, bytes shuffled (all the low
+    bytes first, ...) so that slowly changing values compress well
+    '''
+    deltas = np.diff(values, prepend=0)
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        info = np.iinfo(dtype)
+        if deltas.min(initial=0) >= info.min and deltas.max(initial=0) <= info.max:
+            break
+    narrow = deltas.astype(dtype)
+    shuffled = narrow.view(np.uint8).reshape(-1, narrow.itemsize).T.tobytes()
+    return np.dtype(dtype).str, shuffled
+
+
+def decode_column(buf, dtype, rows):
+    dtype = np.dtype(dtype)
+    narrow = np.frombuffer(buf, dtype=np.uint8).reshape(dtype.itemsize, rows).T.copy().view(dtype).ravel()
+    return np.cumsum(narrow, dtype=np.int64)
+
+
+def encode_chunk(table):
+    '''
+    One compressed chunk of an integer table (columns x rows)
+    '''
+    dtypes, parts = [], []
+    for column in table:
+        dtype, buf = encode_column(column)
+        dtypes.append(dtype)
+        parts.append(buf)
+    return dtypes, zlib.compress(b''.join(parts), 6)
+
+
+def decode_chunk(blob, dtypes, rows):
+    buf = zlib.decompress(blob)
+    columns, offset = [], 0
+    for dtype in dtypes:
+        size = np.dtype(dtype).itemsize * rows
+        columns.append(decode_column(buf[offset:offset + size], dtype, rows))
+        offset += size
+    return np.array(columns).reshape(len(dtypes), rows)
+
+
+def pack(datadir, filename, chunk_rows=chunk_rows):
+    '''
+    Archive the logs found in datadir (pos.csv, range.csv, ...) to filename
+    '''
+    header = {'version': version, 'streams': {}, 'text': {}}
+    blobs, offset = [], 0
+    for name, columns in streams.items():
+        csv_file = os.path.join(datadir, name + '.csv')
+        if not os.path.isfile(csv_file):
+            continue
+        table = read_csv_log(csv_file, columns)
+        chunks = []
+        for start in range(0, table.shape[1], chunk_rows):
+            dtypes, blob = encode_chunk(table[:, start:start + chunk_rows])
+            chunks.append({'rows': min(chunk_rows, table.shape[1] - start), 'offset': offset, 'size': len(blob), 'dtypes': dtypes})
+            blobs.append(blob)
+            offset += len(blob)
+        header['streams'][name] = {'columns': [c for c, _ in columns], 'precisions': [p for _, p in columns], 'chunks': chunks}
+    for name in text_logs:
+        text_file = os.path.join(datadir, name + '.csv')
+        if not os.path.isfile(text_file):
+            continue
+        with open(text_file, 'rb') as filehandler:
+            blob = zlib.compress(filehandler.read(), 9)
+        header['text'][name] = {'offset': offset, 'size': len(blob)}
+        blobs.append(blob)
+        offset += len(blob)
+    header_bytes = json.dumps(header).encode()
+    with open(filename, 'wb') as filehandler:
+        filehandler.write(magic + struct.pack('<HI', version, len(header_bytes)))
+        filehandler.write(header_bytes)
+        for blob in blobs:
+            filehandler.write(blob)
+
+
+def read_header(filehandler):
+    start = filehandler.read(len(magic) + 6)
+    if start[:len(magic)] != magic:
+        raise ValueError('Not a telemetry archive')
+    file_version, header_size = struct.unpack('<HI', start[len(magic):])
+    if file_version > version:
+        raise ValueError('Archive version {} is newer than this reader ({})'.format(file_version, version))
+    header = json.loads(filehandler.read(header_size).decode())
+    return header, filehandler.tell()
+
+
+def load(filename, names=None):
+    '''
+    {stream: {'t': timestamps (ms), column: values}} of the archived logs
+    (all of them, or only names), plus the text logs as strings
+    '''
+    data = {}
+    with open(filename, 'rb') as filehandler:
+        header, data_start = read_header(filehandler)
+        for name, stream in header['streams'].items():
+            if names is not None and name not in names:
+                continue
+            tables = []
+            for chunk in stream['chunks']:
+                filehandler.seek(data_start + chunk['offset'])
+                tables.append(decode_chunk(filehandler.read(chunk['size']), chunk['dtypes'], chunk['rows']))
+            table = np.concatenate(tables, axis=1) if tables else np.zeros((len(stream['columns']) + 1, 0), dtype=np.int64)
+            data[name] = {'t': table[0]}
+            for column, precision, values in zip(stream['columns'], stream['precisions'], table[1:]):
+                data[name][column] = values.astype(bool) if precision is None else values * precision
+        for name, text in header['text'].items():
+            if names is not None and name not in names:
+                continue
+            filehandler.seek(data_start + text['offset'])
+            data[name] = zlib.decompress(filehandler.read(text['size'])).decode()
+    return data
+
+
+def unpack(filename, outdir):
+    '''
+    Write the archived logs back to outdir in the controller's csv layout
+    '''
+    with open(filename, 'rb') as filehandler:
+        header, _ = read_header(filehandler)
+    data = load(filename)
+    for name, stream in data.items():
+        with open(os.path.join(outdir, name + '.csv'), 'w') as filehandler:
+            if isinstance(stream, str):
+                filehandler.write(stream)
+                continue
+            precisions = header['streams'][name]['precisions']
+            formats = ['{}'] + ['{}' if p is None else '{:.%df}' % decimals(p) for p in precisions]
+            line = ','.join(formats) + '\n'
+            columns = [stream['t'].tolist()] + [stream[c].tolist() for c in header['streams'][name]['columns']]
+            filehandler.writelines(line.format(*row) for row in zip(*columns))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack flight logs into a compressed archive or unpack it back to csv')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    pack_parser = subparsers.add_parser('pack', help='Archive the logs of a directory')
+    pack_parser.add_argument('datadir', type=str, help='Directory with pos.csv, range.csv, intensity.csv, vbat.csv, thrust.csv, phase.csv')
+    pack_parser.add_argument('-o', '--output', type=str, default='flight.cfta', help='Archive to write')
+    pack_parser.add_argument('-c', '--chunk_rows', type=int, default=chunk_rows, help='Rows per compressed chunk')
+    unpack_parser = subparsers.add_parser('unpack', help='Write the logs of an archive back as csv')
+    unpack_parser.add_argument('archive', type=str)
+    unpack_parser.add_argument('-o', '--outdir', type=str, default='.', help='Directory to write the csv files to')
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        pack(args.datadir, args.output, args.chunk_rows)
+        csv_size = sum(os.path.getsize(os.path.join(args.datadir, name + '.csv')) for name in list(streams) + text_logs
+                       if os.path.isfile(os.path.join(args.datadir, name + '.csv')))
+        archive_size = os.path.getsize(args.output)
+        start = time.perf_counter()
+        load(args.output)
+        print('Saved {}: {} bytes of csv -> {} bytes ({:.1f}x), loads in {:.1f} ms'.format(
+            args.output, csv_size, archive_size, csv_size / archive_size, 1000 * (time.perf_counter() - start)))
+    else:
+        os.makedirs(args.outdir, exist_ok=True)
+        unpack(args.archive, args.outdir)
+        print('Unpacked {} to {}'.format(args.archive, args.outdir))
@@ -0,0 +1,91 @@
+import time
+from collections import deque
+import numpy as np
+import pygame
+
+
+# colors (same as the controller window and the plots)
+background = (50, 55, 60)
+foreground = (255, 255, 255)
+gauge_color = (31, 119, 180)    # default_blue
+warn_color = (255, 127, 14)     # default_orange
+track_color = (80, 85, 90)
+
+
+class TelemetryOverlay:
+    '''
+    Live telemetry panel drawn inside the controller's pygame window.
+
+    channels is a list of (label, unit, fmt, vmin, vmax, warn_below, style) tuples,
+    style being 'gauge' (bar between vmin and vmax) or 'sparkline' (recent history,
+    autoscaled if vmin/vmax are None). snapshot is a callable returning the current
+    value of every channel, in the same order. It is only called from update(), at
+    most fps times per second, so the logging callbacks never do any extra work and
+    the control loop only pays for a time check between frames. Only the rows whose
+    values changed are redrawn and pushed to the display (dirty rects).
+    '''
+
+    def __init__(self, screen, channels, snapshot, rect, fps=10, history=100, font=None):
+        self.screen = screen
+        self.channels = channels
+        self.snapshot = snapshot
+        self.rect = pygame.Rect(rect)
+        self.frame_period = 1.0 / fps
+        self.last_frame = 0.0
+        self.font = font if font is not None else pygame.font.SysFont('hack', 14)
+        self.row_height = self.rect.height // len(channels)
+        self.histories = [deque(maxlen=history) for _ in channels]
+        self.last_values = [None] * len(channels)
+
+    def _row_rect(self, i):
+        return pygame.Rect(self.rect.left, self.rect.top + i * self.row_height, self.rect.width, self.row_height)
+
+    def _draw_row(self, i, value):
+        label, unit, fmt, vmin, vmax, warn_below, style = self.channels[i]
+        row = self._row_rect(i)
+        self.screen.fill(background, row)
+        color = warn_color if warn_below is not None and value < warn_below else foreground
+        history = self.histories[i]
+        text = '{}: '.format(label) + fmt.format(value)
+        if style == 'sparkline' and len(history) > 1:
+            # show the spread over the visible history too (for z this is the flatness)
+            text += ' +- ' + fmt.format(np.std(history))
+        text += ' ' + unit
+        self.screen.blit(self.font.render(text, True, color), (row.left, row.top + 2))
+        # right half of the row is the gauge / sparkline
+        area = pygame.Rect(row.left + row.width // 2, row.top + 3, row.width // 2 - 2, row.height - 6)
+        if style == 'gauge':
+            pygame.draw.rect(self.screen, track_color, area)
+            fraction = min(max((value - vmin) / (vmax - vmin), 0.0), 1.0)
+            pygame.draw.rect(self.screen, color if color == warn_color else gauge_color, (area.left, area.top, int(area.width * fraction), area.height))
+        elif style == 'sparkline' and len(history) > 1:
+            values = np.asarray(history, dtype=float)
+            lo = vmin if vmin is not None else np.min(values)
+            hi = vmax if vmax is not None else np.max(values)
+            span = hi - lo if hi > lo else 1.0
+            xs = area.left + np.arange(len(values)) * (area.width - 1) / (history.maxlen - 1)
+            ys = area.bottom - 1 - np.clip((values - lo) / span, 0, 1) * (area.height - 1)
+            pygame.draw.lines(self.screen, gauge_color, False, list(zip(xs.astype(int), ys.astype(int))))
+        return row
+
+    def update(self, now=None):
+        '''
+        Redraw the panel if a frame is due. Cheap to call on every loop iteration.
+        Returns the list of rects pushed to the display.
+        '''
+        if now is None:
+            now = time.monotonic()
+        if now - self.last_frame < self.frame_period:
+            return []
+        self.last_frame = now
+        dirty = []
+        for i, value in enumerate(self.snapshot()):
+            history = self.histories[i]
+            history.append(value)
+            # Sparklines scroll every frame, gauges only change with their value
+            if value != self.last_values[i] or (self.channels[i][-1] == 'sparkline' and len(history) > 1):
+                dirty.append(self._draw_row(i, value))
+                self.last_values[i] = value
+        if dirty:
+            pygame.display.update(dirty)
+        return dirty
@@ -0,0 +1,208 @@
+import argparse
+import json
+import struct
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+
+magic = b'CFRING1\0'
+line = 64                   # bytes, every stream starts on its own cache line
+# Streams of the controller: fields after the timestamp (ms), as in the csv logs
+streams = {'pos': ('x', 'y', 'z', 'checking_flatness'),
+           'range': ('left', 'front', 'right', 'back'),
+           'intensity': ('intensity',),
+           'vbat': ('vbat',),
+           'thrust': ('thrust',)}
+
+
+def aligned(offset):
+    return -(-offset // line) * line
+
+
+class RingStream:
+    '''
+    One stream of the ring: a head counter and capacity rows of float64
+    (sequence number, timestamp, fields), all views into the shared memory.
+
+    publish() is for the single writer (the logging callback of the stream):
+    it fills the row at head % capacity, stamps it with its sequence number
+    and only then advances head. Readers never lock: since() hands out views
+    of the rows published after a sequence number, and a row is intact as
+    long as its first column still holds the expected sequence number (the
+    writer may lap a reader that is more than capacity rows behind).
+    '''
+
+    def __init__(self, buf, offset, fields, capacity):
+        self.fields = ('timestamp',) + tuple(fields)
+        self.capacity = capacity
+        self._head = np.ndarray((1,), dtype=np.int64, buffer=buf, offset=offset)
+        self.rows = np.ndarray((capacity, 1 + len(self.fields)), dtype=np.float64, buffer=buf, offset=offset + line)
+        self.nbytes = line + self.rows.nbytes
+
+    def publish(self, *values):
+        '''
+        Append a sample (timestamp, one value per field). Writer only.
+        '''
+        head = int(self._head[0])
+        row = self.rows[head % self.capacity]
+        row[0] = -1  # readers of the previous sample in this slot see it is gone
+        row[1:] = values
+        row[0] = head
+        self._head[0] = head + 1
+
+    @property
+    def head(self):
+        '''
+        Number of samples published so far
+        '''
+        return int(self._head[0])
+
+    def since(self, seq):
+        '''
+        (head, views, lost): the rows published after the first seq samples,
+        oldest first, as one or two (first seq, view) pairs (the ring may
+        wrap), and how many of them were already overwritten. Nothing is copied.
+        '''
+        head = self.head
+        start = max(seq, head - self.capacity)
+        first, last = start % self.capacity, head % self.capacity
+        if start == head:
+            views = []
+        elif first < last:
+            views = [(start, self.rows[first:last])]
+        else:
+            views = [(start, self.rows[first:]), (start + self.capacity - first, self.rows[:last])]
+        return head, views, start - seq
+
+    def intact(self, view, first_seq):
+        '''
+        Mask of the rows of a view from since(), starting at sequence number
+        first_seq, that were not overwritten since; check it after using the rows
+        '''
+        return view[:, 0] == first_seq + np.arange(len(view))
+
+    def latest(self, out=None):
+        '''
+        Copy of the latest row (seq, timestamp, fields), None before the first sample
+        '''
+        while True:
+            head = self.head
+            if head == 0:
+                return None
+            row = self.rows[(head - 1) % self.capacity]
+            if out is None:
+                out = np.empty_like(row)
+            np.copyto(out, row)
+            if out[0] == head - 1:
+                return out
+
+
+class TelemetryRing:
+    '''
+    Shared-memory ring buffers of the live telemetry, so dashboards, recorders
+    and analyzers run in their own processes (and cores) instead of sharing
+    the controller's GIL with the cflib threads.
+
+    The controller creates the ring (create=True) and its logging callbacks
+    publish every sample into their stream; other local processes attach by
+    name and read the same memory through NumPy views. The layout (streams,
+    fields, capacity) is a JSON header at the start of the block, so readers
+    only need the name.
+    '''
+
+    def __init__(self, name, streams=streams, capacity=4096, create=False):
+        if create:
+            header = json.dumps({'streams': {stream: list(fields) for stream, fields in streams.items()}, 'capacity': capacity}).encode()
+            size = aligned(len(magic) + 4 + len(header)) + sum(line + 8 * capacity * (2 + len(fields)) for fields in streams.values())
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+            self.shm.buf[:len(magic)] = magic
+            self.shm.buf[len(magic):len(magic) + 4] = struct.pack('<I', len(header))
+            self.shm.buf[len(magic) + 4:len(magic) + 4 + len(header)] = header
+        else:
+            try:
+                self.shm = shared_memory.SharedMemory(name, track=False)
+            except TypeError:
+                # before python 3.13 the resource tracker would unlink the ring when a reader exits
+                self.shm = shared_memory.SharedMemory(name)
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+            if bytes(self.shm.buf[:len(magic)]) != magic:
+                raise ValueError('{} is not a telemetry ring'.format(name))
+            length, = struct.unpack('<I', self.shm.buf[len(magic):len(magic) + 4])
+            header = bytes(self.shm.buf[len(magic) + 4:len(magic) + 4 + length])
+            layout = json.loads(header)
+            streams, capacity = layout['streams'], layout['capacity']
+        self.name = name
+        self.owner = create
+        self.capacity = capacity
+        self.streams = {}
+        offset = aligned(len(magic) + 4 + len(header))
+        for stream, fields in streams.items():
+            self.streams[stream] = RingStream(self.shm.buf, offset, fields, capacity)
+            offset += self.streams[stream].nbytes
+
+    def __getitem__(self, stream):
+        return self.streams[stream]
+
+    def close(self):
+        '''
+        Detach (and remove the ring if this process created it)
+        '''
+        # the views must go before the memory can be released
+        self.streams = {}
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def replay(ring, flight, speed=1.0):
+    '''
+    Publish the logs of a recorded flight (see batch_analysis.load_flight) in
+    real time, eg. to try consumers without a drone
+    '''
+    from batch_analysis import load_flight
+    data = load_flight(flight)
+    samples = sorted((t, stream, i) for stream in data if stream in ring.streams for i, t in enumerate(data[stream]['t']))
+    start, t0 = time.monotonic(), samples[0][0]
+    for t, stream, i in samples:
+        delay = (t - t0) / 1000 / speed - (time.monotonic() - start)
+        if delay > 0:
+            time.sleep(delay)
+        ring[stream].publish(t, *[float(data[stream][field][i]) for field in ring[stream].fields[1:]])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Watch the live telemetry ring of the controller (or fill it from a recorded flight)')
+    parser.add_argument('-n', '--name', type=str, default='crazyflie-telemetry', help='Name of the ring')
+    parser.add_argument('-r', '--replay', type=str, help='Create the ring and replay this flight (directory, pos log or .cfta) into it')
+    parser.add_argument('-s', '--speed', type=float, default=1.0, help='Replay speed')
+    parser.add_argument('-i', '--interval', type=float, default=1.0, help='Seconds between monitor lines')
+    args = parser.parse_args()
+
+    if args.replay:
+        ring = TelemetryRing(args.name, create=True)
+        print('Replaying {} into {}'.format(args.replay, args.name))
+        try:
+            replay(ring, args.replay, args.speed)
+        except KeyboardInterrupt:
+            pass
+        ring.close()
+    else:
+        ring = TelemetryRing(args.name)
+        seen = {stream: ring[stream].head for stream in ring.streams}
+        try:
+            while True:
+                time.sleep(args.interval)
+                status = []
+                for stream, ring_stream in ring.streams.items():
+                    head, views, lost = ring_stream.since(seen[stream])
+                    latest = ring_stream.latest()
+                    values = ' '.join('{}={:.4g}'.format(f, v) for f, v in zip(ring_stream.fields, latest[1:])) if latest is not None else '-'
+                    status.append('{} {:.0f} Hz{} [{}]'.format(stream, (head - seen[stream]) / args.interval,
+                                                               ' ({} lost)'.format(lost) if lost else '', values))
+                    seen[stream] = head
+                print(' | '.join(status))
+        except KeyboardInterrupt:
+            pass
+        ring.close()
@@ -0,0 +1,186 @@
+import argparse
+import numpy as np
+
+
+# kinds of flatness-check trajectories
+kinds = ['square', 'circle', 'spiral', 'lawnmower']
+
+
+def square_path(area, n_points):
+    '''
+    Square perimeter centered on the current point, from the front left corner
+    clockwise back to it
+    '''
+    half = np.sqrt(area) / 2
+    corners = np.array([[half, half], [half, -half], [-half, -half], [-half, half], [half, half]])
+    per_side = max(n_points // 4, 2)
+    return np.concatenate([np.linspace(a, b, per_side, endpoint=False) for a, b in zip(corners[:-1], corners[1:])] + [corners[-1:]])
+
+
+def circle_path(area, n_points):
+    '''
+    Circle of the given area centered on the current point, from straight ahead
+    counterclockwise back to it
+    '''
+    r = np.sqrt(area / np.pi)
+    theta = np.linspace(0, 2*np.pi, n_points)
+    return np.column_stack([r*np.cos(theta), r*np.sin(theta)])
+
+
+def spiral_path(area, n_points, spacing=None):
+    '''
+    Archimedean spiral from the current point out to the radius of a circle of
+    the given area, with spacing between turns (default: 3 turns)
+    '''
+    r_max = np.sqrt(area / np.pi)
+    if spacing is None:
+        spacing = r_max / 3
+    theta_max = 2*np.pi * r_max / spacing
+    # uniform in arc length, roughly, so the points don't bunch up in the center
+    theta = theta_max * np.sqrt(np.linspace(0, 1, n_points))
+    r = spacing * theta / (2*np.pi)
+    return np.column_stack([r*np.cos(theta), r*np.sin(theta)])
+
+
+def lawnmower_path(area, n_points, spacing=None):
+    '''
+    Back and forth lanes over a square of the given area centered on the current
+    point, from its back left corner, joined by half circles (default: 4 lanes)
+    '''
+    side = np.sqrt(area)
+    if spacing is None:
+        spacing = side / 3
+    n_lanes = int(np.floor(side / spacing + 1e-9)) + 1
+    lane_points = max(n_points // (2*n_lanes), 2)
+    turn = np.linspace(0, np.pi, lane_points)
+    parts = []
+    for lane in range(n_lanes):
+        x = np.linspace(-side/2, side/2, lane_points) if lane % 2 == 0 else np.linspace(side/2, -side/2, lane_points)
+        parts.append(np.column_stack([x, np.full(lane_points, side/2 - lane*spacing)]))
+        if lane < n_lanes - 1:
+            # half circle to the next lane, bulging out of the square in x
+            sign = 1 if lane % 2 == 0 else -1
+            cx, cy = sign*side/2, side/2 - (lane + 0.5)*spacing
+            parts.append(np.column_stack([cx + sign*spacing/2*np.sin(turn), cy + spacing/2*np.cos(turn)])[1:-1])
+    return np.concatenate(parts)
+
+
+paths = {'square': square_path, 'circle': circle_path, 'spiral': spiral_path, 'lawnmower': lawnmower_path}
+
+
+class Trajectory:
+    '''
+    Continuous flatness-check path with a smooth velocity profile.
+
+    The path covers area (m^2) centered on the current position, with straight
+    legs out to its start and back from its end so that the drone lands where
+    the check was asked for (the area around it is the one measured), and the
+    cruise speed is chosen so that flying it collects at least samples z
+    samples at sample_rate (Hz, the position log rate), up to max_vel. The
+    speed along the path is limited by max_acc, both along the path (ramps
+    from and to hover) and across it (v^2 * curvature, so the corners of the
+    square are flown stop-and-go as before while the other paths never stop).
+    velocity(t) gives the setpoint t seconds after the start, positions are
+    relative to the start (x forward, y left, as MotionCommander).
+    '''
+
+    def __init__(self, kind='circle', area=0.16, samples=400, sample_rate=100, max_vel=0.5, max_acc=0.5,
+                 spacing=None, n_points=2000):
+        if kind not in paths:
+            raise ValueError('Unknown trajectory {}, expected one of {}'.format(kind, kinds))
+        self.kind = kind
+        self.area = area
+        self.sample_rate = sample_rate
+        if kind in ('spiral', 'lawnmower'):
+            self.points = paths[kind](area, n_points, spacing)
+        else:
+            self.points = paths[kind](area, n_points)
+        # out from and back to the current point
+        origin = np.zeros((1, 2))
+        self.points = np.concatenate([origin, self.points, origin])
+        steps = np.diff(self.points, axis=0)
+        ds = np.hypot(steps[:,0], steps[:,1])
+        keep = ds > 1e-9
+        self.points = np.concatenate([self.points[:1], self.points[1:][keep]])
+        steps, ds = steps[keep], ds[keep]
+        self.s = np.concatenate([[0.0], np.cumsum(ds)])
+        self.length = self.s[-1]
+        self.directions = steps / ds[:,None]
+        # cruise speed: enough time on the path for the requested samples
+        self.cruise_vel = min(max_vel, self.length * sample_rate / samples)
+        # speed limit per point from the curvature (turning angle / arc length)
+        heading = np.unwrap(np.arctan2(self.directions[:,1], self.directions[:,0]))
+        turning = np.abs(np.diff(heading))
+        curvature = np.zeros(len(self.s))
+        curvature[1:-1] = turning / ((ds[:-1] + ds[1:]) / 2)
+        with np.errstate(divide='ignore'):
+            v_limit = np.minimum(self.cruise_vel, np.sqrt(max_acc / curvature))
+        v_limit[0] = v_limit[-1] = 0.0  # start and end in hover
+        # acceleration limits along the path: v^2 <= v_j^2 + 2 a |s - s_j| for every point j, both ways
+        v2 = v_limit**2
+        forward = 2*max_acc*self.s + np.minimum.accumulate(v2 - 2*max_acc*self.s)
+        backward = -2*max_acc*self.s + np.minimum.accumulate((v2 + 2*max_acc*self.s)[::-1])[::-1]
+        self.v = np.sqrt(np.maximum(np.minimum(v2, np.minimum(forward, backward)), 0.0))
+        # time along the path (trapezoidal in speed)
+        v_mean = np.maximum((self.v[:-1] + self.v[1:]) / 2, 1e-6)
+        self.t = np.concatenate([[0.0], np.cumsum(ds / v_mean)])
+        self.duration = self.t[-1]
+
+    @property
+    def expected_samples(self):
+        return self.duration * self.sample_rate
+
+    def samples_per_second(self, overhead):
+        '''
+        z samples collected per second of flight, with overhead (s) of flight
+        spent before or after the trajectory without measuring (settling etc.).
+        The trajectory measures all along, so without overhead this is just
+        the sample rate
+        '''
+        return self.expected_samples / (self.duration + overhead)
+
+    def velocity(self, t):
+        '''
+        (vx, vy) setpoint t seconds after the start, None once the path is flown
+        '''
+        if t >= self.duration:
+            return None
+        i = min(np.searchsorted(self.t, t, side='right') - 1, len(self.directions) - 1)
+        speed = np.interp(t, self.t, self.v)
+        return float(speed*self.directions[i,0]), float(speed*self.directions[i,1])
+
+    def position(self, t):
+        '''
+        (x, y) of the path t seconds after the start
+        '''
+        s = np.interp(t, self.t, self.s)
+        return float(np.interp(s, self.s, self.points[:,0])), float(np.interp(s, self.s, self.points[:,1]))
+
+
+def square_check_time(square_side, forward_vel, strafe_vel, pauses=3, pause_time=1.0):
+    '''
+    Seconds of flight and seconds measuring of the original stop-and-go square
+    check: half a side left and back to the corner, the square, back to the center
+    '''
+    measuring = 2*square_side/forward_vel + 2*square_side/strafe_vel
+    transit = square_side/2/strafe_vel + square_side/2/strafe_vel + square_side/2/forward_vel + square_side/2/strafe_vel
+    return transit + measuring + pauses*pause_time, measuring
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare flatness-check trajectories')
+    parser.add_argument('-a', '--area', type=float, default=0.16, help='Area to cover (m^2)')
+    parser.add_argument('-n', '--samples', type=int, default=400, help='z samples to collect')
+    parser.add_argument('-r', '--rate', type=float, default=100, help='Position log rate (Hz)')
+    parser.add_argument('-v', '--max_vel', type=float, default=0.5, help='Maximum speed (m/s)')
+    parser.add_argument('--max_acc', type=float, default=0.5, help='Maximum acceleration (m/s^2)')
+    parser.add_argument('--settle', type=float, default=0.3, help='Hover before the trajectory (s)')
+    args = parser.parse_args()
+
+    total, measuring = square_check_time(np.sqrt(args.area), 0.2, 0.2)
+    print('{:>16}: {:6.2f} s, {:5.0f} samples, {:5.1f} samples/s of flight'.format('square (0.2 m/s)', total, measuring*args.rate, measuring*args.rate/total))
+    for kind in kinds:
+        trajectory = Trajectory(kind, args.area, args.samples, args.rate, args.max_vel, args.max_acc)
+        print('{:>16}: {:6.2f} s, {:5.0f} samples, {:5.1f} samples/s of flight ({:.2f} m at up to {:.2f} m/s)'.format(
+            kind, trajectory.duration + args.settle, trajectory.expected_samples, trajectory.samples_per_second(args.settle),
+            trajectory.length, trajectory.cruise_vel))